@@ -0,0 +1,628 @@
+import asyncio
+import collections
+import datetime
+import functools
+import json
+import os
+import secrets
+import time
+
+import asyncpg
+from aiohttp import web
+from psycopg2.extensions import parse_dsn
+
+import audit
+import db
+import employee_directory
+import migrations
+import notifications
+import queries
+import search
+import session
+from main import validate_registration
+
+API_HOST = "127.0.0.1"
+API_PORT = int(os.environ.get("FRUIT_SHOP_API_PORT", 8080))
+API_POOL_MIN = int(os.environ.get("FRUIT_SHOP_API_POOL_MIN", 2))
+API_POOL_MAX = int(os.environ.get("FRUIT_SHOP_API_POOL_MAX", 20))
+REQUEST_TIMEOUT = float(os.environ.get("FRUIT_SHOP_API_REQUEST_TIMEOUT", 10))
+SESSION_IDLE_TIMEOUT = float(os.environ.get("FRUIT_SHOP_API_SESSION_IDLE_TIMEOUT", 3600))
+SESSIONS_MAX = int(os.environ.get("FRUIT_SHOP_API_SESSIONS_MAX", 10000))
+SHUTDOWN_TIMEOUT = 15
+PAGE_LIMIT_MAX = 100
+
+
+def connect_kwargs():
+    # asyncpg не разбирает keyword-DSN libpq, поэтому переводим его в параметры
+    params = parse_dsn(db.load_config()["dsn"])
+    names = {"dbname": "database", "host": "host", "port": "port", "user": "user", "password": "password"}
+    kwargs = {names[key]: value for key, value in params.items() if key in names}
+    if "port" in kwargs:
+        kwargs["port"] = int(kwargs["port"])
+    return kwargs
+
+
+def to_json(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def json_response(data, status=200):
+    return web.json_response(data, status=status, dumps=lambda obj: json.dumps(obj, default=to_json, ensure_ascii=False))
+
+
+def error_response(status, message):
+    return json_response({"error": message}, status=status)
+
+
+async def read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise ValueError("Тело запроса должно быть JSON-объектом.")
+    if not isinstance(body, dict):
+        raise ValueError("Тело запроса должно быть JSON-объектом.")
+    return body
+
+
+def required(body, key):
+    value = body.get(key)
+    if value is None or value == "":
+        raise ValueError(f"Не задано поле {key}.")
+    return value
+
+
+def integer(value, key):
+    # int() от null, списка или объекта - TypeError, то есть ошибка сервера; неверное поле - ошибка клиента
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Поле {key} должно быть целым числом.")
+
+
+def number(value, key):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Поле {key} должно быть числом.")
+
+
+def object_list(body, key):
+    value = body.get(key, [])
+    if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+        raise ValueError(f"Поле {key} должно быть списком объектов.")
+    return value
+
+
+async def record_audit(action, user_id=None, **details):
+    # audit.record ждёт, пока в переполненной очереди журнала не освободится место; в обработчике это
+    # остановило бы весь цикл событий, поэтому ожидание переносится в поток
+    if not audit.try_record(action, user_id, **details):
+        await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(audit.record, action, user_id, **details))
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.query.get("limit", 20))
+    except ValueError:
+        raise ValueError("Некорректный limit.")
+    return max(1, min(limit, PAGE_LIMIT_MAX))
+
+
+class Catalog:
+    # Аналог catalog_cache.FruitCatalog для asyncpg: сбрасывается по NOTIFY catalog_changed
+    def __init__(self):
+        self._by_name = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    async def load(self, pool):
+        by_name = self._by_name
+        if by_name is None:
+            async with self._lock:
+                by_name = self._by_name
+                if by_name is None:
+                    generation = self._generation
+                    rows = await pool.fetch(queries.CATALOG)
+                    by_name = {}
+                    for row in rows:
+                        by_name.setdefault(row[1].casefold(), row)
+                    if generation == self._generation:
+                        self._by_name = by_name
+        return by_name
+
+    async def find(self, pool, fruit_name):
+        return (await self.load(pool)).get(fruit_name.casefold())
+
+    async def fruits(self, pool):
+        return list((await self.load(pool)).values())
+
+    def invalidate(self, *args):
+        self._generation += 1
+        self._by_name = None
+
+
+class Sessions:
+    # Токены в памяти процесса: сессия, к которой не обращались idle_timeout секунд, удаляется,
+    # а сверх max_size вытесняется давно не использованная (пользователь входит заново)
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT, max_size=SESSIONS_MAX):
+        self.idle_timeout = idle_timeout
+        self.max_size = max_size
+        self._by_token = collections.OrderedDict()
+
+    def _expire(self, now):
+        while self._by_token:
+            token, (_, last_used) = next(iter(self._by_token.items()))
+            if now - last_used < self.idle_timeout and len(self._by_token) <= self.max_size:
+                return
+            del self._by_token[token]
+
+    def add(self, user_session):
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        self._by_token[token] = (user_session, now)
+        self._expire(now)
+        return token
+
+    def remove(self, token):
+        entry = self._by_token.pop(token, None)
+        return entry[0] if entry else None
+
+    def get(self, token):
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._by_token.get(token)
+        if entry is None:
+            return None
+        self._by_token[token] = (entry[0], now)
+        self._by_token.move_to_end(token)
+        return entry[0]
+
+    def __len__(self):
+        return len(self._by_token)
+
+    def invalidate(self, user_id=None):
+        for user_session, _ in self._by_token.values():
+            if user_id is None or user_session.user_id == user_id:
+                user_session.stale = True
+
+    async def refresh(self, pool, user_session):
+        # Session.refresh() блокирующий (psycopg2), здесь перечитываем роль через asyncpg
+        if not user_session.stale:
+            return
+        row = await pool.fetchrow(queries.numbered(queries.SESSION_BY_ID), user_session.user_id)
+        user_session.stale = False
+        if row:
+            (_, user_session.first_name, user_session.last_name,
+             user_session.role_id, user_session.client_id, user_session.employee_id) = row
+        else:
+            user_session.role_id = user_session.client_id = user_session.employee_id = None
+
+
+async def listen(app):
+    # Отдельное соединение вне пула: LISTEN живёт, пока соединение открыто
+    backoff = 1
+    while True:
+        try:
+            conn = await asyncpg.connect(**connect_kwargs())
+        except (OSError, asyncpg.PostgresError):
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            continue
+
+        backoff = 1
+        closed = asyncio.Event()
+        conn.add_termination_listener(lambda _: closed.set())
+        try:
+            await conn.add_listener("catalog_changed", app["catalog"].invalidate)
+            await conn.add_listener(
+                "user_role_changed", lambda _conn, _pid, _channel, payload: app["sessions"].invalidate(int(payload)))
+            # Пока соединения не было, уведомления могли потеряться
+            app["catalog"].invalidate()
+            app["sessions"].invalidate()
+            await closed.wait()
+        finally:
+            await conn.close()
+
+
+async def ensure_order_partition(app, day):
+    # Как jobs.ensure_order_partition: отдельный вызов до транзакции заказа, раз в месяц на процесс
+    month = day.replace(day=1)
+    if month not in app["partition_months"]:
+        await app["pool"].fetchval(queries.numbered(queries.CREATE_ORDER_PARTITION), month)
+        app["partition_months"].add(month)
+
+
+async def current_session(request, *role_ids):
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    user_session = request.app["sessions"].get(token)
+    if user_session is None:
+        raise web.HTTPUnauthorized(text=json.dumps({"error": "Необходимо войти в систему."}, ensure_ascii=False),
+                                   content_type="application/json")
+    await request.app["sessions"].refresh(request.app["pool"], user_session)
+    if role_ids and user_session.role_id not in role_ids:
+        raise web.HTTPForbidden(text=json.dumps({"error": "Недостаточно прав."}, ensure_ascii=False),
+                                content_type="application/json")
+    return user_session
+
+
+@web.middleware
+async def errors_middleware(request, handler):
+    try:
+        return await asyncio.wait_for(handler(request), REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        return error_response(504, "Превышено время обработки запроса.")
+    except ValueError as e:
+        return error_response(400, str(e))
+    except asyncpg.PostgresError as e:
+        return error_response(409, e.message if hasattr(e, "message") else str(e))
+
+
+routes = web.RouteTableDef()
+
+
+@routes.get("/fruits")
+async def list_fruits(request):
+    limit = parse_limit(request)
+    after_name = request.query.get("after_name")
+    if after_name is None:
+        rows = await request.app["pool"].fetch(queries.numbered(queries.FRUITS_FIRST_PAGE + " LIMIT %s"), limit)
+    else:
+        after_id = int(request.query.get("after_id", 0))
+        rows = await request.app["pool"].fetch(
+            queries.numbered(queries.FRUITS_NEXT_PAGE + " LIMIT %s"), after_name, after_id, limit)
+    fruits = [{"id": row[0], "name": row[1], "price": row[2], "reviews": row[3],
+               "rating": round(row[4] / row[3], 2) if row[3] else None} for row in rows]
+    result = {"fruits": fruits}
+    if len(rows) == limit:
+        result["next"] = {"after_name": rows[-1][1], "after_id": rows[-1][0]}
+    return json_response(result)
+
+
+@routes.get("/fruits/{name}")
+async def fruit_info(request):
+    fruit = await request.app["catalog"].find(request.app["pool"], request.match_info["name"])
+    if fruit is None:
+        return error_response(404, "Фрукт не найден.")
+    rating = await request.app["pool"].fetchrow(queries.numbered(queries.FRUIT_RATING), fruit[0])
+    return json_response({
+        "id": fruit[0], "name": fruit[1], "creation_date": fruit[2], "price": fruit[3],
+        "expiration_date": fruit[4], "producer": fruit[5], "country": fruit[6],
+        "reviews": rating[0] if rating else 0,
+        "rating": round(rating[1] / rating[0], 2) if rating and rating[0] else None,
+        "histogram": {str(evaluation): rating[evaluation + 1] if rating else 0 for evaluation in range(1, 6)},
+    })
+
+
+@routes.get("/search/fruits")
+async def search_fruits(request):
+    text = request.query.get("q", "").strip()
+    if not text:
+        raise ValueError("Не задан текст поиска.")
+    limit = min(parse_limit(request), search.FUZZY_LIMIT)
+    if request.app["trigram"]:
+        rows = await request.app["pool"].fetch(queries.numbered(queries.FUZZY_FRUITS), text, text,
+                                               search.like_pattern(text), text, limit)
+    else:
+        rows = search.rank_names(text, await request.app["catalog"].fruits(request.app["pool"]), limit)
+    return json_response({"fruits": [
+        {"id": row[0], "name": row[1], "price": row[2], "score": round(row[3], 3)} for row in rows
+    ]})
+
+
+@routes.get("/search/reviews")
+async def search_reviews(request):
+    text = request.query.get("q", "").strip()
+    if not text:
+        raise ValueError("Не задан текст поиска.")
+    first, second = search.review_configs(request.query.get("lang") or None)
+    limit = parse_limit(request)
+    after_rank = request.query.get("after_rank")
+    if after_rank is None:
+        rows = await request.app["pool"].fetch(queries.numbered(queries.REVIEW_SEARCH_FIRST_PAGE + " LIMIT %s"),
+                                               first, text, second, text, limit)
+    else:
+        rows = await request.app["pool"].fetch(
+            queries.numbered(queries.REVIEW_SEARCH_NEXT_PAGE + " LIMIT %s"), first, text, second, text,
+            float(after_rank), int(request.query.get("after_id", 0)), limit)
+    reviews = [{"id": row[0], "fruit": row[1], "text": row[2], "evaluation": row[3], "rank": row[4]} for row in rows]
+    result = {"reviews": reviews}
+    if len(rows) == limit:
+        result["next"] = {"after_rank": rows[-1][4], "after_id": rows[-1][0]}
+    return json_response(result)
+
+
+@routes.get("/fruits/{name}/reviews")
+async def fruit_reviews(request):
+    rows = await request.app["pool"].fetch(queries.numbered(queries.FRUIT_REVIEWS), request.match_info["name"])
+    return json_response({"reviews": [
+        {"id": row[0], "text": row[1], "evaluation": row[2], "client": f"{row[3]} {row[4]}"} for row in rows
+    ]})
+
+
+@routes.post("/fruits/{name}/reviews")
+async def add_review(request):
+    user_session = await current_session(request, session.CLIENT_ROLE_ID)
+    body = await read_json(request)
+    evaluation = integer(body.get("evaluation", 0), "evaluation")
+    async with request.app["pool"].acquire() as conn:
+        fruit_id = await conn.fetchval(queries.numbered(queries.FRUIT_ID_BY_NAME), request.match_info["name"])
+        if fruit_id is None:
+            return error_response(404, "Фрукт не найден.")
+        await conn.execute(queries.numbered(queries.ADD_REVIEW),
+                           str(body.get("text", "")), evaluation, user_session.client_id, fruit_id)
+    await record_audit("review", user_session.user_id, fruit_id=fruit_id, evaluation=evaluation)
+    return json_response({"status": "ok"}, status=201)
+
+
+@routes.get("/employees")
+async def list_employees(request):
+    rows = await request.app["pool"].fetch(queries.numbered(queries.EMPLOYEES))
+    return json_response({"employees": [
+        {"id": row[0], "first_name": row[1], "last_name": row[2], "salary": row[3],
+         "start_work": row[4], "end_work": row[5], "positions": row[6]} for row in rows
+    ]})
+
+
+@routes.post("/employees")
+async def add_employee(request):
+    admin = await current_session(request, session.ADMIN_ROLE_ID)
+    body = await read_json(request)
+    if not isinstance(body.get("positions", []), list):
+        raise ValueError("Поле positions должно быть списком.")
+    positions = [integer(position, "positions") for position in body.get("positions", [])]
+    if not positions:
+        raise ValueError("Необходимо выбрать хотя бы одну позицию.")
+    start_work = datetime.time.fromisoformat(str(required(body, "start_work")))
+    end_work = datetime.time.fromisoformat(str(required(body, "end_work")))
+
+    async with request.app["pool"].acquire() as conn, conn.transaction():
+        user_id = await conn.fetchval(queries.numbered(queries.USER_ID_BY_NAME), str(body.get("user_name", "")))
+        if user_id is None:
+            return error_response(404, "Пользователь с указанным именем не существует.")
+        await conn.execute(queries.numbered(queries.DELETE_CLIENT), user_id)
+        employee_id = await conn.fetchval(queries.numbered(queries.INSERT_EMPLOYEE),
+                                          integer(body.get("salary", 0), "salary"), user_id, start_work, end_work)
+        await conn.execute(queries.numbered(queries.INSERT_EMPLOYEE_POSITIONS), employee_id, positions)
+        await conn.execute(queries.numbered(queries.SET_EMPLOYEE_ROLE), user_id)
+    request.app["sessions"].invalidate(user_id)
+    await record_audit("add_employee", admin.user_id, user_id=user_id, employee_id=employee_id,
+                       role_id=session.EMPLOYEE_ROLE_ID, positions=positions)
+    return json_response({"id": employee_id}, status=201)
+
+
+@routes.post("/register")
+async def register(request):
+    body = await read_json(request)
+    first_name = str(body.get("first_name", ""))
+    last_name = str(body.get("last_name", ""))
+    phone = str(body.get("phone", ""))
+    password = str(body.get("password", ""))
+    validate_registration(first_name, last_name, phone, password)
+
+    async with request.app["pool"].acquire() as conn, conn.transaction():
+        user_id = await conn.fetchval(queries.numbered(queries.INSERT_USER),
+                                      first_name, last_name, phone, password, session.CLIENT_ROLE_ID)
+        client_id = await conn.fetchval(queries.numbered(queries.INSERT_CLIENT), user_id, str(body.get("address", "")))
+    user_session = session.Session(user_id, first_name, last_name, session.CLIENT_ROLE_ID, client_id)
+    await record_audit("register", user_id, client_id=client_id)
+    return json_response({"token": request.app["sessions"].add(user_session)}, status=201)
+
+
+@routes.post("/login")
+async def login(request):
+    body = await read_json(request)
+    row = await request.app["pool"].fetchrow(queries.numbered(queries.SESSION_BY_CREDENTIALS),
+                                             str(body.get("first_name", "")), str(body.get("password", "")))
+    if row is None:
+        await record_audit("login_failed", first_name=str(body.get("first_name", "")))
+        return error_response(401, "Неверный логин или пароль.")
+    user_session = session.Session(*row)
+    await record_audit("login", user_session.user_id)
+    return json_response({"token": request.app["sessions"].add(user_session),
+                          "first_name": user_session.first_name, "last_name": user_session.last_name})
+
+
+@routes.post("/logout")
+async def logout(request):
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    user_session = request.app["sessions"].get(token)
+    if user_session is not None:
+        await record_audit("logout", user_session.user_id)
+    request.app["sessions"].remove(token)
+    return json_response({"status": "ok"})
+
+
+@routes.post("/orders")
+async def place_order(request):
+    user_session = await current_session(request, session.CLIENT_ROLE_ID)
+    body = await read_json(request)
+    quantities = {}
+    for item in object_list(body, "items"):
+        quantity = integer(item.get("quantity", 0), "quantity")
+        if quantity <= 0:
+            raise ValueError("Количество должно быть положительным.")
+        key = str(item.get("name", "")).lower()
+        quantities[key] = quantities.get(key, 0) + quantity
+    if not quantities:
+        raise ValueError("Корзина пуста.")
+
+    today = datetime.date.today()
+    await ensure_order_partition(request.app, today)
+    async with request.app["pool"].acquire() as conn, conn.transaction():
+        fruits = {}
+        for row in await conn.fetch(queries.numbered(queries.CHECKOUT_PRICES), list(quantities)):
+            fruits.setdefault(row[0], tuple(row[1:]))
+        missing = [name for name in quantities if name not in fruits]
+        if missing:
+            raise ValueError(f"Фрукты не найдены: {', '.join(missing)}")
+
+        fruit_ids = [fruits[key][0] for key in quantities]
+        item_quantities = list(quantities.values())
+        total_prices = [fruits[key][2] * quantity for key, quantity in quantities.items()]
+        reserved = {row[0] for row in await conn.fetch(queries.numbered(queries.RESERVE_STOCK),
+                                                        fruit_ids, item_quantities)}
+        if len(reserved) < len(fruit_ids):
+            rows = await conn.fetch(queries.numbered(queries.FRUIT_STOCK_BY_IDS),
+                                    [fruit_id for fruit_id in fruit_ids if fruit_id not in reserved])
+            raise ValueError("Недостаточно на складе: " + ", ".join(f"{row[1]} (осталось {row[2]})" for row in rows))
+        orders = await conn.fetch(queries.numbered(queries.INSERT_ORDERS), today,
+                                  user_session.client_id, fruit_ids, item_quantities, total_prices)
+
+    names = {fruit_id: name for fruit_id, name, _ in fruits.values()}
+    lines = [{"order_id": row[0], "name": names[row[1]], "quantity": row[2], "total_price": row[3]}
+             for row in orders]
+    await record_audit("order", user_session.user_id, orders=[row[0] for row in orders],
+                       total=sum(line["total_price"] for line in lines))
+    return json_response({"orders": lines, "total": sum(line["total_price"] for line in lines)}, status=201)
+
+
+@routes.get("/orders")
+async def order_history(request):
+    user_session = await current_session(request, session.CLIENT_ROLE_ID)
+    client_id = user_session.client_id
+    limit = parse_limit(request)
+    after_date = request.query.get("after_date")
+    # ?archive=1 включает заказы из перенесённых в архив месяцев
+    archive = request.query.get("archive") in ("1", "true")
+    first_page, next_page = ((queries.ARCHIVE_HISTORY_FIRST_PAGE, queries.ARCHIVE_HISTORY_NEXT_PAGE) if archive
+                             else (queries.HISTORY_FIRST_PAGE, queries.HISTORY_NEXT_PAGE))
+    result = {}
+    if after_date is None:
+        summary = await request.app["pool"].fetchrow(queries.numbered(queries.CLIENT_ORDER_SUMMARY), client_id)
+        result["summary"] = {"order_count": summary[0] if summary else 0, "total_spent": summary[1] if summary else 0,
+                             "last_order_date": summary[2] if summary else None}
+        query, params = first_page, (None, client_id, client_id)
+    else:
+        query, params = next_page, (int(request.query.get("after_total", 0)), client_id, client_id,
+                                    datetime.date.fromisoformat(after_date), int(request.query.get("after_id", 0)))
+    async with request.app["pool"].acquire() as conn, conn.transaction():
+        await conn.execute(queries.GENERIC_PLAN)
+        rows = await conn.fetch(queries.numbered(query + " LIMIT %s"), *params, limit)
+    result["orders"] = [{"creation_date": row[0], "delivery_date": row[1], "name": row[2], "total_price": row[3],
+                         "quantity": row[4], "id": row[5], "status": row[6], "days_remaining": row[7],
+                         "running_total": row[8]} for row in rows]
+    if len(rows) == limit:
+        result["next"] = {"after_date": rows[-1][0], "after_id": rows[-1][5], "after_total": rows[-1][8] - rows[-1][3]}
+        if archive:
+            result["next"]["archive"] = 1
+    return json_response(result)
+
+
+@routes.post("/producers")
+async def add_producer(request):
+    user_session = await current_session(request, session.ADMIN_ROLE_ID, session.EMPLOYEE_ROLE_ID)
+    body = await read_json(request)
+    name, country = str(body.get("name", "")), str(body.get("country", ""))
+    await request.app["pool"].execute(queries.numbered(queries.INSERT_PRODUCER), name, country)
+    await record_audit("add_producer", user_session.user_id, name=name, country=country)
+    return json_response({"status": "ok"}, status=201)
+
+
+@routes.post("/fruits")
+async def add_fruit(request):
+    user_session = await current_session(request, session.ADMIN_ROLE_ID, session.EMPLOYEE_ROLE_ID)
+    body = await read_json(request)
+    name = str(body.get("name", ""))
+    price = integer(body.get("price", 0), "price")
+    producer_id = integer(body.get("producer_id", 0), "producer_id")
+    await request.app["pool"].execute(
+        queries.numbered(queries.ADD_FRUIT), name, datetime.date.fromisoformat(str(body.get("creation_date", ""))),
+        price, integer(body.get("expiration_date", 0), "expiration_date"), producer_id)
+    await record_audit("add_fruit", user_session.user_id, name=name, price=price, producer_id=producer_id)
+    return json_response({"status": "ok"}, status=201)
+
+
+@routes.put("/fruits/{name}/price")
+async def update_fruit_price(request):
+    user_session = await current_session(request, session.ADMIN_ROLE_ID)
+    body = await read_json(request)
+    async with request.app["pool"].acquire() as conn:
+        # Фрукт ищется без учёта регистра, как его выбирает RepriceFruits
+        fruit_id = await conn.fetchval(queries.numbered(queries.FRUIT_ID_BY_NAME), request.match_info["name"])
+        if fruit_id is None:
+            return error_response(404, "Фрукт не найден.")
+        rows = await conn.fetch(queries.numbered(queries.REPRICE_FRUITS), number(body.get("percentage", 0), "percentage"),
+                                request.match_info["name"], None, None, None, None, None, True)
+    await record_audit("reprice", user_session.user_id, fruit_id=fruit_id, percentage=body.get("percentage", 0))
+    return json_response({"status": "ok", "changes": [{"name": row[1], "old_price": row[3], "new_price": row[4]}
+                                                      for row in rows]})
+
+
+@routes.put("/fruits/{name}/stock")
+async def update_fruit_stock(request):
+    # {"add": N} - поступление (отрицательное - списание), {"stock": N} - остаток после инвентаризации
+    user_session = await current_session(request, session.ADMIN_ROLE_ID, session.EMPLOYEE_ROLE_ID)
+    body = await read_json(request)
+    name = request.match_info["name"]
+    if body.get("stock") is not None:
+        row = await request.app["pool"].fetchrow(queries.numbered(queries.SET_FRUIT_STOCK), integer(body["stock"], "stock"), name)
+    else:
+        add = integer(body.get("add", 0), "add")
+        row = await request.app["pool"].fetchrow(queries.numbered(queries.ADD_FRUIT_STOCK), add, name, add)
+    if row is None:
+        return error_response(404, "Фрукт не найден или списание больше остатка.")
+    await record_audit("restock", user_session.user_id, name=row[0], add=body.get("add"), stock=row[1])
+    return json_response({"status": "ok", "name": row[0], "stock": row[1]})
+
+
+@routes.delete("/fruits/{name}")
+async def delete_fruit(request):
+    user_session = await current_session(request, session.ADMIN_ROLE_ID, session.EMPLOYEE_ROLE_ID)
+    result = await request.app["pool"].execute(queries.numbered(queries.DELETE_FRUIT), request.match_info["name"])
+    if result == "DELETE 0":
+        return error_response(404, "Фрукт не найден.")
+    await record_audit("delete_fruit", user_session.user_id, name=request.match_info["name"])
+    return json_response({"status": "ok"})
+
+
+@routes.delete("/reviews/low-rated")
+async def delete_low_rated_reviews(request):
+    user_session = await current_session(request, session.ADMIN_ROLE_ID)
+    await request.app["pool"].execute(queries.numbered(queries.DELETE_LOW_RATED_REVIEWS))
+    await record_audit("delete_low_rated_reviews", user_session.user_id)
+    return json_response({"status": "ok"})
+
+
+async def on_startup(app):
+    app["pool"] = await asyncpg.create_pool(min_size=API_POOL_MIN, max_size=API_POOL_MAX, **connect_kwargs())
+    app["trigram"] = await app["pool"].fetchval(queries.numbered(queries.TRIGRAM_INDEX_EXISTS))
+    app["listener"] = asyncio.create_task(listen(app))
+    migrations.warn_pending()
+    # Обновление справочника сотрудников - в потоке с psycopg2, остановка в manage.py
+    employee_directory.start()
+
+
+async def on_cleanup(app):
+    app["listener"].cancel()
+    try:
+        await app["listener"]
+    except asyncio.CancelledError:
+        pass
+    await app["pool"].close()
+    # Как в manage.py: справочник и журнал действий дописывают очереди и останавливаются. stop() блокирующие,
+    # поэтому выполняются в потоке; без этого python api.py терял бы события журнала при остановке
+    loop = asyncio.get_running_loop()
+    for stop in (employee_directory.stop, notifications.stop_listener, audit.stop, db.close_pool):
+        await loop.run_in_executor(None, stop)
+
+
+def create_app():
+    app = web.Application(middlewares=[errors_middleware])
+    app["catalog"] = Catalog()
+    app["sessions"] = Sessions()
+    app["partition_months"] = set()
+    app.add_routes(routes)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def run(port=API_PORT):
+    web.run_app(create_app(), host=API_HOST, port=port, shutdown_timeout=SHUTDOWN_TIMEOUT)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import db
+import queries
+
+
+class AuditLog(threading.Thread):
+    # Журнал действий пользователей. record() только кладёт событие в ограниченную очередь (при переполнении
+    # ждёт - запись в БД отстаёт), поток пишет накопленное одним COPY раз в flush_interval секунд
+    # или как только набралось batch_size событий: на действие не приходится ни одного обращения к БД.
+    # Доставка "хотя бы один раз": неудачный пакет повторяется, при остановке очередь дописывается,
+    # а то, что записать не удалось, сохраняется в spool_path и отправляется при следующем запуске.
+    # Повтор после сбоя во время фиксации может записать событие дважды - дубликаты различимы по Event_Id
+    def __init__(self, flush_interval=1.0, batch_size=500, queue_size=10000, spool_path=None,
+                 retry_backoff=0.5, max_backoff=30):
+        super().__init__(name="audit-log", daemon=True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.spool_path = spool_path
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.written = 0
+        self._queue = queue.Queue(queue_size)
+        self._pending = []
+        self._stopped = threading.Event()
+
+    def _event(self, action, user_id, details):
+        return (str(uuid.uuid4()), datetime.now(timezone.utc).isoformat(), user_id, action,
+                json.dumps(details, ensure_ascii=False, default=str))
+
+    def record(self, action, user_id=None, **details):
+        self._queue.put(self._event(action, user_id, details))
+
+    def try_record(self, action, user_id=None, **details):
+        # Без ожидания: False, если очередь переполнена и событие не принято
+        try:
+            self._queue.put_nowait(self._event(action, user_id, details))
+        except queue.Full:
+            return False
+        return True
+
+    def _fill(self, deadline=None):
+        # Ждёт событий до deadline или пока не наберётся пакет; без deadline забирает только то, что уже есть
+        while len(self._pending) < self.batch_size:
+            try:
+                if deadline is None:
+                    event = self._queue.get_nowait()
+                else:
+                    event = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return
+            if event is None:
+                return
+            self._pending.append(event)
+
+    def _flush(self):
+        batch = self._pending[:self.batch_size]
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        with db.connection() as conn, conn.cursor() as cursor:
+            try:
+                cursor.copy_expert(queries.COPY_AUDIT_LOG, buffer)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        del self._pending[:len(batch)]
+        self.written += len(batch)
+
+    def _load_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        with open(self.spool_path, encoding="utf-8") as spool:
+            self._pending.extend(tuple(json.loads(line)) for line in spool if line.strip())
+        os.remove(self.spool_path)
+
+    def _save_spool(self):
+        if not self.spool_path:
+            print(f"Журнал действий: не записано событий: {len(self._pending)}")
+            return
+        with open(self.spool_path, "a", encoding="utf-8") as spool:
+            for event in self._pending:
+                spool.write(json.dumps(event, ensure_ascii=False) + "\n")
+        print(f"Журнал действий: {len(self._pending)} событий сохранено в {self.spool_path}")
+
+    def run(self):
+        self._load_spool()
+        backoff = self.retry_backoff
+        while not self._stopped.is_set():
+            self._fill(time.monotonic() + self.flush_interval)
+            if not self._pending:
+                continue
+            try:
+                self._flush()
+                backoff = self.retry_backoff
+            except Exception as e:
+                print(f"Журнал действий: ошибка записи, повтор через {backoff:g} с: {e}")
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+        # Остановка: дописать всё, что успели положить в очередь
+        try:
+            while True:
+                self._fill()
+                if not self._pending:
+                    return
+                self._flush()
+        except Exception:
+            while True:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is not None:
+                    self._pending.append(event)
+            self._save_spool()
+
+    def stop(self):
+        self._stopped.set()
+        self._queue.put(None)
+        self.join()
+
+
+_audit_log = None
+_audit_log_lock = threading.Lock()
+
+
+def get_audit_log():
+    global _audit_log
+    if _audit_log is None:
+        with _audit_log_lock:
+            if _audit_log is None:
+                config = db.load_config()
+                _audit_log = AuditLog(config["audit_flush_interval"], config["audit_batch_size"],
+                                      config["audit_queue_size"], config["audit_spool"] or None)
+                _audit_log.start()
+    return _audit_log
+
+
+def record(action, user_id=None, **details):
+    get_audit_log().record(action, user_id, **details)
+
+
+def try_record(action, user_id=None, **details):
+    return get_audit_log().try_record(action, user_id, **details)
+
+
+def stop():
+    global _audit_log
+    with _audit_log_lock:
+        if _audit_log is not None:
+            _audit_log.stop()
+            _audit_log = None
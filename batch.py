@@ -0,0 +1,505 @@
+import datetime
+import getpass
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import psycopg2
+
+import audit
+import db
+import jobs
+import prepared
+import queries
+import search
+import session
+from catalog_cache import catalog
+from main import checkout, validate_registration
+
+DEFAULT_GROUP_SIZE = 100
+DEFAULT_WORKERS = 4
+DEFAULT_LIMIT = 100
+PASSWORD_ENV = "FRUIT_SHOP_BATCH_PASSWORD"
+
+ADMIN_ROLES = (session.ADMIN_ROLE_ID,)
+STAFF_ROLES = (session.ADMIN_ROLE_ID, session.EMPLOYEE_ROLE_ID)
+CLIENT_ROLES = (session.CLIENT_ROLE_ID,)
+
+
+def to_json(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+class Sessions:
+    # Сессии пакета по учётным данным: каждый пользователь проверяется один раз за запуск
+    def __init__(self, default_credentials=None):
+        self.default_credentials = default_credentials
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, credentials):
+        credentials = credentials or self.default_credentials
+        if not credentials:
+            raise PermissionError("Команда требует входа: укажите user или --user.")
+        if not isinstance(credentials, dict):
+            raise ValueError("Поле user должно содержать first_name и password.")
+        key = (str(credentials.get("first_name", "")), str(credentials.get("password", "")))
+        with self._lock:
+            user_session = self._sessions.get(key)
+        # Устаревшая сессия (смена роли) перечитывается через соединение группы:
+        # Session.refresh берёт другое соединение и не видит незафиксированные изменения группы
+        if user_session is None or user_session.stale:
+            user_session = session.authenticate(conn, *key)
+            if user_session is None:
+                raise PermissionError("Неверный логин или пароль.")
+            with self._lock:
+                self._sessions[key] = user_session
+        return user_session
+
+    def add(self, first_name, password, user_session):
+        with self._lock:
+            self._sessions[(first_name, password)] = user_session
+
+
+class Context:
+    def __init__(self, conn, cursor, sessions, command):
+        self.conn = conn
+        self.cursor = cursor
+        self.sessions = sessions
+        self.command = command
+        self.on_commit = []
+
+    def user(self, *roles):
+        user_session = self.sessions.get(self.conn, self.command.get("user"))
+        if user_session.role_id not in roles:
+            raise PermissionError("Недостаточно прав для этой операции.")
+        return user_session
+
+    def record(self, action, user_id=None, **details):
+        # Событие журнала действий пишется, только если группа зафиксирована
+        self.on_commit.append(lambda: audit.record(action, user_id, **details))
+
+    def fetchval(self, sql, params=()):
+        self.cursor.execute(sql, params)
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+
+def limit_of(command):
+    return max(1, min(int(command.get("limit", DEFAULT_LIMIT)), 1000))
+
+
+def register(ctx, command):
+    first_name = str(command.get("first_name", ""))
+    last_name = str(command.get("last_name", ""))
+    phone = str(command.get("phone", ""))
+    password = str(command.get("password", ""))
+    validate_registration(first_name, last_name, phone, password)
+    user_id = ctx.fetchval(queries.INSERT_USER, (first_name, last_name, phone, password, session.CLIENT_ROLE_ID))
+    client_id = ctx.fetchval(queries.INSERT_CLIENT, (user_id, str(command.get("address", ""))))
+    user_session = session.create_session(user_id, first_name, last_name, session.CLIENT_ROLE_ID, client_id)
+    ctx.on_commit.append(lambda: ctx.sessions.add(first_name, password, user_session))
+    ctx.record("register", user_id, client_id=client_id)
+    return {"user_id": user_id, "client_id": client_id}
+
+
+def login(ctx, command):
+    user_session = ctx.sessions.get(ctx.conn, {"first_name": command.get("first_name"),
+                                               "password": command.get("password")})
+    ctx.record("login", user_session.user_id)
+    return {"user_id": user_session.user_id, "role_id": user_session.role_id,
+            "first_name": user_session.first_name, "last_name": user_session.last_name}
+
+
+def fruits(ctx, command):
+    limit = limit_of(command)
+    if command.get("after_name") is None:
+        ctx.cursor.execute(queries.FRUITS_FIRST_PAGE + " LIMIT %s", (limit,))
+    else:
+        ctx.cursor.execute(queries.FRUITS_NEXT_PAGE + " LIMIT %s",
+                           (str(command["after_name"]), int(command.get("after_id", 0)), limit))
+    return {"fruits": [{"id": row[0], "name": row[1], "price": row[2], "reviews": row[3],
+                        "rating": round(row[4] / row[3], 2) if row[3] else None} for row in ctx.cursor.fetchall()]}
+
+
+def fruit_info(ctx, command):
+    fruit = catalog.find(str(command.get("name", "")))
+    if fruit is None:
+        raise LookupError("Фрукт не найден.")
+    prepared.execute(ctx.cursor, queries.FRUIT_RATING, (fruit[0],))
+    rating = ctx.cursor.fetchone()
+    return {"id": fruit[0], "name": fruit[1], "creation_date": fruit[2], "price": fruit[3],
+            "expiration_date": fruit[4], "producer": fruit[5], "country": fruit[6],
+            "reviews": rating[0] if rating else 0,
+            "rating": round(rating[1] / rating[0], 2) if rating and rating[0] else None}
+
+
+def reviews(ctx, command):
+    prepared.execute(ctx.cursor, queries.FRUIT_REVIEWS, (str(command.get("name", "")),))
+    return {"reviews": [{"id": row[0], "text": row[1], "evaluation": row[2], "client": f"{row[3]} {row[4]}"}
+                        for row in ctx.cursor.fetchall()]}
+
+
+def review(ctx, command):
+    user_session = ctx.user(*CLIENT_ROLES)
+    evaluation = int(command.get("evaluation", 0))
+    prepared.execute(ctx.cursor, queries.FRUIT_ID_BY_NAME, (str(command.get("name", "")),))
+    fruit_id = ctx.cursor.fetchone()
+    if fruit_id is None:
+        raise LookupError("Фрукт не найден.")
+    ctx.cursor.execute(queries.ADD_REVIEW, (str(command.get("text", "")), evaluation,
+                                            user_session.client_id, fruit_id[0]))
+    ctx.record("review", user_session.user_id, fruit_id=fruit_id[0], evaluation=evaluation)
+    return {}
+
+
+def order(ctx, command):
+    user_session = ctx.user(*CLIENT_ROLES)
+    items = [(str(item.get("name", "")), int(item.get("quantity", 0))) for item in command.get("items", ())]
+    orders = checkout(ctx.conn, user_session.client_id, items)
+    ctx.record("order", user_session.user_id, orders=[row[0] for row in orders], total=sum(row[3] for row in orders))
+    return {"orders": [{"order_id": order_id, "name": name, "quantity": quantity, "total_price": total_price}
+                       for order_id, name, quantity, total_price in orders],
+            "total": sum(row[3] for row in orders)}
+
+
+def history(ctx, command):
+    user_session = ctx.user(*CLIENT_ROLES)
+    client_id = user_session.client_id
+    first_page, next_page = ((queries.ARCHIVE_HISTORY_FIRST_PAGE, queries.ARCHIVE_HISTORY_NEXT_PAGE)
+                             if command.get("archive") else (queries.HISTORY_FIRST_PAGE, queries.HISTORY_NEXT_PAGE))
+    limit = limit_of(command)
+    result = {}
+    if command.get("after_date") is None:
+        prepared.execute(ctx.cursor, queries.CLIENT_ORDER_SUMMARY, (client_id,))
+        summary = ctx.cursor.fetchone()
+        result["summary"] = {"order_count": summary[0] if summary else 0, "total_spent": summary[1] if summary else 0,
+                             "last_order_date": summary[2] if summary else None}
+        query, params = first_page, (None, client_id, client_id)
+    else:
+        query, params = next_page, (int(command.get("after_total", 0)), client_id, client_id,
+                                    datetime.date.fromisoformat(command["after_date"]), int(command.get("after_id", 0)))
+    prepared.execute(ctx.cursor, query + " LIMIT %s", params + (limit,), generic=True)
+    rows = ctx.cursor.fetchall()
+    result["orders"] = [{"creation_date": row[0], "delivery_date": row[1], "name": row[2], "total_price": row[3],
+                         "quantity": row[4], "id": row[5], "status": row[6], "days_remaining": row[7],
+                         "running_total": row[8]} for row in rows]
+    if len(rows) == limit:
+        result["next"] = {"after_date": rows[-1][0], "after_id": rows[-1][5], "after_total": rows[-1][8] - rows[-1][3]}
+    return result
+
+
+def search_fruits(ctx, command):
+    text = str(command.get("q", "")).strip()
+    if not text:
+        raise ValueError("Не задан текст поиска.")
+    return {"fruits": [{"id": row[0], "name": row[1], "price": row[2], "score": round(row[3], 3)}
+                       for row in search.find_fruits(text, min(limit_of(command), search.FUZZY_LIMIT))]}
+
+
+def search_reviews(ctx, command):
+    text = str(command.get("q", "")).strip()
+    if not text:
+        raise ValueError("Не задан текст поиска.")
+    rows = search.fetch_reviews_page(text, command.get("lang") or None, None, limit_of(command))
+    return {"reviews": [{"id": row[0], "fruit": row[1], "text": row[2], "evaluation": row[3]} for row in rows]}
+
+
+def employees(ctx, command):
+    ctx.cursor.execute(queries.EMPLOYEES)
+    return {"employees": [{"id": row[0], "first_name": row[1], "last_name": row[2], "salary": row[3],
+                           "start_work": row[4], "end_work": row[5], "positions": row[6]}
+                          for row in ctx.cursor.fetchall()]}
+
+
+def add_employee(ctx, command):
+    admin = ctx.user(*ADMIN_ROLES)
+    positions = [int(position) for position in command.get("positions", ())]
+    if not positions:
+        raise ValueError("Необходимо выбрать хотя бы одну позицию.")
+    start_work = datetime.time.fromisoformat(str(command.get("start_work", "")))
+    end_work = datetime.time.fromisoformat(str(command.get("end_work", "")))
+    user_id = ctx.fetchval(queries.USER_ID_BY_NAME, (str(command.get("user_name", "")),))
+    if user_id is None:
+        raise LookupError("Пользователь с указанным именем не существует.")
+    ctx.cursor.execute(queries.DELETE_CLIENT, (user_id,))
+    employee_id = ctx.fetchval(queries.INSERT_EMPLOYEE, (int(command.get("salary", 0)), user_id, start_work, end_work))
+    ctx.cursor.execute(queries.INSERT_EMPLOYEE_POSITIONS, (employee_id, positions))
+    ctx.cursor.execute(queries.SET_EMPLOYEE_ROLE, (user_id,))
+    ctx.on_commit.append(lambda: session.invalidate(user_id))
+    ctx.record("add_employee", admin.user_id, user_id=user_id, employee_id=employee_id,
+               role_id=session.EMPLOYEE_ROLE_ID, positions=positions)
+    return {"id": employee_id}
+
+
+def add_producer(ctx, command):
+    user_session = ctx.user(*STAFF_ROLES)
+    name, country = str(command.get("name", "")), str(command.get("country", ""))
+    ctx.cursor.execute(queries.INSERT_PRODUCER, (name, country))
+    ctx.record("add_producer", user_session.user_id, name=name, country=country)
+    return {}
+
+
+def add_fruit(ctx, command):
+    user_session = ctx.user(*STAFF_ROLES)
+    name, price = str(command.get("name", "")), int(command.get("price", 0))
+    producer_id = int(command.get("producer_id", 0))
+    ctx.cursor.execute(queries.ADD_FRUIT, (name, datetime.date.fromisoformat(str(command.get("creation_date", ""))),
+                                           price, int(command.get("expiration_date", 0)), producer_id))
+    ctx.record("add_fruit", user_session.user_id, name=name, price=price, producer_id=producer_id)
+    return {}
+
+
+def delete_fruit(ctx, command):
+    user_session = ctx.user(*STAFF_ROLES)
+    name = str(command.get("name", ""))
+    ctx.cursor.execute(queries.DELETE_FRUIT, (name,))
+    if not ctx.cursor.rowcount:
+        raise LookupError("Фрукт не найден.")
+    ctx.record("delete_fruit", user_session.user_id, name=name)
+    return {}
+
+
+def update_price(ctx, command):
+    user_session = ctx.user(*ADMIN_ROLES)
+    # Фрукт ищется без учёта регистра, как его выбирает RepriceFruits
+    fruit_id = ctx.fetchval(queries.FRUIT_ID_BY_NAME, (str(command.get("name", "")),))
+    if fruit_id is None:
+        raise LookupError("Фрукт не найден.")
+    ctx.cursor.execute(queries.REPRICE_FRUITS, (float(command.get("percentage", 0)), str(command.get("name", "")),
+                                                None, None, None, None, None, True))
+    changes = [{"name": row[1], "old_price": row[3], "new_price": row[4]} for row in ctx.cursor.fetchall()]
+    ctx.record("reprice", user_session.user_id, fruit_id=fruit_id, percentage=command.get("percentage", 0))
+    return {"changes": changes}
+
+
+def restock(ctx, command):
+    user_session = ctx.user(*STAFF_ROLES)
+    name = str(command.get("name", ""))
+    if command.get("stock") is not None:
+        ctx.cursor.execute(queries.SET_FRUIT_STOCK, (int(command["stock"]), name))
+    else:
+        add = int(command.get("add", 0))
+        ctx.cursor.execute(queries.ADD_FRUIT_STOCK, (add, name, add))
+    row = ctx.cursor.fetchone()
+    if row is None:
+        raise LookupError("Фрукт не найден или списание больше остатка.")
+    ctx.record("restock", user_session.user_id, name=row[0], add=command.get("add"), stock=row[1])
+    return {"name": row[0], "stock": row[1]}
+
+
+def delete_low_rated_reviews(ctx, command):
+    user_session = ctx.user(*ADMIN_ROLES)
+    ctx.cursor.execute(queries.DELETE_LOW_RATED_REVIEWS)
+    ctx.record("delete_low_rated_reviews", user_session.user_id)
+    return {}
+
+
+# Действия меню main.py; корзина здесь не нужна - order принимает сразу несколько позиций
+COMMANDS = {
+    "register": register,
+    "login": login,
+    "fruits": fruits,
+    "fruit_info": fruit_info,
+    "reviews": reviews,
+    "review": review,
+    "order": order,
+    "history": history,
+    "search_fruits": search_fruits,
+    "search_reviews": search_reviews,
+    "employees": employees,
+    "add_employee": add_employee,
+    "add_producer": add_producer,
+    "add_fruit": add_fruit,
+    "delete_fruit": delete_fruit,
+    "update_price": update_price,
+    "restock": restock,
+    "delete_low_rated_reviews": delete_low_rated_reviews,
+}
+
+
+def error_message(error):
+    if isinstance(error, psycopg2.Error) and error.diag.message_primary:
+        return error.diag.message_primary
+    if isinstance(error, KeyError):
+        return f"Не задано поле {error}"
+    return str(error)
+
+
+def parse_line(line):
+    try:
+        command = json.loads(line)
+    except ValueError:
+        return None, "Строка не является JSON."
+    if not isinstance(command, dict):
+        return None, "Команда должна быть JSON-объектом."
+    if command.get("op") not in COMMANDS:
+        return command, f"Неизвестная команда: {command.get('op')}"
+    return command, None
+
+
+def routing_key(command, line_no):
+    # Все команды одного пользователя идут в один поток по порядку: регистрация и вход раньше его заказов и отзывов.
+    # Команды без user выполняются от --user; их порядок не нужен, и они распределяются по потокам по строкам,
+    # иначе при запуске с --user весь файл выполнял бы один поток
+    user = command.get("user") if command and isinstance(command.get("user"), dict) else {}
+    name = user.get("first_name") or (command.get("first_name") if command else None)
+    if name:
+        return "user:" + str(name)
+    return f"line:{line_no}"
+
+
+def group_fruits(group):
+    # Фрукты, строки которых (Fruits, сводка в Fruit_Ratings) изменят команды группы
+    names = set()
+    for _, command, error in group:
+        if error is not None:
+            continue
+        if command["op"] in ("review", "update_price", "restock"):
+            names.add(str(command.get("name", "")).lower())
+        elif command["op"] == "order" and isinstance(command.get("items"), list):
+            names.update(str(item.get("name", "")).lower() for item in command["items"] if isinstance(item, dict))
+    return sorted(names)
+
+
+def new_result(line_no, command):
+    result = {"line": line_no, "op": command.get("op") if command else None}
+    if command and "id" in command:
+        result["id"] = command["id"]
+    return result
+
+
+def failed_group(group, results, error):
+    # Команды группы, выполненные успешно (или не дошедшие до выполнения), получают общую ошибку группы
+    failed = []
+    for index, (line_no, command, _) in enumerate(group):
+        result = results[index] if index < len(results) else new_result(line_no, command)
+        if result.get("ok", True):
+            result.pop("result", None)
+            result["ok"] = False
+            result["error"] = error
+        failed.append(result)
+    return failed
+
+
+def run_group(group, sessions):
+    # Команды группы выполняются по порядку в одной транзакции на одном соединении.
+    # Каждая - под точкой сохранения: ошибка откатывает только её, остальные фиксируются вместе.
+    # Группы разных потоков меняют строки одних фруктов в разном порядке; строки фруктов группы блокируются
+    # сразу и по Id, поэтому группы с общими фруктами ждут друг друга, но не блокируются взаимно
+    results = []
+    on_commit = []
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            fruit_names = group_fruits(group)
+            if fruit_names:
+                cursor.execute(queries.LOCK_FRUITS_BY_NAMES, (fruit_names,))
+            for line_no, command, error in group:
+                result = new_result(line_no, command)
+                if error is None:
+                    ctx = Context(conn, cursor, sessions, command)
+                    cursor.execute("SAVEPOINT batch_command")
+                    try:
+                        result["result"] = COMMANDS[command["op"]](ctx, command)
+                        cursor.execute("RELEASE SAVEPOINT batch_command")
+                        on_commit.extend(ctx.on_commit)
+                    except Exception as e:
+                        # Ошибка команды (в том числе неверные поля JSON) не прерывает пакет
+                        cursor.execute("ROLLBACK TO SAVEPOINT batch_command")
+                        error = error_message(e)
+                result["ok"] = error is None
+                if error is not None:
+                    result["error"] = error
+                results.append(result)
+            conn.commit()
+        except psycopg2.Error as e:
+            if not conn.closed:
+                conn.rollback()
+            return failed_group(group, results, f"Группа не зафиксирована: {error_message(e)}")
+    for callback in on_commit:
+        callback()
+    return results
+
+
+def run_batch(lines, output, group_size=DEFAULT_GROUP_SIZE, workers=DEFAULT_WORKERS, default_credentials=None):
+    # Каждый из workers потоков выполняет свои группы на своём соединении пула.
+    # Команда попадает в поток по routing_key; результаты пишутся по мере фиксации групп,
+    # порядок между потоками не сохраняется - строку входа указывает поле line.
+    # Очереди потоков ограничены, поэтому память не зависит от длины входа
+    sessions = Sessions(default_credentials)
+    output_lock = threading.Lock()
+    counts = {"total": 0, "failed": 0}
+
+    def write(results):
+        with output_lock:
+            for result in results:
+                output.write(json.dumps(result, default=to_json, ensure_ascii=False) + "\n")
+                counts["total"] += 1
+                counts["failed"] += not result["ok"]
+
+    def worker(groups):
+        while (group := groups.get()) is not None:
+            try:
+                jobs.ensure_order_partition()
+            except Exception as e:
+                # Без секции месяца заказы лягут в секцию по умолчанию
+                print(f"Секция заказов месяца не создана: {e}", file=sys.stderr)
+            try:
+                results = run_group(group, sessions)
+            except Exception as e:
+                # Ошибка вне команд (нет соединения, сбой сервера): группа не выполнена, но поток продолжает
+                # разбирать свою очередь - иначе чтение входа навсегда ждало бы места в ней
+                results = failed_group(group, [], f"Группа не выполнена: {error_message(e)}")
+            write(results)
+
+    lanes = [queue.Queue(maxsize=2) for _ in range(workers)]
+    buffers = [[] for _ in range(workers)]
+    threads = [threading.Thread(target=worker, args=(lane,), daemon=True) for lane in lanes]
+    for thread in threads:
+        thread.start()
+
+    started = time.perf_counter()
+    try:
+        for line_no, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            command, error = parse_line(line)
+            index = hash(routing_key(command, line_no)) % workers
+            buffers[index].append((line_no, command, error))
+            if len(buffers[index]) >= group_size:
+                lanes[index].put(buffers[index])
+                buffers[index] = []
+    finally:
+        for lane, buffer in zip(lanes, buffers):
+            if buffer:
+                lane.put(buffer)
+            lane.put(None)
+        for thread in threads:
+            thread.join()
+    return counts["total"], counts["failed"], time.perf_counter() - started
+
+
+def run(path, output_path=None, group_size=DEFAULT_GROUP_SIZE, workers=DEFAULT_WORKERS, user=None):
+    default_credentials = None
+    if user:
+        password = os.environ.get(PASSWORD_ENV) or getpass.getpass(f"Пароль пользователя {user}: ")
+        default_credentials = {"first_name": user, "password": password}
+
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    output = sys.stdout if output_path in (None, "-") else open(output_path, "w", encoding="utf-8")
+    try:
+        total, failed, elapsed = run_batch(source, output, group_size, workers, default_credentials)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        else:
+            output.flush()
+    print(f"Команд: {total}, ошибок: {failed}, {elapsed:.2f} с ({total / elapsed if elapsed else 0:.0f} оп/с)",
+          file=sys.stderr)
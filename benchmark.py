@@ -0,0 +1,449 @@
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime
+
+import psycopg2
+
+import db
+import jobs
+import paging
+import prepared
+import queries
+import session
+from catalog_cache import catalog
+from main import (checkout, fetch_fruit_info, fetch_fruit_reviews, fetch_fruits_page, fetch_history_page,
+                  validate_registration)
+
+DEFAULT_MIX = {
+    "login": 10,
+    "select_fruits": 25,
+    "get_fruit_info": 25,
+    "get_reviews_for_fruit": 15,
+    "show_history": 10,
+    "make_order": 10,
+    "leave_review": 5,
+}
+
+
+def parse_mix(text):
+    # "select_fruits=30,make_order=10": операции, которых нет в строке, не выполняются
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Неизвестная операция: {name}. Доступны: {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("Хотя бы одна операция должна иметь положительный вес.")
+    return mix
+
+
+class VirtualUser:
+    def __init__(self, index, run_id, seed, fruit_names):
+        self.rng = random.Random(seed * 100003 + index)
+        self.first_name = f"bench{run_id}u{index}"
+        self.password = f"{self.rng.randrange(10 ** 6):06d}"
+        self.fruit_names = fruit_names
+        self.session = None
+
+    def random_fruit(self):
+        return self.rng.choice(self.fruit_names)
+
+    def register(self):
+        validate_registration(self.first_name, "Bench", "+375290000000", self.password)
+        with db.connection() as conn, conn.cursor() as cursor:
+            try:
+                cursor.execute(queries.INSERT_USER,
+                               (self.first_name, "Bench", "+375290000000", self.password, session.CLIENT_ROLE_ID))
+                user_id = cursor.fetchone()[0]
+                cursor.execute(queries.INSERT_CLIENT, (user_id, "bench"))
+                client_id = cursor.fetchone()[0]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        self.session = session.create_session(user_id, self.first_name, "Bench", session.CLIENT_ROLE_ID, client_id)
+
+    def login(self):
+        with db.connection() as conn:
+            self.session = session.authenticate(conn, self.first_name, self.password)
+        if self.session is None:
+            raise RuntimeError("Неверный логин или пароль.")
+
+    def select_fruits(self):
+        # Первая страница или страница, начинающаяся со случайного фрукта - как листание в main.select_fruits
+        after = None
+        if self.rng.random() >= 0.5:
+            fruit = catalog.find(self.random_fruit())
+            after = (fruit[1], fruit[0])
+        for _ in fetch_fruits_page(after, paging.DEFAULT_PAGE_SIZE + 1):
+            pass
+
+    def get_fruit_info(self):
+        fetch_fruit_info(self.random_fruit())
+
+    def get_reviews_for_fruit(self):
+        fetch_fruit_reviews(self.random_fruit())
+
+    def show_history(self):
+        fetch_history_page(self.session.client_id, None, paging.DEFAULT_PAGE_SIZE + 1)
+
+    def make_order(self):
+        items = [(self.random_fruit(), self.rng.randint(1, 5)) for _ in range(self.rng.randint(1, 3))]
+        jobs.ensure_order_partition()
+        with db.connection() as conn:
+            try:
+                checkout(conn, self.session.client_id, items)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def leave_review(self):
+        with db.connection() as conn, conn.cursor() as cursor:
+            try:
+                prepared.execute(cursor, queries.FRUIT_ID_BY_NAME, (self.random_fruit(),))
+                fruit_id = cursor.fetchone()[0]
+                cursor.execute(queries.ADD_REVIEW,
+                               ("benchmark review", self.rng.randint(1, 5), self.session.client_id, fruit_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+
+
+def run_benchmark(users=10, duration=30.0, mix=None, seed=1, warmup=0.0):
+    mix = mix or dict(DEFAULT_MIX)
+    operations = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in operations]
+    fruit_names = [fruit[1] for fruit in catalog.fruits()]
+    if not fruit_names:
+        raise RuntimeError("Каталог пуст: нечего заказывать.")
+
+    router = db.get_router()
+    routed_before = dict(router.routed)
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    latencies = {name: [] for name in ["register"] + operations}
+    errors = {name: 0 for name in latencies}
+    error_samples = {}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(users + 1)
+    timing = {}
+
+    def record(name, started, failure=None):
+        elapsed = time.perf_counter() - started
+        with lock:
+            if failure is None:
+                # Регистрация выполняется один раз на пользователя и учитывается всегда
+                if name == "register" or started >= timing["measure_from"]:
+                    latencies[name].append(elapsed)
+            else:
+                errors[name] += 1
+                error_samples.setdefault(name, f"{type(failure).__name__}: {failure}")
+
+    def worker(index):
+        user = VirtualUser(index, run_id, seed, fruit_names)
+        start_barrier.wait()
+        started = time.perf_counter()
+        try:
+            user.register()
+            record("register", started)
+        except Exception as e:
+            record("register", started, e)
+            return
+        while time.perf_counter() < timing["deadline"]:
+            name = user.rng.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                getattr(user, name)()
+                record(name, started)
+            except Exception as e:
+                record(name, started, e)
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(users)]
+    for thread in threads:
+        thread.start()
+    began = time.perf_counter()
+    timing["measure_from"] = began + warmup
+    timing["deadline"] = began + warmup + duration
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - timing["measure_from"]
+
+    all_latencies = [value for name in operations for value in latencies[name]]
+    return {
+        "run": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "users": users,
+            "duration": duration,
+            "warmup": warmup,
+            "seed": seed,
+            "mix": mix,
+            "pool_max": db.load_config()["max_size"],
+            "prepared": prepared.enabled,
+            "replicas": len(router.replicas),
+        },
+        "reads": {target: count - routed_before[target] for target, count in router.routed.items()},
+        "total": summarize(all_latencies, sum(errors[name] for name in operations), elapsed),
+        "operations": {name: summarize(latencies[name], errors[name], elapsed) for name in latencies},
+        "errors": error_samples,
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"Пользователей: {result['run']['users']}, длительность: {result['run']['duration']} с, "
+          f"пул: {result['run']['pool_max']}, "
+          f"подготовленные операторы: {'да' if result['run'].get('prepared', True) else 'нет'}")
+    header = f"{'Операция':22} | {'Кол-во':>7} | {'Ошибки':>6} | {'оп/с':>8} | {'p50 мс':>8} | {'p95 мс':>8} | {'p99 мс':>8}"
+    if baseline:
+        header += f" | {'Δ оп/с':>8} | {'Δ p95':>8}"
+    print(header)
+    print("-" * len(header))
+
+    rows = list(result["operations"].items()) + [("ВСЕГО", result["total"])]
+    for name, stats in rows:
+        line = (f"{name:22} | {stats['count']:7} | {stats['errors']:6} | {stats['throughput']:8} | "
+                f"{format_ms(stats['p50_ms'])} | {format_ms(stats['p95_ms'])} | {format_ms(stats['p99_ms'])}")
+        if baseline:
+            old = baseline["total"] if name == "ВСЕГО" else baseline["operations"].get(name)
+            line += f" | {format_delta(old and old['throughput'], stats['throughput'])}"
+            line += f" | {format_delta(old and old['p95_ms'], stats['p95_ms'])}"
+        print(line)
+
+    if result["run"].get("replicas"):
+        reads = result["reads"]
+        print(f"Чтения: реплики {reads['replica']}, основной сервер {reads['primary']}, "
+              f"основной после своей записи {reads['own_write']}")
+
+    for name, message in result["errors"].items():
+        print(f"Ошибка в {name}: {message}")
+
+
+def format_ms(value):
+    return f"{'-' if value is None else value:>8}"
+
+
+def format_delta(old, new):
+    if not old or new is None:
+        return f"{'-':>8}"
+    return f"{(new - old) / old * 100:+7.1f}%"
+
+
+def run(users, duration, mix_text=None, seed=1, warmup=0.0, output=None, compare=None, use_prepared=None):
+    if use_prepared is not None:
+        prepared.enabled = use_prepared
+    baseline = None
+    if compare:
+        with open(compare, encoding="utf-8") as source:
+            baseline = json.load(source)
+
+    pool_max = db.load_config()["max_size"]
+    if users > pool_max:
+        print(f"Внимание: пользователей ({users}) больше, чем соединений в пуле ({pool_max}); "
+              f"ожидание слота пула войдёт в задержки, отдельные пользователи могут простаивать.")
+
+    result = run_benchmark(users, duration, parse_mix(mix_text), seed, warmup)
+    print_report(result, baseline)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as target:
+            json.dump(result, target, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {output}")
+    return result
+
+
+def run_stock_stress(buyers=200, stock=2000, quantity=1):
+    # Все покупатели одновременно заказывают один фрукт, пока остаток не кончится. Продано должно быть
+    # ровно столько, сколько списано со склада, а остаток - меньше одной покупки и не меньше нуля
+    # У каждого покупателя своё соединение, открытое до старта: общий пул приложения (FRUIT_SHOP_POOL_MAX)
+    # ограничил бы одновременность своим размером, а подключение попало бы в задержку заказа
+    config = db.load_config()
+    buyer_pool = db.ConnectionPool(config["dsn"], min_size=0, max_size=buyers, connect_retries=0,
+                                   connection_factory=db.PrimaryConnection)
+    connections = []
+    try:
+        for _ in range(buyers):
+            connections.append(buyer_pool.getconn())
+    except psycopg2.OperationalError as e:
+        buyer_pool.close()
+        raise SystemExit(f"Открыто {len(connections)} соединений покупателей из {buyers} ({str(e).strip()}). "
+                         "Уменьшите --buyers или увеличьте max_connections сервера.")
+    try:
+        return _stock_stress(buyer_pool, connections, stock, quantity)
+    finally:
+        for conn in connections:
+            buyer_pool.putconn(conn)
+        buyer_pool.close()
+
+
+def _stock_stress(buyer_pool, connections, stock, quantity):
+    buyers = len(connections)
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    fruit = f"stress{run_id}"
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.PRODUCERS)
+            producer = cursor.fetchone()
+            if producer is None:
+                raise RuntimeError("Нет производителей: фрукт для теста создать не к кому.")
+            cursor.execute(queries.ADD_FRUIT, (fruit, datetime.now().date(), 1, 30, producer[0]))
+            cursor.execute(queries.SET_FRUIT_STOCK, (stock, fruit))
+            cursor.execute(queries.FRUIT_ID_BY_EXACT_NAME, (fruit,))
+            fruit_id = cursor.fetchone()[0]
+            user_ids, client_ids = [], []
+            for index in range(buyers):
+                cursor.execute(queries.INSERT_USER, (f"{fruit}u{index}", "Stress", "+375290000000", "stress",
+                                                     session.CLIENT_ROLE_ID))
+                user_ids.append(cursor.fetchone()[0])
+                cursor.execute(queries.INSERT_CLIENT, (user_ids[-1], "stress"))
+                client_ids.append(cursor.fetchone()[0])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    jobs.ensure_order_partition()
+    latencies = []
+    counts = {"orders": 0, "sold": 0, "rejected": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0}
+    error_samples = {}
+    lock = threading.Lock()
+    # Все покупатели (и главный поток, засекающий время) стартуют одновременно
+    start_barrier = threading.Barrier(buyers + 1)
+
+    def buyer(conn, client_id):
+        start_barrier.wait()
+        while True:
+            started = time.perf_counter()
+            with lock:
+                counts["in_flight"] += 1
+                counts["peak_in_flight"] = max(counts["peak_in_flight"], counts["in_flight"])
+            try:
+                checkout(conn, client_id, [(fruit, quantity)])
+                conn.commit()
+            except ValueError:
+                # Остатка не хватает: покупатель уходит
+                conn.rollback()
+                with lock:
+                    counts["rejected"] += 1
+                return
+            except Exception as e:
+                conn.rollback()
+                with lock:
+                    counts["errors"] += 1
+                    error_samples.setdefault(type(e).__name__, str(e))
+                return
+            finally:
+                with lock:
+                    counts["in_flight"] -= 1
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                counts["orders"] += 1
+                counts["sold"] += quantity
+
+    threads = [threading.Thread(target=buyer, args=(conn, client_id), daemon=True)
+               for conn, client_id in zip(connections, client_ids)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.FRUIT_STOCK_BY_IDS, ([fruit_id],))
+            stock_left = cursor.fetchone()[2]
+            cursor.execute(queries.FRUIT_SOLD_QUANTITY, (fruit_id,))
+            orders_db, sold_db = cursor.fetchone()
+            # Удаление заказов должно вернуть всё проданное на склад
+            cursor.execute(queries.DELETE_FRUIT_ORDERS, (fruit_id,))
+            cursor.execute(queries.FRUIT_STOCK_BY_IDS, ([fruit_id],))
+            stock_released = cursor.fetchone()[2]
+            cursor.execute(queries.DELETE_FRUIT, (fruit,))
+            cursor.execute(queries.DELETE_USERS, (user_ids,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return {
+        "run": {"buyers": buyers, "stock": stock, "quantity": quantity, "connections": buyer_pool.max_size},
+        # Наибольшее число покупателей, одновременно находившихся в оформлении заказа
+        "peak_concurrent": counts["peak_in_flight"],
+        "orders": summarize(latencies, counts["errors"], elapsed),
+        "sold": counts["sold"],
+        "rejected": counts["rejected"],
+        "orders_db": orders_db,
+        "sold_db": sold_db,
+        "stock_left": stock_left,
+        "stock_released": stock_released,
+        "checks": {
+            "no_oversell": stock_left >= 0 and sold_db + stock_left == stock,
+            "matches_app": sold_db == counts["sold"] and orders_db == counts["orders"],
+            "sold_out": stock_left < quantity,
+            "no_errors": counts["errors"] == 0,
+            "released": stock_released == stock,
+        },
+        "errors": error_samples,
+    }
+
+
+def run_stock(buyers, stock, quantity, output=None):
+    result = run_stock_stress(buyers, stock, quantity)
+    orders = result["orders"]
+    print(f"Покупателей: {buyers} (соединений: {result['run']['connections']}, одновременно в заказе до "
+          f"{result['peak_concurrent']}), остаток: {stock}, в заказе: {quantity}")
+    print(f"Заказов: {orders['count']} ({orders['throughput']} в секунду), отказов: {result['rejected']}, "
+          f"ошибок: {orders['errors']}")
+    print(f"Задержка заказа, мс: p50 {orders['p50_ms']}, p95 {orders['p95_ms']}, p99 {orders['p99_ms']}, "
+          f"max {orders['max_ms']}")
+    print(f"Продано: {result['sold_db']} (по ответам {result['sold']}), остаток: {result['stock_left']}, "
+          f"после удаления заказов: {result['stock_released']}")
+    for name, message in result["errors"].items():
+        print(f"Ошибка {name}: {message}")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as target:
+            json.dump(result, target, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {output}")
+
+    messages = {
+        "no_oversell": "продано больше, чем было на складе",
+        "matches_app": "число заказов в базе не совпадает с подтверждёнными",
+        "sold_out": "остаток не распродан, хотя покупатели получили отказ",
+        "no_errors": "часть заказов завершилась ошибкой",
+        "released": "удаление заказов не вернуло остаток на склад",
+    }
+    failed = [messages[name] for name, passed in result["checks"].items() if not passed]
+    if failed:
+        raise SystemExit("Проверка не пройдена: " + "; ".join(failed))
+    print("Проверка пройдена: перепродажи нет, остаток сходится с заказами.")
+    return result
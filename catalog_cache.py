@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+
+import db
+import notifications
+import queries
+
+
+class FruitCatalog:
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._fruits = []
+        self._by_id = {}
+        self._by_name = {}
+        self._loaded_at = None
+        self._generation = 0
+        self._subscribed = False
+
+    def _is_fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _load(self):
+        generation = self._generation
+        # Кэш заполняется с основного сервера: реплика, ещё не применившая изменение из NOTIFY,
+        # оставила бы в кэше устаревший каталог на весь TTL
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(queries.CATALOG)
+            fruits = cursor.fetchall()
+
+        by_name = {}
+        for fruit in fruits:
+            by_name.setdefault(fruit[1].casefold(), fruit)
+        self._fruits = fruits
+        self._by_id = {fruit[0]: fruit for fruit in fruits}
+        self._by_name = by_name
+        # Если во время загрузки пришло уведомление, данные могли устареть
+        self._loaded_at = time.monotonic() if generation == self._generation else None
+
+    def _ensure_loaded(self):
+        if not self._subscribed:
+            self._subscribed = True
+            notifications.subscribe("catalog_changed", self.invalidate)
+        if self._is_fresh():
+            self.hits += 1
+            return
+        with self._lock:
+            if self._is_fresh():
+                self.hits += 1
+                return
+            self.misses += 1
+            self._load()
+
+    def fruits(self):
+        self._ensure_loaded()
+        return self._fruits
+
+    def get(self, fruit_id):
+        self._ensure_loaded()
+        return self._by_id.get(fruit_id)
+
+    def find(self, fruit_name):
+        self._ensure_loaded()
+        return self._by_name.get(fruit_name.casefold())
+
+    def invalidate(self, payload=None):
+        self._generation += 1
+        self._loaded_at = None
+        self.invalidations += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "size": len(self._fruits),
+        }
+
+
+catalog = FruitCatalog(ttl=float(os.environ.get("FRUIT_SHOP_CATALOG_TTL", 300)))
@@ -0,0 +1,408 @@
+import concurrent.futures
+import datetime
+import io
+import multiprocessing
+import random
+import time
+
+import psycopg2
+
+import db
+import jobs
+
+# Строк на единицу масштаба: --scale 10 - 1 млн клиентов, 20 млн заказов с доставками, 4 млн отзывов
+SCALE_ROWS = {
+    "producers": 50,
+    "fruits": 2000,
+    "admins": 5,
+    "employees": 500,
+    "clients": 100000,
+    "orders": 2000000,
+    "reviews": 400000,
+}
+
+# Строк в одном потоке COPY: задание генерирует свой кусок по seed и номеру куска, поэтому данные
+# не зависят от числа процессов
+CHUNK_ROWS = 50000
+
+DEFAULT_SCALE = 1
+DEFAULT_SEED = 1
+DEFAULT_WORKERS = 4
+DEFAULT_MONTHS = 12
+
+PASSWORD = "p1234"
+
+# Популярность фруктов - закон Ципфа с этим показателем; клиенты - индекс u ** CLIENT_SKEW
+# (несколько постоянных покупателей и длинный хвост редких)
+FRUIT_ZIPF = 1.1
+CLIENT_SKEW = 3.0
+# Нечётное простое: перемешивает индексы клиентов, чтобы активные не шли подряд по Id
+SCATTER_PRIME = 2654435761
+
+# Заказы последних дней ещё в очереди доставки, остальным назначена дата
+QUEUED_DAYS = 2
+
+EVALUATION_WEIGHTS = (6, 6, 13, 30, 45)
+
+FIRST_NAMES = ("Ivan", "Olga", "Pavel", "Anna", "Sergey", "Maria", "Dmitry", "Elena", "Alexey", "Natalia",
+               "Andrey", "Tatyana", "Mikhail", "Irina", "Nikolay", "Svetlana", "Artem", "Yulia", "Kirill", "Daria")
+LAST_NAMES = ("Ivanov", "Petrov", "Sidorov", "Kozlov", "Novikov", "Morozov", "Volkov", "Sokolov", "Popov",
+              "Lebedev", "Kuznetsov", "Smirnov", "Orlov", "Zaitsev", "Pavlov", "Romanov", "Vasiliev", "Frolov")
+STREETS = ("Nezavisimosti", "Pobeditelei", "Surganova", "Kalinovskogo", "Lenina", "Gikalo", "Kupaly",
+           "Platonova", "Yakubova", "Mayakovskogo")
+FRUITS = ("Apple", "Pear", "Orange", "Mango", "Cherry", "Grapes", "Kiwi", "Banana", "Peach", "Plum", "Apricot",
+          "Lemon", "Lime", "Pineapple", "Melon", "Watermelon", "Strawberry", "Raspberry", "Blueberry", "Papaya",
+          "Pomegranate", "Fig", "Persimmon", "Mandarin", "Grapefruit", "Avocado", "Lychee", "Nectarine")
+VARIETIES = ("Golden", "Red", "Green", "Royal", "Wild", "Sweet", "Early", "Late", "Giant", "Baby", "Honey",
+             "Black", "White", "Organic", "Select", "Premium", "Classic", "Sunny", "Alpine", "Tropical")
+PRODUCER_WORDS = ("Orchard", "Farm", "Grove", "Gardens", "Valley", "Fields", "Harvest", "Plantation")
+COUNTRIES = ("Belarus", "Poland", "Spain", "Italy", "Turkey", "Egypt", "Morocco", "Chile", "Peru", "Ecuador",
+             "USA", "Canada", "China", "India", "Thailand", "South Africa", "New Zealand", "Greece")
+REVIEW_WORDS = ("вкусный", "сочный", "сладкий", "кислый", "свежий", "спелый", "ароматный", "недозрелый",
+                "мягкий", "хрустящий", "дорогой", "доставка", "упаковка", "качество", "рекомендую", "отлично",
+                "sweet", "juicy", "fresh", "ripe", "sour", "tasty", "delivery", "quality", "great", "price")
+
+ID_TABLES = ("Producers", "Fruits", "Users", "Clients", "Employees", "Positions_Employees", "Orders_With_Archive",
+             "Delivery_With_Archive", "Reviews")
+
+TRUNCATE = """
+    TRUNCATE Producers, Users, Delivery_Days, Sales_Daily, Sales_Changes RESTART IDENTITY CASCADE;
+"""
+
+ENSURE_PARTITIONS = """
+    SELECT CreateOrderPartition(month::date)
+    FROM generate_series(date_trunc('month', %s::date), date_trunc('month', %s::date), interval '1 month') AS month;
+
+    SELECT to_char(month, 'YYYY-MM')
+    FROM generate_series(date_trunc('month', %s::date), date_trunc('month', %s::date), interval '1 month') AS month
+    WHERE to_regclass('public.orders_p' || to_char(month, 'YYYYMM')) IS NULL;
+"""
+
+# Триггеры и проверки внешних ключей отключены только в транзакции загрузки (session_replication_role),
+# данные согласованы генератором; сводки, которые обычно ведут триггеры, пересчитываются после загрузки
+BYPASS_TRIGGERS = "SET LOCAL session_replication_role = replica; SET LOCAL synchronous_commit = off;"
+
+SYNC_SEQUENCES = """
+    SELECT setval(pg_get_serial_sequence(t.name, 'id'), GREATEST(t.max_id, 1), t.max_id > 0)
+    FROM (VALUES
+        ('producers', (SELECT COALESCE(MAX(Id), 0) FROM Producers)),
+        ('fruits', (SELECT COALESCE(MAX(Id), 0) FROM Fruits)),
+        ('users', (SELECT COALESCE(MAX(Id), 0) FROM Users)),
+        ('clients', (SELECT COALESCE(MAX(Id), 0) FROM Clients)),
+        ('employees', (SELECT COALESCE(MAX(Id), 0) FROM Employees)),
+        ('positions_employees', (SELECT COALESCE(MAX(Id), 0) FROM Positions_Employees)),
+        ('orders', (SELECT COALESCE(MAX(Id), 0) FROM Orders_With_Archive)),
+        ('delivery', (SELECT COALESCE(MAX(Id), 0) FROM Delivery_With_Archive)),
+        ('reviews', (SELECT COALESCE(MAX(Id), 0) FROM Reviews))
+    ) AS t(name, max_id);
+"""
+
+# Занятость дней доставки пересчитывается по всем доставкам; день с доставками сверх вместимости
+# получает вместимость по числу доставок (как при переходе на секционирование)
+REBUILD_DELIVERY_DAYS = """
+    INSERT INTO Delivery_Days AS dd (Delivery_Day, Capacity, Booked)
+    SELECT Delivery_date::date, GREATEST(COUNT(*), (SELECT Default_Capacity FROM Delivery_Settings)), COUNT(*)
+    FROM Delivery
+    GROUP BY 1
+    ORDER BY 1
+    ON CONFLICT (Delivery_Day) DO UPDATE SET
+        Booked = EXCLUDED.Booked,
+        Capacity = GREATEST(dd.Capacity, EXCLUDED.Booked);
+"""
+
+ANALYZE = """
+    ANALYZE Producers, Fruits, Users, Clients, Employees, Positions_Employees, Orders, Delivery, Delivery_Queue,
+            Delivery_Days, Reviews;
+    SELECT pg_notify('catalog_changed', 'Fruits');
+"""
+
+
+def scaled_counts(scale):
+    return {table: max(1, round(rows * scale)) for table, rows in SCALE_ROWS.items()}
+
+
+def generate_catalog(seed, counts, base, today):
+    # Производители и фрукты нужны всем заданиям (цены заказов), поэтому генерируются в основном процессе
+    rng = random.Random(f"{seed}:catalog")
+    producers = []
+    for producer_id in range(base["Producers"] + 1, base["Producers"] + counts["producers"] + 1):
+        name = f"{rng.choice(VARIETIES)} {rng.choice(PRODUCER_WORDS)} {producer_id}"
+        producers.append((producer_id, name, rng.choice(COUNTRIES)))
+
+    combinations = len(FRUITS) * len(VARIETIES)
+    fruits = []
+    for index in range(counts["fruits"]):
+        fruit_id = base["Fruits"] + index + 1
+        name = f"{FRUITS[index % len(FRUITS)]} {VARIETIES[index // len(FRUITS) % len(VARIETIES)]}"
+        if index >= combinations:
+            name += f" {index // combinations + 1}"
+        price = max(1, round(2 ** rng.uniform(0, 9)))
+        creation_date = today - datetime.timedelta(days=rng.randrange(30))
+        fruits.append((fruit_id, name, creation_date, price, rng.randrange(5, 150), rng.choice(producers)[0],
+                       rng.randrange(100, 10000)))
+    return producers, fruits
+
+
+def copy_rows(cursor, table, columns, rows):
+    # Текстовый формат COPY: сгенерированные значения не содержат табуляций, переводов строк и "\"
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(str, row)))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    return len(rows)
+
+
+class ChunkGenerator:
+    def __init__(self, context):
+        self.context = context
+        self.seed = context["seed"]
+        self.base = context["base"]
+        self.counts = context["counts"]
+        self.client_user_base = self.base["Users"] + self.counts["admins"] + self.counts["employees"]
+        self.dates = [context["first_day"] + datetime.timedelta(days=day)
+                      for day in range((context["today"] - context["first_day"]).days + 1)]
+        prices = context["prices"]
+        fruit_ids = list(prices)
+        random.Random(f"{self.seed}:popularity").shuffle(fruit_ids)
+        self.fruit_ids_by_rank = fruit_ids
+        self.fruit_cum_weights = []
+        total = 0.0
+        for rank in range(1, len(fruit_ids) + 1):
+            total += rank ** -FRUIT_ZIPF
+            self.fruit_cum_weights.append(total)
+
+    def rng(self, kind, chunk):
+        return random.Random(f"{self.seed}:{kind}:{chunk}")
+
+    def client_id(self, rng):
+        clients = self.counts["clients"]
+        index = int(clients * rng.random() ** CLIENT_SKEW)
+        return self.base["Clients"] + index * SCATTER_PRIME % clients + 1
+
+    def fruit_ids(self, rng, count):
+        return rng.choices(self.fruit_ids_by_rank, cum_weights=self.fruit_cum_weights, k=count)
+
+    def clients(self, cursor, chunk, start, end):
+        rng = self.rng("clients", chunk)
+        users, clients = [], []
+        for index in range(start, end):
+            user_id = self.client_user_base + index + 1
+            users.append((user_id, f"{rng.choice(FIRST_NAMES)}{user_id}", rng.choice(LAST_NAMES),
+                          f"+37529{user_id % 10 ** 7:07d}", PASSWORD, self.context["client_role"]))
+            clients.append((self.base["Clients"] + index + 1,
+                            f"ул. {rng.choice(STREETS)}, {rng.randrange(1, 200)}-{rng.randrange(1, 300)}", user_id))
+        copy_rows(cursor, "Users", ("Id", "First_Name", "Last_Name", "Phone", "Password", "Role_Id"), users)
+        copy_rows(cursor, "Clients", ("Id", "Address", "User_Id"), clients)
+        return {"Users": len(users), "Clients": len(clients)}
+
+    def staff(self, cursor, chunk, start, end):
+        rng = self.rng("staff", chunk)
+        users, employees, positions = [], [], []
+        admins = self.counts["admins"]
+        for index in range(admins + self.counts["employees"]):
+            user_id = self.base["Users"] + index + 1
+            role = self.context["admin_role"] if index < admins else self.context["employee_role"]
+            users.append((user_id, f"{rng.choice(FIRST_NAMES)}{user_id}", rng.choice(LAST_NAMES),
+                          f"+37533{user_id % 10 ** 7:07d}", PASSWORD, role))
+            if index < admins:
+                continue
+            employee_id = self.base["Employees"] + index - admins + 1
+            employees.append((employee_id, rng.randrange(800, 5000, 50), user_id,
+                              rng.choice(self.context["work_time_ids"])))
+            taken = rng.sample(self.context["position_ids"], min(rng.randint(1, 3), len(self.context["position_ids"])))
+            for slot, position_id in enumerate(taken):
+                positions.append((self.base["Positions_Employees"] + 3 * (employee_id - self.base["Employees"] - 1)
+                                  + slot + 1, position_id, employee_id))
+        copy_rows(cursor, "Users", ("Id", "First_Name", "Last_Name", "Phone", "Password", "Role_Id"), users)
+        copy_rows(cursor, "Employees", ("Id", "Salary", "User_Id", "Work_time_Id"), employees)
+        copy_rows(cursor, "Positions_Employees", ("Id", "Position_Id", "Employee_Id"), positions)
+        return {"Users": len(users), "Employees": len(employees), "Positions_Employees": len(positions)}
+
+    def orders(self, cursor, chunk, start, end):
+        rng = self.rng("orders", chunk)
+        prices = self.context["prices"]
+        lead_days = self.context["lead_days"]
+        queue_from = self.context["today"] - datetime.timedelta(days=QUEUED_DAYS - 1)
+        days = len(self.dates)
+        orders, deliveries, queue = [], [], []
+        for index, fruit_id in zip(range(start, end), self.fruit_ids(rng, end - start)):
+            order_id = self.base["Orders_With_Archive"] + index + 1
+            # Степень < 1 смещает заказы к последним месяцам: магазин растёт
+            order_date = self.dates[min(days - 1, int(days * rng.random() ** 0.7))]
+            quantity = 1 + int(9 * rng.random() ** 2)
+            orders.append((order_id, order_date, prices[fruit_id] * quantity, quantity, self.client_id(rng), fruit_id))
+            if order_date >= queue_from:
+                queue.append((order_id, order_date))
+            else:
+                delivery_date = datetime.datetime.combine(
+                    order_date + datetime.timedelta(days=lead_days + rng.randrange(4)),
+                    datetime.time(rng.randrange(8, 21)))
+                deliveries.append((self.base["Delivery_With_Archive"] + index + 1, delivery_date, order_id, order_date))
+        copy_rows(cursor, "Orders", ("Id", "Creation_date", "Total_price", "Item_quantity", "Client_Id", "Fruit_Id"),
+                  orders)
+        copy_rows(cursor, "Delivery", ("Id", "Delivery_date", "Order_Id", "Order_Creation_date"), deliveries)
+        copy_rows(cursor, "Delivery_Queue", ("Order_Id", "Creation_date"), queue)
+        return {"Orders": len(orders), "Delivery": len(deliveries), "Delivery_Queue": len(queue)}
+
+    def reviews(self, cursor, chunk, start, end):
+        rng = self.rng("reviews", chunk)
+        reviews = []
+        for index, fruit_id in zip(range(start, end), self.fruit_ids(rng, end - start)):
+            text = " ".join(rng.choices(REVIEW_WORDS, k=rng.randint(3, 15)))
+            evaluation = rng.choices(range(1, 6), weights=EVALUATION_WEIGHTS)[0]
+            reviews.append((self.base["Reviews"] + index + 1, text, evaluation, self.client_id(rng), fruit_id))
+        copy_rows(cursor, "Reviews", ("Id", "Review_Text", "Evaluation", "Client_Id", "Fruit_Id"), reviews)
+        return {"Reviews": len(reviews)}
+
+
+_worker_conn = None
+_worker_generator = None
+
+
+def _init_worker(dsn, context):
+    global _worker_conn, _worker_generator
+    _worker_conn = psycopg2.connect(dsn)
+    _worker_generator = ChunkGenerator(context)
+
+
+def _load_chunk(task):
+    kind, chunk, start, end = task
+    with _worker_conn.cursor() as cursor:
+        try:
+            cursor.execute(BYPASS_TRIGGERS)
+            loaded = getattr(_worker_generator, kind)(cursor, chunk, start, end)
+            _worker_conn.commit()
+        except Exception:
+            _worker_conn.rollback()
+            raise
+    return loaded
+
+
+def chunk_tasks(counts):
+    tasks = [("staff", 0, 0, counts["admins"] + counts["employees"])]
+    for kind in ("clients", "orders", "reviews"):
+        for chunk, start in enumerate(range(0, counts[kind], CHUNK_ROWS)):
+            tasks.append((kind, chunk, start, min(start + CHUNK_ROWS, counts[kind])))
+    # Длинные задания заказов первыми: последнее задание не остаётся одно в конце
+    return sorted(tasks, key=lambda task: task[0] != "orders")
+
+
+def prepare(cursor, seed, counts, months, today, truncate):
+    if truncate:
+        cursor.execute(TRUNCATE)
+
+    first_day = (today.replace(day=1) - datetime.timedelta(days=1)).replace(day=1)
+    for _ in range(months - 1):
+        first_day = (first_day - datetime.timedelta(days=1)).replace(day=1)
+    cursor.execute(ENSURE_PARTITIONS, (first_day, today) * 2)
+    missing = [row[0] for row in cursor.fetchall()]
+    if missing:
+        raise ValueError(f"Нет секций заказов (месяцы в архиве?): {', '.join(missing)}")
+
+    base = {}
+    for table in ID_TABLES:
+        cursor.execute(f"SELECT COALESCE(MAX(Id), 0) FROM {table}")
+        base[table] = cursor.fetchone()[0]
+    cursor.execute("SELECT Id, LOWER(Role_Name) FROM Roles")
+    roles = {name: role_id for role_id, name in cursor.fetchall()}
+    cursor.execute("SELECT Id FROM Work_time ORDER BY Id")
+    work_time_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT Id FROM Positions ORDER BY Id")
+    position_ids = [row[0] for row in cursor.fetchall()]
+    if not work_time_ids or not position_ids:
+        raise ValueError("Для сотрудников нужны смены (Work_time) и должности (Positions).")
+    cursor.execute("SELECT Lead_Days FROM Delivery_Settings")
+    row = cursor.fetchone()
+
+    producers, fruits = generate_catalog(seed, counts, base, today)
+    cursor.execute(BYPASS_TRIGGERS)
+    copy_rows(cursor, "Producers", ("Id", "Name", "Country"), producers)
+    copy_rows(cursor, "Fruits", ("Id", "Name", "Creation_date", "Price", "Expiration_date", "Producer_Id", "Stock"),
+              fruits)
+    context = {
+        "seed": seed,
+        "counts": counts,
+        "base": base,
+        "today": today,
+        "first_day": first_day,
+        "lead_days": row[0] if row else 0,
+        "prices": {fruit[0]: fruit[3] for fruit in fruits},
+        "admin_role": roles["admin"],
+        "client_role": roles["client"],
+        "employee_role": roles["employee"],
+        "work_time_ids": work_time_ids,
+        "position_ids": position_ids,
+    }
+    return context, {"Producers": len(producers), "Fruits": len(fruits)}
+
+
+def finish():
+    # Сводки, которые при обычной работе ведут отключённые при загрузке триггеры
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(SYNC_SEQUENCES)
+            cursor.execute(REBUILD_DELIVERY_DAYS)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    jobs.rebuild_fruit_ratings()
+    jobs.rebuild_client_order_summary()
+    jobs.rebuild_sales_daily()
+    jobs.refresh_employee_directory(force=True)
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(ANALYZE)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def generate(scale=DEFAULT_SCALE, seed=DEFAULT_SEED, workers=DEFAULT_WORKERS, months=DEFAULT_MONTHS,
+             truncate=False, today=None, progress=None):
+    counts = scaled_counts(scale)
+    today = today or datetime.date.today()
+    loaded = {}
+
+    # Справочники и каталог - одной транзакцией с очисткой: при ошибке база остаётся прежней
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            context, loaded = prepare(cursor, seed, counts, months, today, truncate)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    # Отдельные процессы: генерация строк упирается в интерпретатор, потоки не дали бы параллельности.
+    # Каждый процесс держит своё соединение и грузит куски отдельными транзакциями COPY
+    tasks = chunk_tasks(counts)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=(db.load_config()["dsn"], context)) as executor:
+        for done, result in enumerate(executor.map(_load_chunk, tasks), 1):
+            for table, rows in result.items():
+                loaded[table] = loaded.get(table, 0) + rows
+            if progress:
+                progress(done, len(tasks), loaded)
+
+    finish()
+    return loaded
+
+
+def run(scale=DEFAULT_SCALE, seed=DEFAULT_SEED, workers=DEFAULT_WORKERS, months=DEFAULT_MONTHS, truncate=False,
+        today=None):
+    started = time.monotonic()
+
+    def progress(done, total, loaded):
+        print(f"\rЗагружено кусков: {done}/{total}, строк: {sum(loaded.values())}", end="", flush=True)
+
+    loaded = generate(scale, seed, workers, months, truncate, today, progress)
+    elapsed = time.monotonic() - started
+    print()
+    for table, rows in loaded.items():
+        print(f"{table}: {rows}")
+    total = sum(loaded.values())
+    print(f"Всего строк: {total} за {elapsed:.1f} с ({total / elapsed:.0f} строк/с)")
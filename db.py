@@ -0,0 +1,309 @@
+import os
+import time
+import itertools
+import threading
+import configparser
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+import instrumentation
+
+CONFIG_FILE = os.environ.get("FRUIT_SHOP_CONFIG", "fruit_shop.ini")
+
+DEFAULT_DSN = "host=localhost port=5432 dbname=fruit_shop user=kosmp password=123456"
+
+
+def load_config():
+    parser = configparser.ConfigParser()
+    parser.read(CONFIG_FILE)
+    section = parser["database"] if parser.has_section("database") else {}
+
+    def option(env_name, key, default):
+        return os.environ.get(env_name, section.get(key, default))
+
+    return {
+        "dsn": option("FRUIT_SHOP_DSN", "dsn", DEFAULT_DSN),
+        "min_size": int(option("FRUIT_SHOP_POOL_MIN", "pool_min", 1)),
+        "max_size": int(option("FRUIT_SHOP_POOL_MAX", "pool_max", 10)),
+        "health_check_interval": float(option("FRUIT_SHOP_HEALTH_CHECK_INTERVAL", "health_check_interval", 30)),
+        "connect_retries": int(option("FRUIT_SHOP_CONNECT_RETRIES", "connect_retries", 5)),
+        "connect_backoff": float(option("FRUIT_SHOP_CONNECT_BACKOFF", "connect_backoff", 0.5)),
+        # Несколько реплик разделяются ";" (в строке libpq есть пробелы)
+        "replica_dsns": [dsn.strip() for dsn in option("FRUIT_SHOP_REPLICA_DSNS", "replica_dsns", "").split(";")
+                         if dsn.strip()],
+        "replica_max_lag": float(option("FRUIT_SHOP_REPLICA_MAX_LAG", "replica_max_lag", 5)),
+        "replica_check_interval": float(option("FRUIT_SHOP_REPLICA_CHECK_INTERVAL", "replica_check_interval", 2)),
+        "read_your_writes": float(option("FRUIT_SHOP_READ_YOUR_WRITES", "read_your_writes", 5)),
+        "audit_flush_interval": float(option("FRUIT_SHOP_AUDIT_FLUSH_INTERVAL", "audit_flush_interval", 1)),
+        "audit_batch_size": int(option("FRUIT_SHOP_AUDIT_BATCH_SIZE", "audit_batch_size", 500)),
+        "audit_queue_size": int(option("FRUIT_SHOP_AUDIT_QUEUE_SIZE", "audit_queue_size", 10000)),
+        # Пустое значение - не сохранять незаписанные при остановке события
+        "audit_spool": option("FRUIT_SHOP_AUDIT_SPOOL", "audit_spool", "audit_spool.jsonl"),
+        "employee_directory_debounce": float(option("FRUIT_SHOP_EMPLOYEE_DIRECTORY_DEBOUNCE",
+                                                    "employee_directory_debounce", 1)),
+        "employee_directory_max_delay": float(option("FRUIT_SHOP_EMPLOYEE_DIRECTORY_MAX_DELAY",
+                                                     "employee_directory_max_delay", 10)),
+    }
+
+
+POOL_OPTIONS = ("min_size", "max_size", "health_check_interval", "connect_retries", "connect_backoff")
+
+# Отставание реплики, секунды. Догнавшая реплика (всё полученное WAL применено) отстаёт на 0,
+# иначе - на возраст последней применённой транзакции
+REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+    END
+"""
+
+_local = threading.local()
+
+
+def note_write():
+    _local.last_write = time.monotonic()
+
+
+def wrote_within(seconds):
+    last_write = getattr(_local, "last_write", None)
+    return last_write is not None and time.monotonic() - last_write < seconds
+
+
+class PrimaryConnection(instrumentation.InstrumentedConnection):
+    # Фиксация на основном сервере открывает окно "чтения своих записей" для этого потока (клиента)
+    def commit(self):
+        result = super().commit()
+        note_write()
+        return result
+
+
+class ConnectionPool:
+    def __init__(self, dsn, min_size=1, max_size=10, health_check_interval=30,
+                 connect_retries=5, connect_backoff=0.5, connection_factory=instrumentation.InstrumentedConnection):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.connect_retries = connect_retries
+        self.connect_backoff = connect_backoff
+        self.connection_factory = connection_factory
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}
+
+    def _with_backoff(self, action):
+        attempt = 0
+        while True:
+            try:
+                return action()
+            except psycopg2.OperationalError:
+                attempt += 1
+                if attempt > self.connect_retries:
+                    raise
+                time.sleep(self.connect_backoff * 2 ** (attempt - 1))
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = self._with_backoff(
+                        lambda: pool.ThreadedConnectionPool(self.min_size, self.max_size, self.dsn,
+                                                   connection_factory=self.connection_factory))
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        self._slots.acquire()
+        try:
+            connections = self._ensure_pool()
+            while True:
+                conn = self._with_backoff(connections.getconn)
+                if self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def putconn(self, conn, broken=False):
+        try:
+            if broken or conn.closed:
+                self._discard(conn)
+                return
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn)
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._last_used.clear()
+
+
+class Replica:
+    def __init__(self, pool):
+        self.pool = pool
+        self.lag = None
+        self.checked_at = None
+        self.check_lock = threading.Lock()
+
+
+class ReadRouter:
+    # Чтение уходит на реплики по кругу, если реплика отвечает и отстаёт не больше max_lag секунд;
+    # иначе, а также в течение read_your_writes секунд после своей записи - на основной сервер
+    def __init__(self, primary, replicas, max_lag=5, check_interval=2, read_your_writes=5):
+        self.primary = primary
+        self.replicas = [Replica(replica) for replica in replicas]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.read_your_writes = read_your_writes
+        self._turn = itertools.count()
+        # Куда ушли чтения: replica, primary (реплик нет или все недоступны/отстают), own_write
+        self.routed = {"replica": 0, "primary": 0, "own_write": 0}
+
+    def _refresh_lag(self, replica):
+        # Проверку выполняет один поток, остальные пока используют прежнее значение
+        if not replica.check_lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                conn = replica.pool.getconn()
+            except psycopg2.Error:
+                replica.lag = None
+            else:
+                broken = False
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(REPLICA_LAG)
+                        replica.lag = float(cursor.fetchone()[0])
+                except psycopg2.Error:
+                    broken = True
+                    replica.lag = None
+                finally:
+                    replica.pool.putconn(conn, broken)
+            replica.checked_at = time.monotonic()
+        finally:
+            replica.check_lock.release()
+
+    def _is_usable(self, replica):
+        if replica.checked_at is None or time.monotonic() - replica.checked_at >= self.check_interval:
+            self._refresh_lag(replica)
+        return replica.lag is not None and replica.lag <= self.max_lag
+
+    def read_pool(self):
+        if self.replicas and wrote_within(self.read_your_writes):
+            self.routed["own_write"] += 1
+            return self.primary
+        start = next(self._turn)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._is_usable(replica):
+                self.routed["replica"] += 1
+                return replica.pool
+        self.routed["primary"] += 1
+        return self.primary
+
+    def mark_failed(self, pool):
+        for replica in self.replicas:
+            if replica.pool is pool:
+                replica.lag = None
+                replica.checked_at = time.monotonic()
+
+    def close(self):
+        for replica in self.replicas:
+            replica.pool.close()
+
+
+_pool = None
+_router = None
+_pool_lock = threading.Lock()
+
+
+def _create_pools():
+    global _pool, _router
+    config = load_config()
+    options = {key: config[key] for key in POOL_OPTIONS}
+    primary = ConnectionPool(config["dsn"], connection_factory=PrimaryConnection, **options)
+    # Недоступная реплика не должна задерживать чтение: без повторных попыток подключения
+    replicas = [ConnectionPool(dsn, **dict(options, min_size=0, connect_retries=0))
+                for dsn in config["replica_dsns"]]
+    _router = ReadRouter(primary, replicas, config["replica_max_lag"], config["replica_check_interval"],
+                         config["read_your_writes"])
+    _pool = primary
+
+
+def get_pool():
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _create_pools()
+    return _pool
+
+
+def get_router():
+    if _router is None:
+        get_pool()
+    return _router
+
+
+def close_pool():
+    global _pool, _router
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _router.close()
+            _pool = None
+            _router = None
+
+
+@contextmanager
+def connection(read_only=False):
+    # read_only=True: только чтение, соединение может быть взято с реплики
+    router = get_router() if read_only else None
+    connections = router.read_pool() if read_only else get_pool()
+    try:
+        conn = connections.getconn()
+    except psycopg2.OperationalError:
+        if connections is get_pool():
+            raise
+        router.mark_failed(connections)
+        connections = get_pool()
+        conn = connections.getconn()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        if read_only:
+            router.mark_failed(connections)
+        raise
+    finally:
+        connections.putconn(conn, broken)
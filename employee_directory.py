@@ -0,0 +1,94 @@
+import threading
+import time
+
+import db
+import jobs
+import notifications
+
+
+class DirectoryRefresher(threading.Thread):
+    # Обновляет справочник сотрудников (Employee_Directory) по NOTIFY employee_directory_changed. Обновление
+    # откладывается на debounce секунд после последнего изменения, но не больше чем на max_delay после первого:
+    # серия изменений (добавление сотрудника с должностями, пакетная правка зарплат) - одно обновление.
+    # Процессы, получившие одно уведомление, обновляют справочник один раз: RefreshEmployeeDirectory
+    # пропускает обновление, если справочник уже актуален
+    def __init__(self, debounce=1.0, max_delay=10.0, retry_delay=5.0):
+        super().__init__(name="employee-directory", daemon=True)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.refreshes = 0
+        self._condition = threading.Condition()
+        self._first_change = None
+        self._last_change = None
+        self._stopped = False
+
+    def changed(self, payload=None, delay=0.0):
+        with self._condition:
+            now = time.monotonic() + delay
+            if self._first_change is None:
+                self._first_change = now
+            self._last_change = max(now, self._last_change or now)
+            self._condition.notify()
+
+    def _wait_due(self):
+        with self._condition:
+            while not self._stopped:
+                if self._first_change is None:
+                    self._condition.wait()
+                    continue
+                due = min(self._last_change + self.debounce, self._first_change + self.max_delay)
+                remaining = due - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            self._first_change = self._last_change = None
+            return not self._stopped
+
+    def _refresh(self):
+        try:
+            if jobs.refresh_employee_directory():
+                self.refreshes += 1
+        except Exception as e:
+            print(f"Справочник сотрудников: ошибка обновления, повтор через {self.retry_delay:g} с: {e}")
+            if not self._stopped:
+                self.changed(delay=self.retry_delay)
+
+    def run(self):
+        while self._wait_due():
+            self._refresh()
+        # Остановка: уведомление о последних изменениях этого процесса могло ещё не прийти,
+        # поэтому справочник проверяется без ожидания (если он актуален, это одно чтение)
+        self._refresh()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.join()
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start():
+    # Подписка сразу даёт уведомление без данных (notifications.Listener после подключения):
+    # изменения, сделанные пока ни один процесс не слушал, применяются при запуске
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            config = db.load_config()
+            _refresher = DirectoryRefresher(config["employee_directory_debounce"],
+                                            config["employee_directory_max_delay"])
+            _refresher.start()
+            notifications.subscribe("employee_directory_changed", _refresher.changed)
+    return _refresher
+
+
+def stop():
+    global _refresher
+    with _refresher_lock:
+        if _refresher is not None:
+            _refresher.stop()
+            _refresher = None
@@ -0,0 +1,212 @@
+import csv
+import io
+import json
+import sys
+
+import db
+
+IMPORT_COLUMNS = ("name", "creation_date", "price", "expiration_date", "producer", "country")
+REQUIRED_COLUMNS = ("name", "creation_date", "price", "expiration_date", "producer")
+
+CREATE_STAGING = """
+    CREATE TEMP TABLE Fruit_Import (
+        Line_No bigserial,
+        Name text,
+        Creation_date text,
+        Price text,
+        Expiration_date text,
+        Producer text,
+        Country text,
+        Producer_Id integer,
+        Reject_Reason text
+    ) ON COMMIT DROP;
+
+    CREATE OR REPLACE FUNCTION pg_temp.is_valid_date(value text) RETURNS boolean AS $$
+    BEGIN
+        PERFORM value::date;
+        RETURN true;
+    EXCEPTION WHEN others THEN
+        RETURN false;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+VALIDATE_ROWS = r"""
+    UPDATE Fruit_Import SET
+        Name = btrim(Name),
+        Creation_date = btrim(Creation_date),
+        Price = btrim(Price),
+        Expiration_date = btrim(Expiration_date),
+        Producer = btrim(Producer),
+        Country = NULLIF(btrim(Country), '');
+
+    UPDATE Fruit_Import SET Reject_Reason = CASE
+        WHEN COALESCE(Name, '') = '' THEN 'пустое наименование'
+        WHEN length(Name) > 50 THEN 'наименование длиннее 50 символов'
+        WHEN COALESCE(Creation_date, '') !~ '^\d{4}-\d{2}-\d{2}$' THEN 'некорректная дата изготовления'
+        WHEN NOT pg_temp.is_valid_date(Creation_date) THEN 'некорректная дата изготовления'
+        WHEN Creation_date::date > CURRENT_DATE THEN 'дата изготовления в будущем'
+        WHEN COALESCE(Price, '') !~ '^\d{1,9}$' THEN 'некорректная цена'
+        WHEN Price::integer <= 0 THEN 'некорректная цена'
+        WHEN COALESCE(Expiration_date, '') !~ '^\d{1,9}$' THEN 'некорректный срок годности'
+        WHEN Expiration_date::integer <= 0 THEN 'некорректный срок годности'
+        WHEN COALESCE(Producer, '') = '' THEN 'не указан производитель'
+        WHEN length(Producer) > 50 OR length(Country) > 50 THEN 'производитель или страна длиннее 50 символов'
+    END;
+"""
+
+RESOLVE_PRODUCERS = """
+    UPDATE Fruit_Import s SET Producer_Id = p.Id
+    FROM (SELECT LOWER(Name) AS Name_Key, MIN(Id) AS Id FROM Producers GROUP BY LOWER(Name)) p
+    WHERE s.Reject_Reason IS NULL AND p.Name_Key = LOWER(s.Producer);
+
+    UPDATE Fruit_Import SET Reject_Reason = 'новый производитель без страны'
+    WHERE Reject_Reason IS NULL AND Producer_Id IS NULL AND Country IS NULL;
+
+    INSERT INTO Producers (Name, Country)
+    SELECT DISTINCT ON (LOWER(Producer)) Producer, Country
+    FROM Fruit_Import
+    WHERE Reject_Reason IS NULL AND Producer_Id IS NULL
+    ORDER BY LOWER(Producer), Line_No;
+
+    UPDATE Fruit_Import s SET Producer_Id = p.Id
+    FROM (SELECT LOWER(Name) AS Name_Key, MIN(Id) AS Id FROM Producers GROUP BY LOWER(Name)) p
+    WHERE s.Reject_Reason IS NULL AND s.Producer_Id IS NULL AND p.Name_Key = LOWER(s.Producer);
+"""
+
+# Одна и та же пара (фрукт, производитель) в файле: побеждает последняя строка
+REJECT_DUPLICATES = """
+    UPDATE Fruit_Import s SET Reject_Reason = 'перекрыта строкой ' || d.Last_Line
+    FROM (
+        SELECT LOWER(Name) AS Name_Key, Producer_Id, MAX(Line_No) AS Last_Line
+        FROM Fruit_Import
+        WHERE Reject_Reason IS NULL
+        GROUP BY LOWER(Name), Producer_Id
+        HAVING COUNT(*) > 1
+    ) d
+    WHERE s.Reject_Reason IS NULL AND LOWER(s.Name) = d.Name_Key
+      AND s.Producer_Id = d.Producer_Id AND s.Line_No < d.Last_Line;
+"""
+
+UPDATE_EXISTING = """
+    UPDATE Fruits f SET
+        Creation_date = s.Creation_date::date,
+        Price = s.Price::integer,
+        Expiration_date = s.Expiration_date::integer
+    FROM Fruit_Import s
+    WHERE s.Reject_Reason IS NULL AND f.Producer_Id = s.Producer_Id AND LOWER(f.Name) = LOWER(s.Name)
+"""
+
+INSERT_NEW = """
+    INSERT INTO Fruits (Name, Creation_date, Price, Expiration_date, Producer_Id)
+    SELECT s.Name, s.Creation_date::date, s.Price::integer, s.Expiration_date::integer, s.Producer_Id
+    FROM Fruit_Import s
+    WHERE s.Reject_Reason IS NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM Fruits f
+          WHERE f.Producer_Id = s.Producer_Id AND LOWER(f.Name) = LOWER(s.Name)
+      )
+    ORDER BY s.Line_No
+"""
+
+
+class JsonLinesAsCsv(io.RawIOBase):
+    # Поток для COPY: JSONL переводится в CSV построчно, файл целиком в память не читается
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = b""
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text, lineterminator="\n")
+        self._writer.writerow(IMPORT_COLUMNS)
+        self._take_text()
+
+    def _take_text(self):
+        self._buffer += self._text.getvalue().encode("utf-8")
+        self._text.seek(0)
+        self._text.truncate()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = {}
+            if not isinstance(record, dict):
+                record = {}
+            self._writer.writerow(
+                "" if record.get(column) is None else str(record.get(column)) for column in IMPORT_COLUMNS)
+            self._take_text()
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def import_fruits(source, file_format="csv"):
+    if file_format == "jsonl":
+        source = JsonLinesAsCsv(iter(source))
+        columns_in_header = IMPORT_COLUMNS
+    else:
+        header = next(csv.reader([source.readline()]))
+        columns_in_header = [column.strip().lower() for column in header]
+        unknown = set(columns_in_header) - set(IMPORT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные столбцы в файле: {', '.join(sorted(unknown))}")
+        missing = set(REQUIRED_COLUMNS) - set(columns_in_header)
+        if missing:
+            raise ValueError(f"В файле нет обязательных столбцов: {', '.join(sorted(missing))}")
+
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_STAGING)
+            copy_header = "HEADER true" if file_format == "jsonl" else "HEADER false"
+            cursor.copy_expert(
+                f"COPY Fruit_Import ({', '.join(columns_in_header)}) FROM STDIN WITH (FORMAT csv, {copy_header})",
+                source)
+            cursor.execute(VALIDATE_ROWS)
+            cursor.execute(RESOLVE_PRODUCERS)
+            cursor.execute(REJECT_DUPLICATES)
+            cursor.execute(UPDATE_EXISTING)
+            updated = cursor.rowcount
+            cursor.execute(INSERT_NEW)
+            inserted = cursor.rowcount
+            cursor.execute("""
+                SELECT Line_No, Name, Reject_Reason
+                FROM Fruit_Import
+                WHERE Reject_Reason IS NOT NULL
+                ORDER BY Line_No
+            """)
+            rejected = cursor.fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return inserted, updated, rejected
+
+
+def run_import(path, file_format=None, show_rejected=20):
+    if file_format is None:
+        file_format = "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+
+    if path == "-":
+        inserted, updated, rejected = import_fruits(sys.stdin, file_format)
+    else:
+        with open(path, encoding="utf-8", newline="") as source:
+            inserted, updated, rejected = import_fruits(source, file_format)
+
+    print(f"Добавлено фруктов: {inserted}, обновлено: {updated}, отклонено строк: {len(rejected)}")
+    if rejected:
+        print("Строка | Наименование | Причина")
+        for line_no, name, reason in rejected[:show_rejected]:
+            print(f"{line_no} | {name} | {reason}")
+        if len(rejected) > show_rejected:
+            print(f"... и ещё {len(rejected) - show_rejected}")
@@ -0,0 +1,288 @@
+import atexit
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+# Границы корзин гистограммы задержек, мс
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Модули-обёртки: время относится к первой функции за их пределами
+SKIP_MODULES = {"instrumentation", "db", "paging", "prepared", "contextlib"}
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+EXPLAINABLE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|VALUES|EXECUTE)\b", re.IGNORECASE)
+
+slow_query_ms = float(os.environ.get("FRUIT_SHOP_SLOW_QUERY_MS", 0))
+logger = logging.getLogger("fruit_shop.sql")
+
+_lock = threading.Lock()
+_local = threading.local()
+_statements = {}
+_actions = {}
+_rollbacks = {}
+
+
+class StatementStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, elapsed, rows, failed):
+        self.calls += 1
+        self.errors += failed
+        self.rows += rows
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        elapsed_ms = elapsed * 1000
+        for index, bound in enumerate(BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+
+@functools.lru_cache(maxsize=4096)
+def function_name(code):
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    if module in SKIP_MODULES or "psycopg2" in code.co_filename:
+        return None
+    return f"{module}.{code.co_name}"
+
+
+def caller():
+    frame = sys._getframe(1)
+    while frame is not None:
+        name = function_name(frame.f_code)
+        if name is not None:
+            return name
+        frame = frame.f_back
+    return "?"
+
+
+@functools.lru_cache(maxsize=4096)
+def statement_key(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    elif not isinstance(sql, str):
+        sql = str(sql)
+    return " ".join(sql.split())
+
+
+def record(sql, elapsed, rows=0, failed=False):
+    key = (caller(), statement_key(sql))
+    with _lock:
+        stats = _statements.get(key)
+        if stats is None:
+            stats = _statements[key] = StatementStats()
+        stats.add(elapsed, rows, failed)
+    action = getattr(_local, "action", None)
+    if action is not None:
+        action[1] += 1
+
+
+def begin_action(name):
+    # Действие пользователя (пункт меню): считаем, сколько обращений к БД оно стоило
+    end_action()
+    _local.action = [name, 0]
+
+
+def end_action():
+    action = getattr(_local, "action", None)
+    if action is None:
+        return
+    _local.action = None
+    name, round_trips = action
+    with _lock:
+        stats = _actions.setdefault(name, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += round_trips
+        stats[2] = max(stats[2], round_trips)
+
+
+def configure_slow_log():
+    path = os.environ.get("FRUIT_SHOP_SLOW_QUERY_LOG")
+    if not logger.handlers:
+        handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def log_slow(conn, sql, explain_sql, elapsed):
+    # В журнал пишется текст запроса без параметров: среди них бывают пароли (вход, регистрация).
+    # План строится по запросу с параметрами, и строковые константы в нём тоже скрываются
+    configure_slow_log()
+    plan = STRING_LITERAL.sub("'?'", explain(conn, explain_sql))
+    logger.info("Медленный запрос %.1f мс в %s:\n%s\n%s", elapsed * 1000, caller(), statement_key(sql), plan)
+
+
+def explain(conn, sql):
+    if not EXPLAINABLE.match(sql):
+        return "(план не строится для этого типа запроса)"
+    if conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_INERROR:
+        return "(план недоступен: транзакция прервана)"
+    # EXPLAIN без ANALYZE запрос не выполняет; точка сохранения защищает транзакцию от ошибки
+    in_transaction = not conn.autocommit
+    with extensions.cursor(conn) as cursor:
+        try:
+            if in_transaction:
+                cursor.execute("SAVEPOINT explain_slow_query")
+            cursor.execute("EXPLAIN " + sql)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            if in_transaction:
+                cursor.execute("RELEASE SAVEPOINT explain_slow_query")
+            return plan
+        except psycopg2.Error as e:
+            if in_transaction:
+                cursor.execute("ROLLBACK TO SAVEPOINT explain_slow_query")
+            return f"(не удалось построить план: {e})"
+
+
+class InstrumentedCursor(extensions.cursor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sql = None
+        self._explain_sql = None
+        self._elapsed = 0.0
+
+    def execute(self, query, vars=None):
+        self._sql = query
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, vars)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            record(query, elapsed, 0 if failed or self.name else max(self.rowcount, 0), failed)
+            if not failed and slow_query_ms:
+                if self.name:
+                    # Серверный курсор: основное время уходит на fetch, решаем при закрытии
+                    self._explain_sql = self.mogrify(query, vars).decode("utf-8", "replace")
+                    self._elapsed = elapsed
+                elif elapsed * 1000 >= slow_query_ms:
+                    log_slow(self.connection, query, self.query.decode("utf-8", "replace"), elapsed)
+
+    def _fetch(self, method, *args):
+        if not self.name:
+            return method(*args)
+        started = time.perf_counter()
+        failed = True
+        try:
+            rows = method(*args)
+            failed = False
+            return rows
+        finally:
+            elapsed = time.perf_counter() - started
+            self._elapsed += elapsed
+            fetched = 0 if failed else (len(rows) if isinstance(rows, list) else int(rows is not None))
+            record(self._sql, elapsed, fetched, failed)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().copy_expert(sql, file, size)
+            failed = False
+            return result
+        finally:
+            record(sql, time.perf_counter() - started, 0 if failed else max(self.rowcount, 0), failed)
+
+    def close(self):
+        explain_sql, self._explain_sql = self._explain_sql, None
+        super().close()
+        if explain_sql and self._elapsed * 1000 >= slow_query_ms:
+            log_slow(self.connection, self._sql, explain_sql, self._elapsed)
+
+
+class InstrumentedConnection(extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = InstrumentedCursor
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            record("COMMIT", time.perf_counter() - started)
+
+    def rollback(self):
+        # Откат при возврате соединения в пул (db.putconn) - штатное завершение, а не ошибка
+        if sys._getframe(1).f_globals.get("__name__") != "db":
+            function = caller()
+            with _lock:
+                _rollbacks[function] = _rollbacks.get(function, 0) + 1
+        started = time.perf_counter()
+        try:
+            return super().rollback()
+        finally:
+            record("ROLLBACK", time.perf_counter() - started)
+
+
+def reset():
+    with _lock:
+        _statements.clear()
+        _actions.clear()
+        _rollbacks.clear()
+
+
+def print_summary(file=sys.stderr, limit=30):
+    end_action()
+    with _lock:
+        statements = sorted(_statements.items(), key=lambda item: item[1].total, reverse=True)
+        actions = sorted(_actions.items())
+        rollbacks = sorted(_rollbacks.items(), key=lambda item: item[1], reverse=True)
+
+    print("\n=== Профиль обращений к БД ===", file=file)
+    print(f"{'Функция':32} | {'Вызовы':>6} | {'Ошибки':>6} | {'Строки':>7} | {'Всего мс':>9} | "
+          f"{'Сред. мс':>8} | {'Макс. мс':>8} | Запрос", file=file)
+    for (function, sql), stats in statements[:limit]:
+        print(f"{function:32} | {stats.calls:6} | {stats.errors:6} | {stats.rows:7} | {stats.total * 1000:9.1f} | "
+              f"{stats.total / stats.calls * 1000:8.2f} | {stats.max * 1000:8.2f} | {sql[:80]}", file=file)
+        histogram = " ".join(f"≤{bound}:{count}" for bound, count in zip(BUCKETS_MS, stats.buckets) if count)
+        if stats.buckets[-1]:
+            histogram += f" >{BUCKETS_MS[-1]}:{stats.buckets[-1]}"
+        print(f"{'':32}   мс: {histogram}", file=file)
+    if len(statements) > limit:
+        print(f"... и ещё {len(statements) - limit} запросов", file=file)
+
+    if actions:
+        print("\nОбращений к БД на действие пользователя:", file=file)
+        for name, (count, round_trips, most) in actions:
+            print(f"{name:32} | действий: {count:5} | в среднем: {round_trips / count:6.1f} | максимум: {most}",
+                  file=file)
+
+    if rollbacks:
+        print("\nОткаты транзакций:", file=file)
+        for function, count in rollbacks:
+            print(f"{function:32} | {count}", file=file)
+
+
+def setup(profile=False, slow_ms=None):
+    global slow_query_ms
+    if slow_ms is not None:
+        slow_query_ms = slow_ms
+    if profile or os.environ.get("FRUIT_SHOP_PROFILE"):
+        atexit.register(print_summary)
@@ -0,0 +1,257 @@
+import datetime
+import time
+
+import db
+import queries
+
+PLAN_BATCH_SIZE = 1000
+
+PARTITION_MONTHS_AHEAD = 3
+
+# Месяцы, секции которых процесс уже проверил
+_partition_months = set()
+
+
+def apply_salary_adjustments():
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.APPLY_SALARY_ADJUSTMENTS)
+            applied = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+
+def pending_salary_adjustments():
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.PENDING_SALARY_ADJUSTMENTS)
+        return cursor.fetchone()[0]
+
+
+def rebuild_fruit_ratings(apply=True):
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.REBUILD_FRUIT_RATINGS, (apply,))
+            mismatched = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return mismatched
+
+
+def rebuild_client_order_summary(apply=True):
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.REBUILD_CLIENT_ORDER_SUMMARY, (apply,))
+            mismatched = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return mismatched
+
+
+def apply_sales_changes():
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.APPLY_SALES_CHANGES)
+            applied = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+
+def pending_sales_changes():
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.PENDING_SALES_CHANGES)
+        return cursor.fetchone()[0]
+
+
+def rebuild_sales_daily(apply=True):
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.REBUILD_SALES_DAILY, (apply,))
+            mismatched = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return mismatched
+
+
+def plan_deliveries(batch_size=PLAN_BATCH_SIZE):
+    # Каждый пакет - отдельная транзакция: блокировки очереди и дней держатся недолго.
+    # Неполный пакет значит, что очередь пуста, места кончились или остаток разбирают другие планировщики
+    planned = 0
+    while True:
+        with db.connection() as conn, conn.cursor() as cursor:
+            try:
+                cursor.execute(queries.PLAN_DELIVERIES, (batch_size,))
+                batch = cursor.fetchone()[0]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        planned += batch
+        if batch < batch_size:
+            return planned
+
+
+def pending_deliveries():
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.PENDING_DELIVERIES)
+        return cursor.fetchone()[0]
+
+
+def delivery_load():
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.DELIVERY_SETTINGS)
+        settings = cursor.fetchone()
+        cursor.execute(queries.DELIVERY_LOAD)
+        return settings, cursor.fetchall()
+
+
+def set_delivery_capacity(capacity, first_day=None, last_day=None):
+    # Без дат меняется вместимость по умолчанию и будущих дней, у которых она не задана отдельно
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            if first_day is None and last_day is None:
+                cursor.execute(queries.SET_FUTURE_DELIVERY_CAPACITY, (capacity,))
+                cursor.execute(queries.SET_DEFAULT_DELIVERY_CAPACITY, (capacity,))
+            else:
+                cursor.execute(queries.SET_DELIVERY_CAPACITY, (capacity, first_day or last_day, last_day or first_day))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def rebalance_deliveries(batch_size=PLAN_BATCH_SIZE):
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.REBALANCE_DELIVERIES)
+            moved = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return moved, plan_deliveries(batch_size)
+
+
+def maintain_order_partitions(months_ahead=PARTITION_MONTHS_AHEAD, keep_months=None):
+    # Секции на months_ahead месяцев вперёд; при keep_months месяцы старше него уходят в archive
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.ENSURE_ORDER_PARTITIONS, (months_ahead,))
+            created = cursor.fetchone()[0]
+            archived = 0
+            if keep_months is not None:
+                cursor.execute(queries.ARCHIVE_ORDER_PARTITIONS, (keep_months,))
+                archived = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return created, archived
+
+
+def ensure_order_partition(day=None):
+    # Вызывается до оформления заказа, в отдельной короткой транзакции: CreateOrderPartition блокирует
+    # Orders, и внутри транзакции заказа с заблокированными строками Fruits это грозило бы взаимоблокировкой.
+    # Если вызова не было, заказ ляжет в секцию по умолчанию
+    month = (day or datetime.date.today()).replace(day=1)
+    if month in _partition_months:
+        return False
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.CREATE_ORDER_PARTITION, (month,))
+            created = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    _partition_months.add(month)
+    return created
+
+
+def order_partitions():
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.ORDER_PARTITIONS)
+        return cursor.fetchall()
+
+
+def reprice_fruits(percentage=None, fruit=None, producer=None, country=None, expires_within=None, markdown=None,
+                   apply=True):
+    # markdown - ступени уценки [(дней до окончания срока, процент), ...] вместо percentage
+    days = [days for days, _ in markdown] if markdown else None
+    percents = [percent for _, percent in markdown] if markdown else None
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.REPRICE_FRUITS, (percentage, fruit, producer, country, expires_within,
+                                                    days, percents, apply))
+            changes = cursor.fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return changes
+
+
+def price_history(fruit, limit=20):
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.PRICE_HISTORY, (fruit, limit))
+        return cursor.fetchall()
+
+
+def fruit_stock(fruit=None, limit=50):
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.FRUIT_STOCK, (fruit, fruit, limit))
+        return cursor.fetchall()
+
+
+def restock(fruit, add=None, stock=None):
+    # add - поступление (отрицательное - списание), stock - новый остаток после инвентаризации.
+    # Возвращает (фрукт, остаток) или None, если фрукта нет или списание больше остатка
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            if stock is not None:
+                cursor.execute(queries.SET_FRUIT_STOCK, (stock, fruit))
+            else:
+                cursor.execute(queries.ADD_FRUIT_STOCK, (add, fruit, add))
+            row = cursor.fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return row
+
+
+def refresh_employee_directory(force=False):
+    with db.connection() as conn, conn.cursor() as cursor:
+        try:
+            cursor.execute(queries.REFRESH_EMPLOYEE_DIRECTORY, (force,))
+            refreshed = cursor.fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return refreshed
+
+
+def run_periodically(job, interval, report):
+    # Простой планировщик для manage.py: задание повторяется до Ctrl+C, ошибка не останавливает цикл
+    while True:
+        started = time.monotonic()
+        try:
+            report(job())
+        except Exception as e:
+            print(f"Ошибка задания {job.__name__}: {e}")
+        try:
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            return
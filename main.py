@@ -1,17 +1,25 @@
+import argparse
 import psycopg2
 import re
 import getpass
 from datetime import datetime
 
-conn = psycopg2.connect(
-    host="localhost",
-    port="5432",
-    database="fruit_shop",
-    user="kosmp",
-    password="123456",
-)
+import audit
+import db
+import employee_directory
+import instrumentation
+import jobs
+import migrations
+import paging
+import prepared
+import queries
+import search
+from catalog_cache import catalog
+import notifications
+import session
 
 logged_in = False
+current_session = None
 
 def is_valid_phone(phone):
     return re.match(r'\+375[0-9]{9}', phone) is not None
@@ -19,76 +27,138 @@ def is_valid_phone(phone):
 def is_valid_password(password):
     return len(re.findall(r'\d', password)) >= 4
 
-def select_fruits():
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT Name, Price FROM fruits;")
-        rows = cursor.fetchall()
-        print("\nСписок фруктов:")
-        print("Наименование          | Цена")
-        print("----------------------|------")
-        for row in rows:
-            print(f"{row[0]:22} | {row[1]:>5}")
-
-def get_fruit_info(conn, fruit_name):
-    with conn.cursor() as cursor:
-        cursor.execute("""
-            SELECT fruits.Id, fruits.Name, fruits.Creation_date, fruits.Price, 
-                   fruits.Expiration_date, producers.Name AS Producer_Name, producers.Country
-            FROM fruits
-            JOIN producers ON fruits.Producer_Id = producers.Id
-            WHERE fruits.Name = %s""", (f'{fruit_name}',))
+def validate_registration(first_name, last_name, phone, password):
+    if len(first_name) < 1:
+        raise ValueError("Имя должно содержать не менее 1 символа.")
+    if len(last_name) < 1:
+        raise ValueError("Фамилия должна содержать не менее 1 символа.")
+    if not is_valid_phone(phone):
+        raise ValueError("Некорректный формат телефона. Пример: +375291111111")
+    if not is_valid_password(password):
+        raise ValueError("Пароль должен содержать не менее 4 цифр.")
+
+def fetch_fruits_page(after, limit):
+    if after is None:
+        return paging.stream_rows(queries.FRUITS_FIRST_PAGE, (), limit, read_only=True)
+    return paging.stream_rows(queries.FRUITS_NEXT_PAGE, after, limit, read_only=True)
+
+def format_rating(review_count, rating_sum):
+    if not review_count:
+        return "нет оценок"
+    return f"{rating_sum / review_count:.1f} ({review_count})"
+
+def print_fruits_header():
+    print("\nСписок фруктов:")
+    print("Наименование          | Цена  | Рейтинг")
+    print("----------------------|-------|----------------")
 
-        fruit = cursor.fetchone()
-
-        if fruit:
-            print("\nИнформация о фрукте:")
-            print("ID              : ", fruit[0])
-            print("Наименование    : ", fruit[1])
-            print("Дата создания   : ", fruit[2])
-            print("Цена            : ", fruit[3])
-            print("Срок годности   : ", fruit[4])
-            print("Производитель   : ", f"{fruit[5]} ({fruit[6]})\n")
-            return True
+def select_fruits():
+    paging.browse(
+        fetch_fruits_page,
+        lambda fruit: (fruit[1], fruit[0]),
+        print_fruits_header,
+        lambda fruit: print(f"{fruit[1]:22} | {fruit[2]:>5} | {format_rating(fruit[3], fruit[4])}"),
+        "Фрукты не найдены.",
+    )
+
+def fetch_fruit_info(fruit_name):
+    # Фрукт из кэша каталога и сводка его оценок (None, None - фрукта нет)
+    fruit = catalog.find(fruit_name)
+    if fruit is None:
+        return None, None
+    with db.connection(read_only=True) as conn, conn.cursor() as cursor:
+        prepared.execute(cursor, queries.FRUIT_RATING, (fruit[0],))
+        return fruit, cursor.fetchone()
+
+def get_fruit_info(fruit_name):
+    fruit, rating = fetch_fruit_info(fruit_name)
+
+    if fruit:
+        print("\nИнформация о фрукте:")
+        print("ID              : ", fruit[0])
+        print("Наименование    : ", fruit[1])
+        print("Дата создания   : ", fruit[2])
+        print("Цена            : ", fruit[3])
+        print("Срок годности   : ", fruit[4])
+        print("Производитель   : ", f"{fruit[5]} ({fruit[6]})")
+        if rating and rating[0]:
+            print("Рейтинг         : ", format_rating(rating[0], rating[1]))
+            for evaluation, count in zip(range(5, 0, -1), reversed(rating[2:])):
+                print(f"  {evaluation} ★ {count:6}  {'#' * round(count / rating[0] * 20)}")
         else:
-            print(f"Фрукт с именем '{fruit_name}' не найден.\n")
-            return False
+            print("Рейтинг         : ", format_rating(0, 0))
+        print()
+        return True
+    else:
+        print(f"Фрукт с именем '{fruit_name}' не найден.")
+        suggestions = search.find_fruits(fruit_name, 3)
+        if suggestions:
+            print(f"Возможно, вы имели в виду: {', '.join(fruit[1] for fruit in suggestions)}")
+        print()
+        return False
             
+def search_fruits():
+    text = input("Введите часть названия фрукта: ").strip()
+    if not text:
+        return
+    fruits = search.find_fruits(text)
+    if not fruits:
+        print("Похожих фруктов не найдено.")
+        return
+    print("\nНаименование          | Цена  | Сходство")
+    print("----------------------|-------|---------")
+    for _, name, price, score in fruits:
+        print(f"{name:22} | {price:>5} | {score:.2f}")
+
+def print_review_search_header():
+    print("\nФрукт                 | Оценка | Отзыв")
+    print("----------------------|--------|--------------------------------------------------")
+
+def search_reviews():
+    text = input("Введите слова для поиска в отзывах: ").strip()
+    if not text:
+        return
+    language = input("Язык (ru, en, Enter - оба): ").strip().lower() or None
+    if language is not None and language not in search.REVIEW_LANGUAGES:
+        print("Некорректный язык.")
+        return
+    paging.browse(
+        lambda after, limit: search.fetch_reviews_page(text, language, after, limit),
+        lambda review: (review[4], review[0]),
+        print_review_search_header,
+        lambda review: print(f"{review[1]:22} | {review[3]:^6} | {review[2][:50]}"),
+        "Отзывы не найдены.",
+    )
+
+def search_menu():
+    print("1. Поиск фрукта по названию")
+    print("2. Поиск по отзывам")
+    search_choice = input("\nВыберете операцию: ")
+    if search_choice == "1":
+        search_fruits()
+    elif search_choice == "2":
+        search_reviews()
+
+def fetch_fruit_reviews(fruit_name):
+    with db.connection(read_only=True) as conn, conn.cursor() as cursor:
+        prepared.execute(cursor, queries.FRUIT_REVIEWS, (fruit_name,))
+        return cursor.fetchall()
+
 def get_reviews_for_fruit(fruit_name):
-    with conn.cursor() as cursor:
-        cursor.execute("""
-            SELECT Reviews.Id, Reviews.review_text, Reviews.evaluation, Users.First_Name, Users.Last_Name
-            FROM Reviews
-            JOIN Fruits ON Reviews.Fruit_Id = Fruits.Id
-            JOIN Clients ON Reviews.Client_Id = Clients.Id
-            JOIN Users ON Clients.User_Id = Users.Id
-            WHERE LOWER(Fruits.Name) = LOWER(%s);
-        """, (fruit_name,))
-
-        reviews = cursor.fetchall()
-
-        if reviews:
-            print(f"\nОтзывы о фрукте '{fruit_name}':")
-            print("ID | Текст отзыва                             | Оценка | Клиент ")
-            print("----------------------------------------------------------------")
-            for review in reviews:
-                print(f"{review[0]:2} | {review[1]:40} | {review[2]:^6} | {review[3]:^6} {review[4]:^6}")
-        else:
-            print(f"Отзывов о фрукте '{fruit_name}' не найдено.")
+    reviews = fetch_fruit_reviews(fruit_name)
+
+    if reviews:
+        print(f"\nОтзывы о фрукте '{fruit_name}':")
+        print("ID | Текст отзыва                             | Оценка | Клиент ")
+        print("----------------------------------------------------------------")
+        for review in reviews:
+            print(f"{review[0]:2} | {review[1]:40} | {review[2]:^6} | {review[3]:^6} {review[4]:^6}")
+    else:
+        print(f"Отзывов о фрукте '{fruit_name}' не найдено.")
 
 def view_employees():
-    with conn.cursor() as cursor:
-        cursor.execute("""
-            SELECT Employees.Id, Users.First_Name, Users.Last_Name, Employees.Salary, 
-                   Work_time.start_work, Work_time.end_work, 
-                   array_to_string(ARRAY_AGG(Positions.Name), ', ') as Positions
-            FROM Employees
-            JOIN Users ON Employees.User_Id = Users.Id
-            JOIN Work_time ON Employees.Work_time_Id = Work_time.Id
-            JOIN Positions_Employees ON Employees.Id = Positions_Employees.Employee_Id
-            JOIN Positions ON Positions_Employees.Position_Id = Positions.Id
-            GROUP BY Employees.Id, Users.First_Name, Users.Last_Name, Employees.Salary, 
-                     Work_time.start_work, Work_time.end_work;
-        """)
+    with db.connection(read_only=True) as conn, conn.cursor() as cursor:
+        cursor.execute(queries.EMPLOYEES)
 
         employees = cursor.fetchall()
 
@@ -101,30 +171,25 @@ def view_employees():
         else:
             print("Сотрудники не найдены.")
 
-def get_client_id_by_user_id(conn, user_id):
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT Id FROM Clients WHERE User_Id = %s", (user_id,))
-        client_id = cursor.fetchone()
-        return client_id[0] if client_id else None
-
-def leave_review(conn, fruit_name):
+def leave_review(fruit_name):
     global logged_in
-    global current_user_id
+    global current_session
 
     if not logged_in:
         print("Для оставления отзыва необходимо войти в систему.")
         return
     
-    if not is_client(conn, current_user_id):
+    if not is_client(current_session):
         print("Только клиенты могут оставлять отзыв.")
         return
-    
-    client_id = get_client_id_by_user_id(conn, current_user_id)
+
+    client_id = current_session.client_id
+
     review_text = input("Введите текст отзыва: ")
     evaluation = int(input("Введите оценку (от 1 до 5): "))
 
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT Id FROM Fruits WHERE LOWER(Name) = LOWER(%s);", (fruit_name,))
+    with db.connection() as conn, conn.cursor() as cursor:
+        prepared.execute(cursor, queries.FRUIT_ID_BY_NAME, (fruit_name,))
         fruit_id = cursor.fetchone()
 
         if not fruit_id:
@@ -132,130 +197,236 @@ def leave_review(conn, fruit_name):
             return
 
         try:
-            cursor.execute("CALL AddReview(%s, %s, %s, %s)", 
+            cursor.execute(queries.ADD_REVIEW,
                            (review_text, evaluation, client_id, fruit_id[0]))
             conn.commit()
+            audit.record("review", current_session.user_id, fruit_id=fruit_id[0], evaluation=evaluation)
             print("Отзыв успешно оставлен!")
         except Exception as e:
             conn.rollback()
             print(f"Ошибка при оставлении отзыва: {e}")
 
-def make_order(conn, fruit_name):
-    global logged_in
-    global current_user_id
+def checkout(conn, client_id, items):
+    quantities = {}
+    for fruit_name, quantity in items:
+        if quantity <= 0:
+            raise ValueError("Количество должно быть положительным.")
+        key = fruit_name.lower()
+        quantities[key] = quantities.get(key, 0) + quantity
+
+    if not quantities:
+        raise ValueError("Корзина пуста.")
+
+    with conn.cursor() as cursor:
+        prepared.execute(cursor, queries.CHECKOUT_PRICES, (list(quantities),))
+        fruits = {}
+        for row in cursor.fetchall():
+            fruits.setdefault(row[0], row[1:])
+
+        missing = [name for name in quantities if name not in fruits]
+        if missing:
+            raise ValueError(f"Фрукты не найдены: {', '.join(missing)}")
+
+        fruit_ids, item_quantities, total_prices = [], [], []
+        for key, quantity in quantities.items():
+            fruit_id, _, price = fruits[key]
+            fruit_ids.append(fruit_id)
+            item_quantities.append(quantity)
+            total_prices.append(price * quantity)
+
+        prepared.execute(cursor, queries.RESERVE_STOCK, (fruit_ids, item_quantities))
+        reserved = {row[0] for row in cursor.fetchall()}
+        if len(reserved) < len(fruit_ids):
+            short = [fruit_id for fruit_id in fruit_ids if fruit_id not in reserved]
+            cursor.execute(queries.FRUIT_STOCK_BY_IDS, (short,))
+            raise ValueError("Недостаточно на складе: "
+                             + ", ".join(f"{name} (осталось {stock})" for _, name, stock in cursor.fetchall()))
+
+        prepared.execute(cursor, queries.INSERT_ORDERS, (datetime.now().date(), client_id,
+                                                         fruit_ids, item_quantities, total_prices))
+        orders = cursor.fetchall()
+
+    names = {fruit_id: name for fruit_id, name, _ in fruits.values()}
+    return [(order_id, names[fruit_id], quantity, total_price)
+            for order_id, fruit_id, quantity, total_price in orders]
+
+def read_quantity():
+    try:
+        quantity = int(input("Введите количество фруктов для заказа: "))
+    except ValueError:
+        quantity = 0
+    if quantity <= 0:
+        print("Количество должно быть положительным целым числом.")
+        return None
+    return quantity
 
+def can_order():
     if not logged_in:
         print("Для оформления заказа необходимо войти в систему.")
-        return
-    
-    if not is_client(conn, current_user_id):
+        return False
+
+    if not is_client(current_session):
         print("Только клиенты могут совершать заказ.")
-        return
-    
-    quantity = int(input("Введите количество фруктов для заказа: "))
-    client_id = get_client_id_by_user_id(conn, current_user_id)
-    with conn.cursor() as cursor:
-        try:
-            cursor.execute("SELECT Id, Price FROM Fruits WHERE LOWER(Name) = LOWER(%s);", (fruit_name,))
-            fruit = cursor.fetchone()
+        return False
 
-            if not fruit:
-                raise ValueError("Фрукт не найден.")
-            
-            total_price = fruit[1] * quantity
+    return True
 
-            creation_date = datetime.now().date()
+def make_order(fruit_name):
+    if not can_order():
+        return
 
-            cursor.execute("""
-                INSERT INTO Orders (Creation_date, Total_price, Item_quantity, Client_Id, Fruit_Id)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (creation_date, total_price, quantity, client_id, fruit[0]))
+    quantity = read_quantity()
+    if quantity is None:
+        return
 
+    jobs.ensure_order_partition()
+    with db.connection() as conn:
+        try:
+            orders = checkout(conn, current_session.client_id, [(fruit_name, quantity)])
             conn.commit()
+            audit.record("order", current_session.user_id, orders=[order[0] for order in orders],
+                         total=sum(order[3] for order in orders))
             print("Заказ успешно совершен!")
         except Exception as e:
             conn.rollback()
             print(f"Ошибка при совершении заказа: {e}")
 
-def show_history(conn):
-    global logged_in
-    global current_user_id
+def add_to_cart(fruit_name):
+    if not can_order():
+        return
 
-    if not logged_in:
-        print("Для просмотра истории заказов необходимо войти в систему.")
+    quantity = read_quantity()
+    if quantity is None:
         return
-    
-    client_id = get_client_id_by_user_id(conn, current_user_id)
-    with conn.cursor() as cursor:
+
+    fruit = catalog.find(fruit_name)
+    name = fruit[1] if fruit else fruit_name
+    cart = current_session.cart
+    cart[name] = cart.get(name, 0) + quantity
+    print(f"{name} x {quantity} добавлен в корзину.")
+
+def checkout_cart():
+    cart = current_session.cart
+    jobs.ensure_order_partition()
+    with db.connection() as conn:
         try:
-            cursor.execute("""
-                SELECT O.Creation_date, D.Delivery_date, F.Name, O.Total_price, O.Item_quantity
-                FROM Orders O
-                LEFT JOIN Delivery D ON O.Id = D.Order_Id
-                JOIN Fruits F ON O.Fruit_Id = F.Id
-                WHERE O.Client_Id = %s
-                ORDER BY O.Creation_date DESC;
-            """, (client_id,))
-
-            orders = cursor.fetchall()
-
-            if not orders:
-                print("У вас нет заказов.")
-            else:
-                print("\nИстория ваших заказов:")
-                print("Дата создания | Дата доставки | Наименование фрукта | Общая стоимость | Количество | Статус")
-                print("--------------------------------------------------------------------------------------------")
-                for order in orders:
-                    creation_date = order[0]
-                    delivery_date = order[1]
-                    fruit_name = order[2]
-                    total_price = order[3]
-                    item_quantity = order[4]
-
-                    status = "Ожидается"
-                    if delivery_date:
-                        days_remaining = (delivery_date - datetime.now()).days
-                        if days_remaining < 0:
-                            status = "Доставлен"
-                        elif days_remaining == 0:
-                            status = "Доставка сегодня"
-                        else:
-                            status = f"Осталось {days_remaining} дней"
-
-                    print(f"{creation_date} | {delivery_date} | {fruit_name} | {total_price} | {item_quantity} | {status}")
+            orders = checkout(conn, current_session.client_id, list(cart.items()))
+            conn.commit()
+            audit.record("order", current_session.user_id, orders=[order[0] for order in orders],
+                         total=sum(order[3] for order in orders))
         except Exception as e:
-            print(f"Ошибка при получении истории заказов: {e}")
+            conn.rollback()
+            print(f"Ошибка при оформлении корзины: {e}")
+            return
 
-def is_admin(conn, user_id):
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT Role_Id FROM Users WHERE Id = %s", (user_id,))
-        role_id = cursor.fetchone()
-        return role_id and role_id[0] == 1 
+    cart.clear()
+    print("\nЗаказ успешно совершен!")
+    print("Наименование фрукта | Количество | Стоимость")
+    print("--------------------------------------------")
+    for _, fruit_name, quantity, total_price in orders:
+        print(f"{fruit_name:19} | {quantity:10} | {total_price}")
+    print(f"Итого: {sum(order[3] for order in orders)}")
 
-def is_client(conn, user_id):
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT Role_Id FROM Users WHERE Id = %s", (user_id,))
-        role_id = cursor.fetchone()
-        return role_id and role_id[0] == 2 
+def show_cart():
+    if not can_order():
+        return
 
-def is_employee(conn, user_id):
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT Role_Id FROM Users WHERE Id = %s", (user_id,))
-        role_id = cursor.fetchone()
-        return role_id and role_id[0] == 3
+    cart = current_session.cart
+    if not cart:
+        print("Корзина пуста.")
+        return
+
+    print("\nКорзина:")
+    print("Наименование фрукта | Количество | Цена")
+    print("---------------------------------------")
+    for fruit_name, quantity in cart.items():
+        fruit = catalog.find(fruit_name)
+        price = fruit[3] if fruit else "-"
+        print(f"{fruit_name:19} | {quantity:10} | {price}")
+
+    print("1. Оформить заказ")
+    print("2. Удалить позицию")
+    print("3. Очистить корзину")
+    cart_choice = input("\nВыберете операцию: ")
+
+    if cart_choice == "1":
+        checkout_cart()
+    elif cart_choice == "2":
+        fruit_name = input("Введите наименование фрукта: ")
+        for name in list(cart):
+            if name.lower() == fruit_name.lower():
+                del cart[name]
+                print(f"{name} удален из корзины.")
+                break
+        else:
+            print(f"Фрукта '{fruit_name}' нет в корзине.")
+    elif cart_choice == "3":
+        cart.clear()
+        print("Корзина очищена.")
+
+def fetch_history_page(client_id, after, limit, archive=False):
+    # Ключ страницы: (дата, id последнего показанного заказа, итог на первом заказе новой страницы)
+    first_page, next_page = ((queries.ARCHIVE_HISTORY_FIRST_PAGE, queries.ARCHIVE_HISTORY_NEXT_PAGE) if archive
+                             else (queries.HISTORY_FIRST_PAGE, queries.HISTORY_NEXT_PAGE))
+    if after is None:
+        return paging.prepared_rows(first_page, (None, client_id, client_id), limit)
+    return paging.prepared_rows(next_page, (after[2], client_id, client_id) + after[:2], limit)
+
+def print_history_header():
+    print("\nИстория ваших заказов:")
+    print("Дата создания | Дата доставки | Наименование фрукта | Общая стоимость | Количество | Статус | Итого")
+    print("----------------------------------------------------------------------------------------------------")
+
+def print_order(order):
+    creation_date, delivery_date, fruit_name, total_price, item_quantity, _, status, _, running_total = order
+    print(f"{creation_date} | {delivery_date} | {fruit_name} | {total_price} | {item_quantity} | {status} | {running_total}")
+
+def show_history():
+    global logged_in
+    global current_session
+
+    if not logged_in:
+        print("Для просмотра истории заказов необходимо войти в систему.")
+        return
+    
+    current_session.refresh()
+    client_id = current_session.client_id
+    try:
+        with db.connection() as conn, conn.cursor() as cursor:
+            prepared.execute(cursor, queries.CLIENT_ORDER_SUMMARY, (client_id,))
+            summary = cursor.fetchone()
+            prepared.execute(cursor, queries.CLIENT_HAS_ARCHIVE, (client_id,))
+            has_archive = cursor.fetchone()[0]
+        if summary:
+            order_count, total_spent, last_order_date = summary
+            print(f"\nЗаказов: {order_count}, потрачено всего: {total_spent}, последний заказ: {last_order_date}")
+        archive = has_archive and input("Показать и архивные заказы? (д - да, Enter - нет): ").strip().lower() == "д"
+        paging.browse(
+            lambda after, limit: fetch_history_page(client_id, after, limit, archive),
+            lambda order: (order[0], order[5], order[8] - order[3]),
+            print_history_header,
+            print_order,
+            "У вас нет заказов.",
+        )
+    except Exception as e:
+        print(f"Ошибка при получении истории заказов: {e}")
+
+def is_admin(user_session):
+    return user_session is not None and user_session.is_admin
+
+def is_client(user_session):
+    return user_session is not None and user_session.is_client
+
+def is_employee(user_session):
+    return user_session is not None and user_session.is_employee
 
 def delete_client(conn, user_id):
     with conn.cursor() as cursor:
-        try:
-            cursor.execute("DELETE FROM Clients WHERE User_Id = %s", (user_id,))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            print(f"Ошибка при удалении пользователя из таблицы клиентов: {e}")
+        cursor.execute(queries.DELETE_CLIENT, (user_id,))
 
 def get_user_id_by_name(conn, user_name):
     with conn.cursor() as cursor:
-        cursor.execute("SELECT Id FROM Users WHERE First_Name ILIKE %s", (user_name,))
+        cursor.execute(queries.USER_ID_BY_NAME, (user_name,))
         user_id = cursor.fetchone()
         return user_id[0] if user_id else None
 
@@ -277,10 +448,10 @@ def select_work_time():
         print("Некорректный выбор времени.")
         return None
 
-def select_positions(conn):
+def select_positions():
     selected_positions = []
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT * FROM Positions;")
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.POSITIONS)
         positions = cursor.fetchall()
 
     if not positions:
@@ -309,69 +480,59 @@ def select_positions(conn):
 
     if not selected_positions:
         print("Необходимо выбрать хотя бы одну позицию.")
-        return select_positions(conn)
+        return select_positions()
 
     return selected_positions
 
-def add_employee(conn):
+def add_employee():
     global logged_in
-    global current_user_id
+    global current_session
 
     if not logged_in:
         print("Для добавления сотрудника необходимо войти в систему.")
         return
 
-    if not is_admin(conn, current_user_id):
+    if not is_admin(current_session):
         print("У вас нет прав для добавления сотрудника.")
         return
 
     user_name = input("Введите имя пользователя, которого вы хотите назначить сотрудником: ")
 
-    user_id = get_user_id_by_name(conn, user_name)
+    with db.connection() as conn:
+        user_id = get_user_id_by_name(conn, user_name)
 
     if not user_id:
         print("Пользователь с указанным именем не существует.")
         return
 
-    delete_client(conn, user_id)
-
     salary = input("Введите зарплату сотрудника: ")
     work_time = select_work_time()
     
     if not work_time:
         return
     
-    positions = select_positions(conn)
-    with conn.cursor() as cursor:
+    positions = select_positions()
+    with db.connection() as conn, conn.cursor() as cursor:
         try:
-            cursor.execute("""
-                INSERT INTO Employees (Salary, User_Id, Work_time_Id)
-                VALUES (%s, %s, (SELECT Id FROM Work_time WHERE start_work = %s AND end_work = %s))
-                RETURNING Id
-            """, (salary, user_id, work_time[0], work_time[1]))
+            delete_client(conn, user_id)
 
+            cursor.execute(queries.INSERT_EMPLOYEE, (salary, user_id, work_time[0], work_time[1]))
             employee_id = cursor.fetchone()[0]
-            for position_name in positions:
-                cursor.execute("""
-                    INSERT INTO Positions_Employees (Position_Id, Employee_Id)
-                    VALUES ((SELECT Id FROM Positions WHERE Id = %s), %s)
-                """, (position_name, employee_id))
-            
-            cursor.execute("""
-                UPDATE Users
-                SET Role_Id = 3
-                WHERE Id = %s
-            """, (user_id,))
+            cursor.execute(queries.INSERT_EMPLOYEE_POSITIONS, (employee_id, positions))
+            cursor.execute(queries.SET_EMPLOYEE_ROLE, (user_id,))
 
             conn.commit()
+            session.invalidate(user_id)
+            audit.record("add_employee", current_session.user_id, user_id=user_id, employee_id=employee_id,
+                         role_id=session.EMPLOYEE_ROLE_ID, positions=positions)
             print("Сотрудник успешно добавлен.")
         except Exception as e:
             conn.rollback()
             print(f"Ошибка при добавлении сотрудника: {e}")
 
-def select_producer(conn):
-    with conn.cursor() as cursor:
-        cursor.execute("SELECT * FROM Producers;")
+def select_producer():
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.PRODUCERS)
         producers = cursor.fetchall()
 
     if not producers:
@@ -399,43 +560,41 @@ def select_producer(conn):
 
     return None
 
-def add_producer(conn):
+def add_producer():
     global logged_in
-    global current_user_id
+    global current_session
 
     if not logged_in:
         print("Для добавления производителя необходимо войти в систему.")
         return
 
-    if not is_admin(conn, current_user_id) and not is_employee(conn, current_user_id):
+    if not is_admin(current_session) and not is_employee(current_session):
         print("У вас нет прав для добавления производителя.")
         return
 
     producer_name = input("Введите название производителя: ")
     producer_country = input("Введите страну производителя: ")
 
-    with conn.cursor() as cursor:
+    with db.connection() as conn, conn.cursor() as cursor:
         try:
-            cursor.execute("""
-                INSERT INTO Producers (Name, Country)
-                VALUES (%s, %s)
-            """, (producer_name, producer_country))
+            cursor.execute(queries.INSERT_PRODUCER, (producer_name, producer_country))
 
             conn.commit()
+            audit.record("add_producer", current_session.user_id, name=producer_name, country=producer_country)
             print("Производитель успешно добавлен.")
         except Exception as e:
             conn.rollback()
             print(f"Ошибка при добавлении производителя: {e}")
 
-def add_fruit(conn):
+def add_fruit():
     global logged_in
-    global current_user_id
+    global current_session
 
     if not logged_in:
         print("Для добавления фрукта необходимо войти в систему.")
         return
 
-    if not is_admin(conn, current_user_id) and not is_employee(conn, current_user_id):
+    if not is_admin(current_session) and not is_employee(current_session):
         print("У вас нет прав для добавления фрукта.")
         return
 
@@ -443,167 +602,161 @@ def add_fruit(conn):
     creation_date = input("Введите дату создания фрукта (гггг-мм-дд): ")
     price = input("Введите цену фрукта: ")
     expiration_date = input("Введите срок годности фрукта (в днях): ")
-    producer_id = select_producer(conn)
+    producer_id = select_producer()
 
-    with conn.cursor() as cursor:
+    with db.connection() as conn, conn.cursor() as cursor:
         try:
-            cursor.execute("CALL AddFruit(%s, %s, %s, %s, %s)",
+            cursor.execute(queries.ADD_FRUIT,
                             (fruit_name, creation_date, price, expiration_date, producer_id))
 
             conn.commit()
+            audit.record("add_fruit", current_session.user_id, name=fruit_name, price=price, producer_id=producer_id)
             print("Фрукт успешно добавлен.")
         except Exception as e:
             conn.rollback()
             print(f"Ошибка при добавлении фрукта: {e}")
 
-def update_fruit_price_by_percentage(conn):
+def update_fruit_price_by_percentage():
     if not logged_in:
         print("\nДля добавления фрукта необходимо войти в систему.")
         return
     
-    global current_user_id
+    global current_session
 
-    if not is_admin(conn, current_user_id):
+    if not is_admin(current_session):
         print("У вас нет прав для обновления цены фрукта.")
         return
 
     fruit_name = input("Введите название фрукта: ")
    
-    with conn.cursor() as cursor1:
-            cursor1.execute("""
-                SELECT fruits.Id 
-                FROM fruits
-                WHERE fruits.Name = %s""", (f'{fruit_name}',))
+    with db.connection() as conn, conn.cursor() as cursor1:
+            cursor1.execute(queries.FRUIT_ID_BY_NAME, (fruit_name,))
 
             fruit = cursor1.fetchone()
     if not fruit:
         print(f"Фрукт {fruit_name} не найден")
         return
     
-    new_price = input("Введите новую цену фрукта: ")
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("CALL UpdateFruitPriceByPercentage(%s, %s)",
-                            (fruit[0], new_price))
-            conn.commit()
-            print(f"Цена для фрукта {fruit_name} изменена на {new_price}.")
+        percentage = float(input("Введите процент изменения цены (-10 - скидка 10%): "))
+    except ValueError:
+        print("Процент должен быть числом.")
+        return
+    try:
+        changes = jobs.reprice_fruits(percentage, fruit=fruit_name)
     except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Ошибка при выполнении процедуры: {e}")
+        print(f"Ошибка при изменении цены: {e}")
+        return
+    audit.record("reprice", current_session.user_id, fruit_id=fruit[0], percentage=percentage)
+    if not changes:
+        print(f"Цена фрукта {fruit_name} не изменилась.")
+    for _, name, _, old_price, new_price, _ in changes:
+        print(f"Цена для фрукта {name} изменена: {old_price} -> {new_price}.")
 
-def delete_low_rated_reviews_for_all_fruits(conn):
+def delete_low_rated_reviews_for_all_fruits():
 
     if not logged_in:
         print("\nДля добавления фрукта необходимо войти в систему.")
         return
     
-    global current_user_id
+    global current_session
 
-    if not is_admin(conn, current_user_id):
+    if not is_admin(current_session):
         print("У вас нет прав для удаления отзывов.")
         return
 
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute('CALL DeleteLowRatedReviewsForAllFruits()')
-            conn.commit()
-            print("Низкооцененные отзывы успешно удалены.")
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Ошибка при выполнении процедуры: {e}")
+    with db.connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(queries.DELETE_LOW_RATED_REVIEWS)
+                conn.commit()
+                audit.record("delete_low_rated_reviews", current_session.user_id)
+                print("Низкооцененные отзывы успешно удалены.")
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"Ошибка при выполнении процедуры: {e}")
 
-def delete_fruit(conn):
+def delete_fruit():
     global logged_in
-    global current_user_id
+    global current_session
 
     if not logged_in:
         print("Для удаления фрукта необходимо войти в систему.")
         return
 
-    if not is_admin(conn, current_user_id) and not is_employee(conn, current_user_id):
+    if not is_admin(current_session) and not is_employee(current_session):
         print("У вас нет прав для удаления фрукта.")
         return
 
     fruit_name = input("Введите название фрукта: ")
-    with conn.cursor() as cursor1:
-            cursor1.execute("SELECT * FROM Fruits WHERE LOWER(Name) = LOWER(%s);", (fruit_name,))
-            fruit = cursor1.fetchone()
-            if not fruit:
-                print(f"Фрукт '{fruit_name}' не найден.")
-                return
-    with conn.cursor() as cursor:
+    with db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(queries.FRUIT_BY_NAME, (fruit_name,))
+        fruit = cursor.fetchone()
+        if not fruit:
+            print(f"Фрукт '{fruit_name}' не найден.")
+            return
+
         try:
-            cursor.execute("DELETE FROM Fruits WHERE LOWER(Name) = LOWER(%s);", (fruit_name,))
+            cursor.execute(queries.DELETE_FRUIT, (fruit_name,))
             conn.commit()
+            audit.record("delete_fruit", current_session.user_id, fruit_id=fruit[0], name=fruit[1])
             print(f"Фрукт '{fruit_name}' успешно удален.")
         except psycopg2.Error as e:
             conn.rollback()
             print(f"Ошибка при удалении фрукта: {e}")
 
 
-def register_user(conn, first_name, last_name, phone, password, role_id, address):
+def register_user(first_name, last_name, phone, password, role_id, address):
     global logged_in
-    global current_user_id
-    with conn.cursor() as cursor:
+    global current_session
+    with db.connection() as conn, conn.cursor() as cursor:
         try:
-            if len(first_name) < 1:
-                raise ValueError("Имя должно содержать не менее 1 символа.")
-            if len(last_name) < 1:
-                raise ValueError("Фамилия должна содержать не менее 1 символа.")
-            if not is_valid_phone(phone):
-                raise ValueError("Некорректный формат телефона. Пример: +375291111111")
-            if not is_valid_password(password):
-                raise ValueError("Пароль должен содержать не менее 4 цифр.")
-
-            cursor.execute("""
-                INSERT INTO Users (First_Name, Last_Name, Phone, Password, Role_Id)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING Id
-            """, (first_name, last_name, phone, password, role_id))
+            validate_registration(first_name, last_name, phone, password)
+
+            cursor.execute(queries.INSERT_USER, (first_name, last_name, phone, password, role_id))
             user_id = cursor.fetchone()[0]
-            conn.commit()
-            cursor.execute("""
-                INSERT INTO Clients (User_Id, Address)
-                VALUES (%s, %s)
-            """, (user_id, address))
+            cursor.execute(queries.INSERT_CLIENT, (user_id, address))
+            client_id = cursor.fetchone()[0]
             
             conn.commit()
+            audit.record("register", user_id, client_id=client_id)
             
             print("Пользователь успешно зарегистрирован!")
-
-            login_user(conn, first_name, password)
-            logged_in = True 
-            current_user_id = user_id  
         except Exception as e:
             conn.rollback()
             print(f"Ошибка при регистрации пользователя: {e}")
+            return
+
+    print(f"Добро пожаловать, {first_name} {last_name}!")
+    logged_in = True 
+    current_session = session.create_session(user_id, first_name, last_name, role_id, client_id)
 
-def login_user(conn, first_name, password):
+def login_user(first_name, password):
     global logged_in
-    global current_user_id  
-    with conn.cursor() as cursor:
-        cursor.execute("""
-            SELECT * FROM Users
-            WHERE First_name = %s AND Password = %s
-        """, (first_name, password))
-        user = cursor.fetchone()
-        if user:
-            print(f"Добро пожаловать, {user[1]} {user[2]}!")
-            logged_in = True
-            current_user_id = user[0]  
-        else:
-            print("Неверный логин или пароль.")
+    global current_session  
+    with db.connection() as conn:
+        user_session = session.authenticate(conn, first_name, password)
+    if user_session:
+        print(f"Добро пожаловать, {user_session.first_name} {user_session.last_name}!")
+        logged_in = True
+        current_session = user_session
+        audit.record("login", user_session.user_id)
+    else:
+        print("Неверный логин или пароль.")
+        audit.record("login_failed", first_name=first_name)
 
 def logout_user():
     global logged_in
-    global current_user_id  
+    global current_session  
     print("Вы успешно вышли из аккаунта.")
+    audit.record("logout", current_session.user_id)
     logged_in = False
-    current_user_id = None  
+    current_session = None  
 
 def main():
     global logged_in
     while True:
+        instrumentation.end_action()
         if not logged_in:
             print("\nВыберите действие:")
             print("1. Зарегистрироваться")
@@ -623,10 +776,13 @@ def main():
         print("9. Удалить фрукт")
         print("10. Изменить цену продукта")
         print("11. Удалить все \"плохие\" отзывы")
+        print("12. Корзина")
+        print("13. Поиск")
         print("0. Выход из приложения")
 
 
         choice = input("\nВыберете операцию: ")
+        instrumentation.begin_action(f"Меню {choice}")
 
         if not logged_in:
             if choice == "1":
@@ -636,58 +792,75 @@ def main():
                 address = input("Введите адрес: ")
                 password = getpass.getpass("Введите ваш пароль: ")
                 role_id = 2
-                register_user(conn, first_name, last_name, phone, password, role_id, address)
+                register_user(first_name, last_name, phone, password, role_id, address)
             elif choice == "2":
                 phone = input("Введите логин: ")
                 password = getpass.getpass("Введите пароль: ")
-                login_user(conn, phone, password)
+                login_user(phone, password)
         elif logged_in:
             if choice == "1":
                 logout_user()
             elif choice == "2":
-                show_history(conn)
+                show_history()
 
         if choice == "3":
             select_fruits()
         elif choice == "4":
             fruit_name = input("Введите наименование фрукта: ")
-            is_valid_fruit = get_fruit_info(conn, fruit_name)
+            is_valid_fruit = get_fruit_info(fruit_name)
             if is_valid_fruit:
                 print("1. Отзывы о фрукте")
                 print("2. Оставить отзыв")
                 print("3. Купить")
+                print("4. Добавить в корзину")
                 fruit_detail_choice = input("\nВыберете операцию: ")
 
                 if fruit_detail_choice == "1":
                     get_reviews_for_fruit(fruit_name)
                 elif fruit_detail_choice == "2":
-                    leave_review(conn, fruit_name)
+                    leave_review(fruit_name)
                 elif fruit_detail_choice == "3":
-                    make_order(conn, fruit_name)            
+                    make_order(fruit_name)            
+                elif fruit_detail_choice == "4":
+                    add_to_cart(fruit_name)
                 else: 
                     break
 
         elif choice == "5":
             view_employees()
         elif choice == "6":
-            add_employee(conn)
+            add_employee()
         elif choice == "7":
-            add_producer(conn)
+            add_producer()
         elif choice == "8":
-            add_fruit(conn)
+            add_fruit()
         elif choice == "9":
-            delete_fruit(conn)
+            delete_fruit()
         elif choice == "10":
-            update_fruit_price_by_percentage(conn)
+            update_fruit_price_by_percentage()
         elif choice == "11":
-            delete_low_rated_reviews_for_all_fruits(conn)
+            delete_low_rated_reviews_for_all_fruits()
+        elif choice == "12":
+            show_cart()
+        elif choice == "13":
+            search_menu()
         elif choice == "0":
             break
         elif choice != "1" and choice != "2":
             print("Некорректный выбор. Попробуйте снова.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Консольный клиент магазина фруктов")
+    parser.add_argument("--profile", action="store_true", help="вывести профиль обращений к БД при выходе")
+    parser.add_argument("--slow-query-ms", type=float, help="логировать запросы дольше N мс вместе с EXPLAIN")
+    args = parser.parse_args()
+    instrumentation.setup(args.profile, args.slow_query_ms)
     try:
+        migrations.warn_pending()
+        employee_directory.start()
         main()
     finally:
-        conn.close()
+        employee_directory.stop()
+        notifications.stop_listener()
+        audit.stop()
+        db.close_pool()
@@ -0,0 +1,423 @@
+import argparse
+import datetime
+
+import audit
+import batch
+import benchmark
+import datagen
+import db
+import employee_directory
+import fruit_import
+import instrumentation
+import jobs
+import migrations
+import notifications
+import sales_report
+
+
+def run_migrate(args):
+    if args.list:
+        for version, name, applied in migrations.migration_status():
+            print(f"{version:04} {name:40} {'применена' if applied else 'ожидает'}")
+        return
+
+    applied = migrations.migrate(args.target)
+    if not applied:
+        print("Схема актуальна, новых миграций нет.")
+    for version, name in applied:
+        print(f"Применена миграция {version:04} {name}")
+
+
+def run_import_fruits(args):
+    fruit_import.run_import(args.path, args.format)
+
+
+def run_api(args):
+    # aiohttp и asyncpg нужны только API: остальные команды работают без них
+    import api
+    api.run(args.port or api.API_PORT)
+
+
+def run_batch(args):
+    # Изменения сотрудников из пакета применяются к справочнику при остановке (employee_directory.stop)
+    employee_directory.start()
+    batch.run(args.path, args.output, args.group, args.workers, args.user)
+
+
+def run_generate_data(args):
+    datagen.run(args.scale, args.seed, args.workers, args.months, args.truncate, args.today)
+
+
+def run_bench(args):
+    benchmark.run(args.users, args.duration, args.mix, args.seed, args.warmup, args.output, args.compare,
+                  args.prepared)
+
+
+def run_salary_adjustments(args):
+    def report(applied):
+        print(f"Учтено положительных отзывов: {applied}")
+
+    if args.pending:
+        print(f"Ожидают применения: {jobs.pending_salary_adjustments()}")
+    elif args.interval:
+        jobs.run_periodically(jobs.apply_salary_adjustments, args.interval, report)
+    else:
+        report(jobs.apply_salary_adjustments())
+
+
+def run_rebuild_ratings(args):
+    mismatched = jobs.rebuild_fruit_ratings(apply=not args.check)
+    if not mismatched:
+        print("Сводка рейтингов совпадает с отзывами.")
+    elif args.check:
+        print(f"Сводка расходится с отзывами у фруктов: {mismatched}")
+    else:
+        print(f"Сводка пересчитана, исправлено фруктов: {mismatched}")
+
+
+def run_rebuild_order_summary(args):
+    mismatched = jobs.rebuild_client_order_summary(apply=not args.check)
+    if not mismatched:
+        print("Сводка заказов совпадает с заказами.")
+    elif args.check:
+        print(f"Сводка расходится с заказами у клиентов: {mismatched}")
+    else:
+        print(f"Сводка пересчитана, исправлено клиентов: {mismatched}")
+
+
+def run_sales_rollup(args):
+    def report(applied):
+        print(f"Обновлено строк дневных итогов: {applied}")
+
+    if args.pending:
+        print(f"Изменений в журнале: {jobs.pending_sales_changes()}")
+    elif args.interval:
+        jobs.run_periodically(jobs.apply_sales_changes, args.interval, report)
+    else:
+        report(jobs.apply_sales_changes())
+
+
+def run_rebuild_sales(args):
+    mismatched = jobs.rebuild_sales_daily(apply=not args.check)
+    if not mismatched:
+        print("Дневные итоги продаж совпадают с заказами.")
+    elif args.check:
+        print(f"Итоги расходятся с заказами в строках (день, фрукт): {mismatched}")
+    else:
+        print(f"Итоги пересчитаны, исправлено строк: {mismatched}")
+
+
+def run_sales_report(args):
+    sales_report.run_report(args.first_day, args.last_day, args.by, args.csv)
+
+
+def run_sales_export(args):
+    sales_report.run_export(args.first_day, args.last_day, args.path)
+
+
+def run_plan_deliveries(args):
+    def plan_deliveries():
+        return jobs.plan_deliveries(args.batch)
+
+    def report(planned):
+        print(f"Запланировано доставок: {planned}, в очереди: {jobs.pending_deliveries()}")
+
+    if args.pending:
+        print(f"Заказов без даты доставки: {jobs.pending_deliveries()}")
+    elif args.interval:
+        jobs.run_periodically(plan_deliveries, args.interval, report)
+    else:
+        report(plan_deliveries())
+
+
+def run_delivery_capacity(args):
+    if args.capacity is not None:
+        jobs.set_delivery_capacity(args.capacity, args.first_day, args.last_day)
+        print("Вместимость изменена.")
+        if args.rebalance:
+            run_rebalance_deliveries(args)
+        return
+
+    (default_capacity, lead_days, horizon_days), days = jobs.delivery_load()
+    print(f"Вместимость по умолчанию: {default_capacity}, срок доставки: {lead_days} дн., горизонт: {horizon_days} дн.")
+    for day, booked, capacity in days:
+        print(f"{day} | {booked:6} / {capacity:<6}{' перегружен' if booked > capacity else ''}")
+
+
+def run_rebalance_deliveries(args):
+    moved, planned = jobs.rebalance_deliveries(args.batch)
+    print(f"Снято с перегруженных дней: {moved}, запланировано заново: {planned}, "
+          f"в очереди: {jobs.pending_deliveries()}")
+
+
+def run_partitions(args):
+    def maintain_order_partitions():
+        return jobs.maintain_order_partitions(args.months_ahead, args.archive_older_than)
+
+    def report(result):
+        created, archived = result
+        print(f"Создано месяцев: {created}, перенесено в архив: {archived}")
+
+    if args.list:
+        for schema, name, bounds, rows in jobs.order_partitions():
+            print(f"{schema}.{name} | {bounds} | ~{rows} строк")
+    elif args.interval:
+        jobs.run_periodically(maintain_order_partitions, args.interval, report)
+    else:
+        report(maintain_order_partitions())
+
+
+def markdown_steps(value):
+    # "3:50,7:30,14:10": за 3 дня до окончания срока -50%, за 7 дней -30%, за 14 дней -10%
+    try:
+        steps = [tuple(step.split(":")) for step in value.split(",")]
+        return [(int(days), float(percent)) for days, percent in steps]
+    except ValueError:
+        raise argparse.ArgumentTypeError("ожидаются ступени ДНИ:ПРОЦЕНТ через запятую, например 3:50,7:30")
+
+
+def run_reprice(args):
+    def reprice_fruits():
+        return jobs.reprice_fruits(args.percent, args.fruit, args.producer, args.country, args.expires_within,
+                                   args.markdown, not args.dry_run)
+
+    def report(changes):
+        for fruit_id, name, expiry_date, old_price, new_price, markdown in changes:
+            step = f" (уценка {markdown:g}%)" if markdown is not None else ""
+            print(f"{name} | годен до {expiry_date} | {old_price} -> {new_price}{step}")
+        print(f"{'Будет изменено' if args.dry_run else 'Изменено'} цен: "
+              f"{sum(old_price != new_price for *_, old_price, new_price, _ in changes)}")
+
+    if args.interval:
+        jobs.run_periodically(reprice_fruits, args.interval, report)
+    else:
+        report(reprice_fruits())
+
+
+def run_price_history(args):
+    for changed_at, name, old_price, new_price, markdown, reason in jobs.price_history(args.fruit, args.limit):
+        step = f" (уценка {markdown:g}%)" if markdown is not None else ""
+        print(f"{changed_at:%Y-%m-%d %H:%M} | {name} | {old_price} -> {new_price}{step} | {reason}")
+
+
+def run_stock(args):
+    if args.add is None and args.set is None:
+        for name, producer, stock in jobs.fruit_stock(args.fruit, args.limit):
+            print(f"{name} | {producer} | {stock}")
+        return
+
+    if args.fruit is None:
+        raise SystemExit("Укажите фрукт, остаток которого меняется.")
+    row = jobs.restock(args.fruit, args.add, args.set)
+    if row is None:
+        print("Фрукт не найден или списание больше остатка.")
+    else:
+        print(f"{row[0]}: на складе {row[1]}")
+
+
+def run_stock_stress(args):
+    benchmark.run_stock(args.buyers, args.stock, args.quantity, args.output)
+
+
+def run_refresh_employees(args):
+    def refresh_employee_directory():
+        return jobs.refresh_employee_directory(args.force)
+
+    def report(refreshed):
+        print("Справочник сотрудников обновлён." if refreshed else "Справочник сотрудников актуален.")
+
+    if args.interval:
+        jobs.run_periodically(refresh_employee_directory, args.interval, report)
+    else:
+        report(refresh_employee_directory())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Служебные команды магазина фруктов")
+    parser.add_argument("--profile", action="store_true", help="вывести профиль обращений к БД при выходе")
+    parser.add_argument("--slow-query-ms", type=float, help="логировать запросы дольше N мс вместе с EXPLAIN")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="применить миграции схемы")
+    migrate_parser.add_argument("--list", action="store_true", help="показать состояние миграций")
+    migrate_parser.add_argument("--target", type=int, help="применить миграции до указанной версии включительно")
+    migrate_parser.set_defaults(handler=run_migrate)
+
+    import_parser = commands.add_parser("import-fruits", help="загрузить прайс-лист фруктов через COPY")
+    import_parser.add_argument("path", help="CSV или JSONL файл ('-' для stdin)")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"), help="формат файла (по умолчанию по расширению)")
+    import_parser.set_defaults(handler=run_import_fruits)
+
+    salary_parser = commands.add_parser("salary-adjustments",
+                                        help="применить надбавки к зарплате за накопленные положительные отзывы")
+    salary_parser.add_argument("--interval", type=float, help="повторять каждые N секунд до Ctrl+C")
+    salary_parser.add_argument("--pending", action="store_true", help="только показать число ожидающих отзывов")
+    salary_parser.set_defaults(handler=run_salary_adjustments)
+
+    ratings_parser = commands.add_parser("rebuild-ratings", help="пересчитать сводку рейтингов фруктов из отзывов")
+    ratings_parser.add_argument("--check", action="store_true", help="только проверить расхождения")
+    ratings_parser.set_defaults(handler=run_rebuild_ratings)
+
+    summary_parser = commands.add_parser("rebuild-order-summary", help="пересчитать сводку заказов клиентов из Orders")
+    summary_parser.add_argument("--check", action="store_true", help="только проверить расхождения")
+    summary_parser.set_defaults(handler=run_rebuild_order_summary)
+
+    rollup_parser = commands.add_parser("sales-rollup", help="свернуть журнал изменений продаж в дневные итоги")
+    rollup_parser.add_argument("--interval", type=float, help="повторять каждые N секунд до Ctrl+C")
+    rollup_parser.add_argument("--pending", action="store_true", help="только показать размер журнала")
+    rollup_parser.set_defaults(handler=run_sales_rollup)
+
+    rebuild_sales_parser = commands.add_parser("rebuild-sales", help="пересчитать дневные итоги продаж из Orders")
+    rebuild_sales_parser.add_argument("--check", action="store_true", help="только проверить расхождения")
+    rebuild_sales_parser.set_defaults(handler=run_rebuild_sales)
+
+    report_parser = commands.add_parser("sales-report", help="отчёт о продажах за период по дневным итогам")
+    report_parser.add_argument("--from", dest="first_day", type=datetime.date.fromisoformat,
+                               default=datetime.date.today().replace(day=1),
+                               help="первый день (ГГГГ-ММ-ДД), по умолчанию начало месяца")
+    report_parser.add_argument("--to", dest="last_day", type=datetime.date.fromisoformat,
+                               default=datetime.date.today(), help="последний день, по умолчанию сегодня")
+    report_parser.add_argument("--by", choices=sales_report.REPORT_DIMENSIONS, default="fruit",
+                               help="группировка (по умолчанию fruit)")
+    report_parser.add_argument("--csv", metavar="FILE", help="выгрузить отчёт в CSV ('-' для stdout)")
+    report_parser.set_defaults(handler=run_sales_report)
+
+    export_parser = commands.add_parser("sales-export", help="выгрузить заказы за период в CSV (COPY TO STDOUT)")
+    export_parser.add_argument("path", help="CSV файл ('-' для stdout)")
+    export_parser.add_argument("--from", dest="first_day", type=datetime.date.fromisoformat,
+                               default=datetime.date.today().replace(day=1),
+                               help="первый день (ГГГГ-ММ-ДД), по умолчанию начало месяца")
+    export_parser.add_argument("--to", dest="last_day", type=datetime.date.fromisoformat,
+                               default=datetime.date.today(), help="последний день, по умолчанию сегодня")
+    export_parser.set_defaults(handler=run_sales_export)
+
+    plan_parser = commands.add_parser("plan-deliveries", help="назначить даты доставки заказам из очереди")
+    plan_parser.add_argument("--batch", type=int, default=jobs.PLAN_BATCH_SIZE, help="заказов за один проход")
+    plan_parser.add_argument("--interval", type=float, help="повторять каждые N секунд до Ctrl+C")
+    plan_parser.add_argument("--pending", action="store_true", help="только показать число заказов в очереди")
+    plan_parser.set_defaults(handler=run_plan_deliveries)
+
+    capacity_parser = commands.add_parser("delivery-capacity",
+                                          help="показать загрузку дней доставки или изменить вместимость")
+    capacity_parser.add_argument("capacity", type=int, nargs="?", help="новая вместимость дня, доставок")
+    capacity_parser.add_argument("--from", dest="first_day", type=datetime.date.fromisoformat,
+                                 help="первый день (ГГГГ-ММ-ДД); без --from/--to меняется вместимость по умолчанию")
+    capacity_parser.add_argument("--to", dest="last_day", type=datetime.date.fromisoformat, help="последний день")
+    capacity_parser.add_argument("--rebalance", action="store_true", help="сразу перераспределить перегруженные дни")
+    capacity_parser.add_argument("--batch", type=int, default=jobs.PLAN_BATCH_SIZE, help=argparse.SUPPRESS)
+    capacity_parser.set_defaults(handler=run_delivery_capacity)
+
+    rebalance_parser = commands.add_parser("rebalance-deliveries",
+                                           help="перенести доставки с дней, где заказов больше вместимости")
+    rebalance_parser.add_argument("--batch", type=int, default=jobs.PLAN_BATCH_SIZE, help="заказов за один проход")
+    rebalance_parser.set_defaults(handler=run_rebalance_deliveries)
+
+    partitions_parser = commands.add_parser("partitions",
+                                            help="создать будущие секции Orders/Delivery и перенести старые в архив")
+    partitions_parser.add_argument("--months-ahead", type=int, default=jobs.PARTITION_MONTHS_AHEAD,
+                                   help="на сколько месяцев вперёд создавать секции")
+    partitions_parser.add_argument("--archive-older-than", type=int, metavar="MONTHS",
+                                   help="перенести в схему archive месяцы старше MONTHS полных месяцев")
+    partitions_parser.add_argument("--interval", type=float, help="повторять каждые N секунд до Ctrl+C")
+    partitions_parser.add_argument("--list", action="store_true", help="только показать секции")
+    partitions_parser.set_defaults(handler=run_partitions)
+
+    reprice_parser = commands.add_parser("reprice", help="изменить цены фруктов одним оператором или уценить по сроку")
+    change = reprice_parser.add_mutually_exclusive_group(required=True)
+    change.add_argument("--percent", type=float, help="изменение цены в процентах (-10 - скидка 10%%)")
+    change.add_argument("--markdown", type=markdown_steps, metavar="ДНИ:ПРОЦЕНТ,...",
+                        help="уценка по дням до окончания срока годности, например 3:50,7:30,14:10")
+    reprice_parser.add_argument("--fruit", help="только фрукт с этим названием")
+    reprice_parser.add_argument("--producer", help="только фрукты производителя")
+    reprice_parser.add_argument("--country", help="только фрукты производителей из страны")
+    reprice_parser.add_argument("--expires-within", type=int, metavar="DAYS",
+                                help="только фрукты, срок годности которых истекает в ближайшие DAYS дней")
+    reprice_parser.add_argument("--dry-run", action="store_true", help="показать новые цены, ничего не меняя")
+    reprice_parser.add_argument("--interval", type=float, help="повторять каждые N секунд до Ctrl+C")
+    reprice_parser.set_defaults(handler=run_reprice)
+
+    history_parser = commands.add_parser("price-history", help="история изменения цены фрукта")
+    history_parser.add_argument("fruit", help="название фрукта")
+    history_parser.add_argument("--limit", type=int, default=20, help="число последних изменений")
+    history_parser.set_defaults(handler=run_price_history)
+
+    stock_parser = commands.add_parser("stock", help="показать остатки на складе или принять поступление")
+    stock_parser.add_argument("fruit", nargs="?", help="название фрукта (без него - фрукты с наименьшим остатком)")
+    change = stock_parser.add_mutually_exclusive_group()
+    change.add_argument("--add", type=int, help="поступление, штук (отрицательное - списание)")
+    change.add_argument("--set", type=int, help="новый остаток после инвентаризации")
+    stock_parser.add_argument("--limit", type=int, default=50, help="число фруктов в списке")
+    stock_parser.set_defaults(handler=run_stock)
+
+    stress_parser = commands.add_parser("stock-stress",
+                                        help="нагрузочный тест склада: покупатели одновременно раскупают один фрукт")
+    stress_parser.add_argument("--buyers", type=int, default=200, help="число одновременных покупателей")
+    stress_parser.add_argument("--stock", type=int, default=2000, help="начальный остаток фрукта")
+    stress_parser.add_argument("--quantity", type=int, default=1, help="штук в одном заказе")
+    stress_parser.add_argument("--output", help="сохранить результаты в JSON")
+    stress_parser.set_defaults(handler=run_stock_stress)
+
+    employees_parser = commands.add_parser("refresh-employees",
+                                           help="обновить справочник сотрудников, если он устарел")
+    employees_parser.add_argument("--force", action="store_true", help="обновить, даже если изменений не было")
+    employees_parser.add_argument("--interval", type=float, help="повторять каждые N секунд до Ctrl+C")
+    employees_parser.set_defaults(handler=run_refresh_employees)
+
+    api_parser = commands.add_parser("api", help="запустить HTTP API (aiohttp + asyncpg) на 127.0.0.1")
+    api_parser.add_argument("--port", type=int, help="порт (по умолчанию FRUIT_SHOP_API_PORT или 8080)")
+    api_parser.set_defaults(handler=run_api)
+
+    batch_parser = commands.add_parser("batch", help="выполнить команды из JSONL файла без меню")
+    batch_parser.add_argument("path", nargs="?", default="-", help="JSONL файл с командами ('-' или пусто - stdin)")
+    batch_parser.add_argument("--group", type=int, default=batch.DEFAULT_GROUP_SIZE,
+                              help="команд в одной транзакции (1 - каждая фиксируется отдельно)")
+    batch_parser.add_argument("--workers", type=int, default=batch.DEFAULT_WORKERS,
+                              help="групп выполняется параллельно (меньше размера пула соединений)")
+    batch_parser.add_argument("--output", help="JSONL файл результатов (по умолчанию stdout)")
+    batch_parser.add_argument("--user",
+                              help=f"пользователь по умолчанию для команд без user; пароль - {batch.PASSWORD_ENV}")
+    batch_parser.set_defaults(handler=run_batch)
+
+    generate_parser = commands.add_parser("generate-data", help="сгенерировать тестовые данные заданного объёма")
+    generate_parser.add_argument("--scale", type=float, default=datagen.DEFAULT_SCALE,
+                                 help="масштаб: 1 - 100 тыс. клиентов, 2 млн заказов, 400 тыс. отзывов")
+    generate_parser.add_argument("--seed", type=int, default=datagen.DEFAULT_SEED, help="seed генератора")
+    generate_parser.add_argument("--workers", type=int, default=datagen.DEFAULT_WORKERS,
+                                 help="параллельных процессов COPY")
+    generate_parser.add_argument("--months", type=int, default=datagen.DEFAULT_MONTHS,
+                                 help="заказы за столько последних месяцев")
+    generate_parser.add_argument("--today", type=datetime.date.fromisoformat,
+                                 help="дата, от которой отсчитываются даты данных (по умолчанию сегодня)")
+    generate_parser.add_argument("--truncate", action="store_true",
+                                 help="удалить производителей, фрукты, пользователей, заказы и отзывы перед генерацией")
+    generate_parser.set_defaults(handler=run_generate_data)
+
+    bench_parser = commands.add_parser("bench", help="нагрузочный тест: N виртуальных пользователей")
+    bench_parser.add_argument("--users", type=int, default=10, help="число одновременных пользователей")
+    bench_parser.add_argument("--duration", type=float, default=30, help="длительность замера, секунды")
+    bench_parser.add_argument("--warmup", type=float, default=0, help="прогрев перед замером, секунды")
+    bench_parser.add_argument("--mix", help="веса операций, например select_fruits=30,make_order=10")
+    bench_parser.add_argument("--seed", type=int, default=1, help="seed генератора операций")
+    bench_parser.add_argument("--output", help="сохранить результаты в JSON")
+    bench_parser.add_argument("--compare", help="сравнить с результатами предыдущего запуска (JSON)")
+    bench_parser.add_argument("--prepared", action=argparse.BooleanOptionalAction,
+                              help="подготовленные операторы для частых запросов (по умолчанию FRUIT_SHOP_PREPARED или да)")
+    bench_parser.set_defaults(handler=run_bench)
+
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    instrumentation.setup(args.profile, args.slow_query_ms)
+    try:
+        args.handler(args)
+    finally:
+        employee_directory.stop()
+        notifications.stop_listener()
+        audit.stop()
+        db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import re
+
+import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)$")
+
+
+def available_migrations():
+    migrations = []
+    for file_name in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, file_name)))
+    return sorted(migrations)
+
+
+def ensure_migrations_table(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Schema_Migrations (
+                Version integer primary key not null,
+                Name varchar(100) not null,
+                Applied_at timestamp not null default CURRENT_TIMESTAMP
+            )
+        """)
+    conn.commit()
+
+
+def applied_versions(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT Version FROM Schema_Migrations")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migration(conn, version, name, path):
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+
+    with conn.cursor() as cursor:
+        try:
+            # Несколько процессов могут запускать migrate одновременно
+            cursor.execute("LOCK TABLE Schema_Migrations IN EXCLUSIVE MODE")
+            cursor.execute("SELECT 1 FROM Schema_Migrations WHERE Version = %s", (version,))
+            if cursor.fetchone():
+                conn.rollback()
+                return False
+            cursor.execute(sql)
+            cursor.execute("INSERT INTO Schema_Migrations (Version, Name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def migrate(target=None):
+    applied = []
+    with db.connection() as conn:
+        ensure_migrations_table(conn)
+        done = applied_versions(conn)
+        for version, name, path in available_migrations():
+            if version in done or (target is not None and version > target):
+                continue
+            if apply_migration(conn, version, name, path):
+                applied.append((version, name))
+    return applied
+
+
+def migration_status():
+    with db.connection() as conn:
+        ensure_migrations_table(conn)
+        done = applied_versions(conn)
+    return [(version, name, version in done) for version, name, _ in available_migrations()]
+
+
+def warn_pending():
+    # Триггеры уведомлений (кэш каталога, сессии, справочник сотрудников) ставятся миграциями: без них
+    # приложение работает, но не узнаёт об изменениях, сделанных другими процессами
+    pending = [f"{version:04} {name}" for version, name, applied in migration_status() if not applied]
+    if pending:
+        print(f"Внимание: не применены миграции {', '.join(pending)}. Кэш каталога и сессии не будут сбрасываться "
+              f"при изменениях из других процессов; выполните python manage.py migrate")
+    return pending
@@ -0,0 +1,126 @@
+import os
+import select
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+
+import db
+
+
+class Listener(threading.Thread):
+    def __init__(self, dsn, poll_timeout=5, reconnect_backoff=0.5, max_backoff=30):
+        super().__init__(name="pg-listener", daemon=True)
+        self.dsn = dsn
+        self.poll_timeout = poll_timeout
+        self.reconnect_backoff = reconnect_backoff
+        self.max_backoff = max_backoff
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._conn = None
+        self._pending = set()
+        # Соединением пользуется только поток слушателя: остальные будят его через pipe
+        self._wakeup_read, self._wakeup_write = os.pipe()
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append(callback)
+            self._pending.add(channel)
+        self._wake()
+
+    def _wake(self):
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except OSError:
+            pass
+
+    def _listen_pending(self, conn):
+        os.read(self._wakeup_read, 1024)
+        with self._lock:
+            channels, self._pending = self._pending, set()
+        with conn.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(f"LISTEN {channel};")
+
+    def _dispatch(self, channel, payload):
+        with self._lock:
+            callbacks = list(self._callbacks.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Ошибка обработчика уведомления {channel}: {e}")
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self._lock:
+            channels = list(self._callbacks)
+            self._pending.clear()
+            self._conn = conn
+        with conn.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(f"LISTEN {channel};")
+        # Уведомления, пришедшие пока соединения не было, потеряны: сбрасываем всё
+        for channel in channels:
+            self._dispatch(channel, None)
+        return conn
+
+    def run(self):
+        backoff = self.reconnect_backoff
+        while not self._stopped.is_set():
+            try:
+                conn = self._connect()
+                backoff = self.reconnect_backoff
+                while not self._stopped.is_set():
+                    readable, _, _ = select.select([conn, self._wakeup_read], [], [], self.poll_timeout)
+                    if self._wakeup_read in readable:
+                        self._listen_pending(conn)
+                    if conn in readable:
+                        conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError, OSError):
+                self._close()
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        self._close()
+
+    def _close(self):
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake()
+        self.join(timeout=self.poll_timeout)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_listener():
+    global _listener
+    if _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                _listener = Listener(db.load_config()["dsn"])
+                _listener.start()
+    return _listener
+
+
+def subscribe(channel, callback):
+    get_listener().subscribe(channel, callback)
+
+
+def stop_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
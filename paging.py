@@ -0,0 +1,72 @@
+import os
+
+import db
+import prepared
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("FRUIT_SHOP_PAGE_SIZE", 20))
+FETCH_CHUNK = 50
+
+
+def stream_rows(query, params, limit, cursor_name="page_cursor", read_only=False):
+    # Именованный (серверный) курсор: строки приходят порциями по мере вывода
+    with db.connection(read_only) as conn:
+        with conn.cursor(name=cursor_name) as cursor:
+            cursor.itersize = FETCH_CHUNK
+            cursor.execute(query + " LIMIT %s", tuple(params) + (limit,))
+            while True:
+                rows = cursor.fetchmany(min(FETCH_CHUNK, limit))
+                if not rows:
+                    break
+                yield from rows
+
+
+def prepared_rows(query, params, limit, read_only=False):
+    # Страница одним подготовленным оператором с общим планом: для запросов по секционированным
+    # таблицам планирование дороже самой выборки, а строк в странице немного
+    with db.connection(read_only) as conn, conn.cursor() as cursor:
+        prepared.execute(cursor, query + " LIMIT %s", tuple(params) + (limit,), generic=True)
+        return cursor.fetchall()
+
+
+def browse(fetch_page, page_key, print_header, print_row, empty_message, page_size=DEFAULT_PAGE_SIZE):
+    # Стек ключей начала страниц: "назад" повторяет запрос от сохранённого ключа
+    page_starts = [None]
+    while True:
+        shown = 0
+        has_next = False
+        last_row = None
+        for row in fetch_page(page_starts[-1], page_size + 1):
+            if shown == page_size:
+                has_next = True
+                break
+            if shown == 0:
+                print_header()
+            print_row(row)
+            last_row = row
+            shown += 1
+
+        if shown == 0:
+            print(empty_message)
+            if len(page_starts) == 1:
+                return
+
+        print(f"\nСтраница {len(page_starts)}, записей на странице: {page_size}")
+        command = input("n - следующая, p - предыдущая, s - размер страницы, q - выход: ").strip().lower()
+
+        if command == "n":
+            if has_next:
+                page_starts.append(page_key(last_row))
+            else:
+                print("Это последняя страница.")
+        elif command == "p":
+            if len(page_starts) > 1:
+                page_starts.pop()
+            else:
+                print("Это первая страница.")
+        elif command == "s":
+            try:
+                page_size = max(1, int(input("Введите размер страницы: ")))
+            except ValueError:
+                print("Некорректный размер страницы.")
+        elif command == "q":
+            return
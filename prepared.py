@@ -0,0 +1,67 @@
+import functools
+import os
+import threading
+
+from psycopg2 import errors, extensions
+
+import queries
+
+# FRUIT_SHOP_PREPARED=0 выполняет те же запросы обычным текстом (для сравнения в bench)
+enabled = os.environ.get("FRUIT_SHOP_PREPARED", "1").lower() not in ("0", "false", "no")
+
+_names = {}
+_names_lock = threading.Lock()
+
+
+def statement_name(sql):
+    # Имя оператора - имя константы из queries: так он виден в профиле и в pg_prepared_statements
+    name = _names.get(sql)
+    if name is None:
+        with _names_lock:
+            if not _names:
+                for attr, value in vars(queries).items():
+                    if attr.isupper() and isinstance(value, str):
+                        _names.setdefault(value, attr.lower())
+            name = _names.get(sql)
+            if name is None:
+                # Страница запроса из queries (paging.prepared_rows): имя константы с суффиксом _limit
+                base = _names.get(sql.removesuffix(" LIMIT %s"))
+                name = _names[sql] = f"{base}_limit" if base else f"statement_{len(_names)}"
+    return name
+
+
+@functools.lru_cache(maxsize=None)
+def execute_sql(name, sql):
+    count = sql.count("%s")
+    return f"EXECUTE {name} ({', '.join(['%s'] * count)})" if count else f"EXECUTE {name}"
+
+
+def execute(cursor, sql, params=(), generic=False):
+    # Серверный подготовленный оператор: текст разбирается и планируется один раз на соединение.
+    # Реестр хранится в самом соединении, поэтому после переподключения операторы готовятся заново.
+    # generic=True - всегда общий план (запросы по секциям Orders/Delivery: с LIMIT-параметром
+    # планировщик иначе строит частный план на каждый вызов, а секции отсекаются и при выполнении).
+    # Настройка действует до конца транзакции
+    if not enabled:
+        return cursor.execute(sql, params)
+    conn = cursor.connection
+    prepared = getattr(conn, "prepared_statements", None)
+    if prepared is None:
+        prepared = conn.prepared_statements = set()
+    name = statement_name(sql)
+    idle = conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+    for attempt in range(2):
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {queries.numbered(sql)}")
+            prepared.add(name)
+        try:
+            statement = execute_sql(name, sql)
+            return cursor.execute(f"{queries.GENERIC_PLAN}; {statement}" if generic else statement, params)
+        except (errors.InvalidSqlStatementName, errors.FeatureNotSupported):
+            # Операторы сброшены (DISCARD ALL) или план несовместим с изменённой схемой.
+            # Повторить можно, только если транзакция началась здесь и ничего не потеряет
+            prepared.clear()
+            if attempt or not idle:
+                raise
+            conn.rollback()
+            cursor.execute("DEALLOCATE ALL")
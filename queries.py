@@ -0,0 +1,401 @@
+import functools
+import re
+
+# Общие SQL-запросы консольного клиента (psycopg2) и HTTP API (asyncpg)
+
+SESSION = """
+    SELECT Users.Id, Users.First_Name, Users.Last_Name, Users.Role_Id,
+           (SELECT Clients.Id FROM Clients WHERE Clients.User_Id = Users.Id),
+           (SELECT MIN(Employees.Id) FROM Employees WHERE Employees.User_Id = Users.Id)
+    FROM Users
+"""
+
+SESSION_BY_ID = SESSION + "WHERE Users.Id = %s"
+
+SESSION_BY_CREDENTIALS = SESSION + "WHERE Users.First_name = %s AND Users.Password = %s"
+
+CATALOG = """
+    SELECT fruits.Id, fruits.Name, fruits.Creation_date, fruits.Price,
+           fruits.Expiration_date, producers.Name AS Producer_Name, producers.Country
+    FROM fruits
+    JOIN producers ON fruits.Producer_Id = producers.Id
+    ORDER BY fruits.Id
+"""
+
+# Рейтинг берётся из сводки Fruit_Ratings: одна строка по ключу на фрукт
+FRUITS_PAGE = """
+    SELECT f.Id, f.Name, f.Price, COALESCE(r.Review_Count, 0), COALESCE(r.Rating_Sum, 0)
+    FROM Fruits f
+    LEFT JOIN Fruit_Ratings r ON r.Fruit_Id = f.Id
+"""
+
+FRUITS_FIRST_PAGE = FRUITS_PAGE + """
+    ORDER BY f.Name, f.Id
+"""
+
+FRUITS_NEXT_PAGE = FRUITS_PAGE + """
+    WHERE (f.Name, f.Id) > (%s, %s)
+    ORDER BY f.Name, f.Id
+"""
+
+FRUIT_RATING = """
+    SELECT Review_Count, Rating_Sum, Rating_1, Rating_2, Rating_3, Rating_4, Rating_5
+    FROM Fruit_Ratings
+    WHERE Fruit_Id = %s
+"""
+
+REBUILD_FRUIT_RATINGS = "SELECT RebuildFruitRatings(%s)"
+
+TRIGRAM_INDEX_EXISTS = "SELECT to_regclass('idx_fruits_name_trgm') IS NOT NULL"
+
+# Ближайшие по триграммам названия; ILIKE добавляет совпадения по подстроке ("app" -> "Apple", "Pineapple").
+# Шаблон ILIKE передаётся готовым (search.like_pattern): % и _ в тексте запроса экранированы
+FUZZY_FRUITS = """
+    SELECT Id, Name, Price, similarity(Name, %s) AS Score
+    FROM Fruits
+    WHERE Name %% %s OR Name ILIKE %s
+    ORDER BY Name <-> %s, Id
+    LIMIT %s
+"""
+
+# Запрос разбирается в двух конфигурациях и объединяется через ИЛИ; для одного языка обе совпадают.
+# ts_rank, а не ts_rank_cd: ранжируются все совпадения, и на частых словах cd-ранг втрое дороже.
+# Название фрукта - подзапросом: он вычисляется только для строк после сортировки и LIMIT.
+# Ранг имеет тип real: ключ страницы сравнивается тоже как real, иначе равные ранги не совпадут
+REVIEW_SEARCH = """
+    SELECT rv.Id, (SELECT f.Name FROM Fruits f WHERE f.Id = rv.Fruit_Id), rv.review_text, rv.Evaluation,
+           ts_rank(rv.Search_Vector, q.Query) AS Rank
+    FROM (SELECT websearch_to_tsquery(%s::regconfig, %s) || websearch_to_tsquery(%s::regconfig, %s)) AS q(Query),
+         Reviews rv
+    WHERE rv.Search_Vector @@ q.Query
+"""
+
+REVIEW_SEARCH_FIRST_PAGE = REVIEW_SEARCH + """
+    ORDER BY Rank DESC, rv.Id DESC
+"""
+
+REVIEW_SEARCH_NEXT_PAGE = REVIEW_SEARCH + """
+        AND (ts_rank(rv.Search_Vector, q.Query), rv.Id) < (%s::real, %s)
+    ORDER BY Rank DESC, rv.Id DESC
+"""
+
+FRUIT_REVIEWS = """
+    SELECT Reviews.Id, Reviews.review_text, Reviews.evaluation, Users.First_Name, Users.Last_Name
+    FROM Reviews
+    JOIN Fruits ON Reviews.Fruit_Id = Fruits.Id
+    JOIN Clients ON Reviews.Client_Id = Clients.Id
+    JOIN Users ON Clients.User_Id = Users.Id
+    WHERE LOWER(Fruits.Name) = LOWER(%s);
+"""
+
+# Материализованный справочник (миграция 0013), обновляется employee_directory.DirectoryRefresher
+EMPLOYEES = """
+    SELECT Id, First_Name, Last_Name, Salary, Start_Work, End_Work, Positions
+    FROM Employee_Directory
+    ORDER BY Id;
+"""
+
+REFRESH_EMPLOYEE_DIRECTORY = "SELECT RefreshEmployeeDirectory(%s);"
+
+FRUIT_ID_BY_NAME = "SELECT Id FROM Fruits WHERE LOWER(Name) = LOWER(%s);"
+
+FRUIT_ID_BY_EXACT_NAME = """
+    SELECT fruits.Id
+    FROM fruits
+    WHERE fruits.Name = %s"""
+
+ADD_REVIEW = "CALL AddReview(%s, %s, %s, %s)"
+
+# Цена не может измениться между чтением и вставкой заказа. Блокировка FOR NO KEY UPDATE (а не FOR SHARE,
+# которую два покупателя одного фрукта держали бы одновременно и взаимно ждали на RESERVE_STOCK)
+# берётся по порядку Id: корзины с общими фруктами не блокируют друг друга крест-накрест
+CHECKOUT_PRICES = """
+    SELECT LOWER(Name), Id, Name, Price
+    FROM Fruits
+    WHERE LOWER(Name) = ANY(%s)
+    ORDER BY Id
+    FOR NO KEY UPDATE
+"""
+
+# Строки фруктов группы пакета (отзывы и заказы) блокируются в начале транзакции в порядке Id
+LOCK_FRUITS_BY_NAMES = """
+    SELECT Id
+    FROM Fruits
+    WHERE LOWER(Name) = ANY(%s)
+    ORDER BY Id
+    FOR NO KEY UPDATE
+"""
+
+# Условное уменьшение остатка одним оператором: фрукты, которых не хватает, не возвращаются
+RESERVE_STOCK = """
+    UPDATE Fruits f
+    SET Stock = f.Stock - line.Item_quantity
+    FROM unnest(%s::integer[], %s::integer[]) AS line(Fruit_Id, Item_quantity)
+    WHERE f.Id = line.Fruit_Id AND f.Stock >= line.Item_quantity
+    RETURNING f.Id
+"""
+
+FRUIT_STOCK_BY_IDS = "SELECT Id, Name, Stock FROM Fruits WHERE Id = ANY(%s) ORDER BY Id"
+
+INSERT_ORDERS = """
+    INSERT INTO Orders (Creation_date, Total_price, Item_quantity, Client_Id, Fruit_Id)
+    SELECT %s, line.Total_price, line.Item_quantity, %s, line.Fruit_Id
+    FROM unnest(%s::integer[], %s::integer[], %s::integer[]) AS line(Fruit_Id, Item_quantity, Total_price)
+    RETURNING Id, Fruit_Id, Item_quantity, Total_price
+"""
+
+# Статус доставки и сумма нарастающим итогом считаются в запросе. Итог - сколько клиент потратил
+# с первого заказа по текущий включительно: от суммы из сводки (на следующих страницах - от итога,
+# переданного в ключе страницы) вычитаются более новые заказы страницы
+# Таблицы подставляются при импорте: по умолчанию история читает только секции Orders/Delivery,
+# с архивом - представления, объединяющие их со схемой archive
+_HISTORY = """
+    SELECT O.Creation_date, D.Delivery_date, F.Name, O.Total_price, O.Item_quantity, O.Id,
+           CASE
+               WHEN D.Delivery_date IS NULL THEN 'Ожидается'
+               WHEN D.Delivery_date::date < CURRENT_DATE THEN 'Доставлен'
+               WHEN D.Delivery_date::date = CURRENT_DATE THEN 'Доставка сегодня'
+               ELSE 'Осталось ' || (D.Delivery_date::date - CURRENT_DATE) || ' дней'
+           END AS Status,
+           D.Delivery_date::date - CURRENT_DATE AS Days_Remaining,
+           COALESCE(%s::bigint, (SELECT s.Total_Spent FROM Client_Order_Summary s WHERE s.Client_Id = %s))
+               - COALESCE(SUM(O.Total_price) OVER (ORDER BY O.Creation_date DESC, O.Id DESC
+                                                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0)
+               AS Running_Total
+    FROM {orders} O
+    LEFT JOIN {delivery} D ON D.Order_Id = O.Id AND D.Order_Creation_date = O.Creation_date
+    JOIN Fruits F ON O.Fruit_Id = F.Id
+    WHERE O.Client_Id = %s
+"""
+
+_HISTORY_ORDER = """
+    ORDER BY O.Creation_date DESC, O.Id DESC
+"""
+
+_HISTORY_AFTER = """
+        AND (O.Creation_date, O.Id) < (%s, %s)
+"""
+
+HISTORY = _HISTORY.format(orders="Orders", delivery="Delivery")
+
+HISTORY_FIRST_PAGE = HISTORY + _HISTORY_ORDER
+
+HISTORY_NEXT_PAGE = HISTORY + _HISTORY_AFTER + _HISTORY_ORDER
+
+ARCHIVE_HISTORY = _HISTORY.format(orders="Orders_With_Archive", delivery="Delivery_With_Archive")
+
+ARCHIVE_HISTORY_FIRST_PAGE = ARCHIVE_HISTORY + _HISTORY_ORDER
+
+ARCHIVE_HISTORY_NEXT_PAGE = ARCHIVE_HISTORY + _HISTORY_AFTER + _HISTORY_ORDER
+
+# Для запросов истории: общий план с отсечением секций при выполнении вместо частного плана на каждый вызов
+GENERIC_PLAN = "SET LOCAL plan_cache_mode = force_generic_plan"
+
+CLIENT_HAS_ARCHIVE = "SELECT EXISTS (SELECT 1 FROM archive.Orders WHERE Client_Id = %s)"
+
+CLIENT_ORDER_SUMMARY = """
+    SELECT Order_Count, Total_Spent, Last_Order_Date
+    FROM Client_Order_Summary
+    WHERE Client_Id = %s AND Order_Count > 0
+"""
+
+REBUILD_CLIENT_ORDER_SUMMARY = "SELECT RebuildClientOrderSummary(%s)"
+
+PLAN_DELIVERIES = "SELECT PlanDeliveries(%s)"
+
+REBALANCE_DELIVERIES = "SELECT RebalanceDeliveries()"
+
+PENDING_DELIVERIES = "SELECT COUNT(*) FROM Delivery_Queue"
+
+DELIVERY_LOAD = """
+    SELECT Delivery_Day, Booked, Capacity
+    FROM Delivery_Days
+    WHERE Delivery_Day >= CURRENT_DATE AND Booked > 0
+    ORDER BY Delivery_Day
+"""
+
+CREATE_ORDER_PARTITION = "SELECT CreateOrderPartition(%s)"
+
+ENSURE_ORDER_PARTITIONS = "SELECT EnsureOrderPartitions(%s)"
+
+ARCHIVE_ORDER_PARTITIONS = "SELECT ArchiveOrderPartitions(%s)"
+
+ORDER_PARTITIONS = """
+    SELECT n.nspname, c.relname, pg_get_expr(c.relpartbound, c.oid), GREATEST(c.reltuples, 0)::bigint
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE i.inhparent IN ('public.orders'::regclass, 'archive.orders'::regclass)
+    ORDER BY c.relname
+"""
+
+DELIVERY_SETTINGS = "SELECT Default_Capacity, Lead_Days, Horizon_Days FROM Delivery_Settings"
+
+SET_DEFAULT_DELIVERY_CAPACITY = "UPDATE Delivery_Settings SET Default_Capacity = %s"
+
+# Дни с отдельно заданной вместимостью не меняются; выполняется до SET_DEFAULT_DELIVERY_CAPACITY
+SET_FUTURE_DELIVERY_CAPACITY = """
+    UPDATE Delivery_Days SET Capacity = %s
+    WHERE Delivery_Day >= CURRENT_DATE AND Capacity = (SELECT Default_Capacity FROM Delivery_Settings)
+"""
+
+SET_DELIVERY_CAPACITY = """
+    INSERT INTO Delivery_Days (Delivery_Day, Capacity)
+    SELECT d::date, %s
+    FROM generate_series(%s::date, %s::date, interval '1 day') d
+    ORDER BY 1
+    ON CONFLICT (Delivery_Day) DO UPDATE SET Capacity = EXCLUDED.Capacity
+"""
+
+USER_ID_BY_NAME = "SELECT Id FROM Users WHERE First_Name ILIKE %s"
+
+POSITIONS = "SELECT * FROM Positions;"
+
+PRODUCERS = "SELECT * FROM Producers;"
+
+DELETE_CLIENT = "DELETE FROM Clients WHERE User_Id = %s"
+
+INSERT_EMPLOYEE = """
+    INSERT INTO Employees (Salary, User_Id, Work_time_Id)
+    VALUES (%s, %s, (SELECT Id FROM Work_time WHERE start_work = %s AND end_work = %s))
+    RETURNING Id
+"""
+
+INSERT_EMPLOYEE_POSITIONS = """
+    INSERT INTO Positions_Employees (Position_Id, Employee_Id)
+    SELECT Id, %s FROM Positions WHERE Id = ANY(%s)
+"""
+
+SET_EMPLOYEE_ROLE = """
+    UPDATE Users
+    SET Role_Id = 3
+    WHERE Id = %s
+"""
+
+INSERT_PRODUCER = """
+    INSERT INTO Producers (Name, Country)
+    VALUES (%s, %s)
+"""
+
+ADD_FRUIT = "CALL AddFruit(%s, %s, %s, %s, %s)"
+
+DELETE_LOW_RATED_REVIEWS = "CALL DeleteLowRatedReviewsForAllFruits()"
+
+FRUIT_BY_NAME = "SELECT * FROM Fruits WHERE LOWER(Name) = LOWER(%s);"
+
+DELETE_FRUIT = "DELETE FROM Fruits WHERE LOWER(Name) = LOWER(%s);"
+
+INSERT_USER = """
+    INSERT INTO Users (First_Name, Last_Name, Phone, Password, Role_Id)
+    VALUES (%s, %s, %s, %s, %s)
+    RETURNING Id
+"""
+
+INSERT_CLIENT = """
+    INSERT INTO Clients (User_Id, Address)
+    VALUES (%s, %s)
+    RETURNING Id
+"""
+
+APPLY_SALARY_ADJUSTMENTS = "SELECT ApplySalaryAdjustments()"
+
+PENDING_SALARY_ADJUSTMENTS = "SELECT COALESCE(SUM(Positive_Reviews), 0) FROM Salary_Adjustments_Pending"
+
+
+APPLY_SALES_CHANGES = "SELECT ApplySalesChanges()"
+
+PENDING_SALES_CHANGES = "SELECT COUNT(*) FROM Sales_Changes"
+
+REBUILD_SALES_DAILY = "SELECT RebuildSalesDaily(%s)"
+
+
+# Отчёт читает итоги дней и ещё не свёрнутую часть журнала: результат точен без ожидания sales-rollup
+_SALES_REPORT = """
+    SELECT {key} AS {name},
+           SUM(s.Order_Count) AS Orders,
+           SUM(s.Item_Quantity) AS Quantity,
+           SUM(s.Revenue) AS Revenue
+    FROM (
+        SELECT Sale_Day, Fruit_Id, Order_Count, Item_Quantity, Revenue
+        FROM Sales_Daily
+        WHERE Sale_Day BETWEEN %s AND %s
+        UNION ALL
+        SELECT Sale_Day, Fruit_Id, Order_Count, Item_Quantity, Revenue
+        FROM Sales_Changes
+        WHERE Sale_Day BETWEEN %s AND %s
+    ) s
+    JOIN Fruits f ON f.Id = s.Fruit_Id
+    JOIN Producers p ON p.Id = f.Producer_Id
+    GROUP BY 1
+    HAVING SUM(s.Order_Count) <> 0
+    ORDER BY {order}
+"""
+
+SALES_REPORTS = {
+    "day": _SALES_REPORT.format(key="s.Sale_Day", name="Day", order="1"),
+    "fruit": _SALES_REPORT.format(key="f.Name || ' / ' || p.Name", name="Fruit", order="4 DESC, 1"),
+    "producer": _SALES_REPORT.format(key="p.Name", name="Producer", order="4 DESC, 1"),
+    "country": _SALES_REPORT.format(key="p.Country", name="Country", order="4 DESC, 1"),
+}
+
+SALES_EXPORT = """
+    SELECT o.Creation_date AS Order_Date, o.Id AS Order_Id, f.Name AS Fruit, p.Name AS Producer,
+           p.Country AS Country, o.Item_quantity AS Quantity, o.Total_price AS Total_Price
+    FROM Orders_With_Archive o
+    JOIN Fruits f ON f.Id = o.Fruit_Id
+    JOIN Producers p ON p.Id = f.Producer_Id
+    WHERE o.Creation_date BETWEEN %s AND %s
+    ORDER BY o.Creation_date, o.Id
+"""
+
+
+# Фильтры NULL не применяются; apply = false - предпросмотр без изменений
+REPRICE_FRUITS = "SELECT * FROM RepriceFruits(%s, %s, %s, %s, %s, %s, %s, %s)"
+
+PRICE_HISTORY = """
+    SELECT h.Changed_at, f.Name, h.Old_Price, h.New_Price, h.Markdown, h.Reason
+    FROM Price_History h
+    JOIN Fruits f ON f.Id = h.Fruit_Id
+    WHERE LOWER(f.Name) = LOWER(%s)
+    ORDER BY h.Id DESC
+    LIMIT %s
+"""
+
+FRUIT_STOCK = """
+    SELECT f.Name, p.Name, f.Stock
+    FROM Fruits f
+    JOIN Producers p ON p.Id = f.Producer_Id
+    WHERE %s::text IS NULL OR LOWER(f.Name) = LOWER(%s)
+    ORDER BY f.Stock, f.Name
+    LIMIT %s
+"""
+
+# Поступление на склад; отрицательное количество - списание, но не больше остатка
+ADD_FRUIT_STOCK = """
+    UPDATE Fruits SET Stock = Stock + %s
+    WHERE LOWER(Name) = LOWER(%s) AND Stock + %s >= 0
+    RETURNING Name, Stock
+"""
+
+SET_FRUIT_STOCK = """
+    UPDATE Fruits SET Stock = %s
+    WHERE LOWER(Name) = LOWER(%s)
+    RETURNING Name, Stock
+"""
+
+# Проверка и уборка нагрузочного теста склада (benchmark.run_stock_stress)
+FRUIT_SOLD_QUANTITY = "SELECT COUNT(*), COALESCE(SUM(Item_quantity), 0) FROM Orders WHERE Fruit_Id = %s"
+
+DELETE_FRUIT_ORDERS = "DELETE FROM Orders WHERE Fruit_Id = %s"
+
+DELETE_USERS = "DELETE FROM Users WHERE Id = ANY(%s)"
+
+
+COPY_AUDIT_LOG = "COPY Audit_Log (Event_Id, Logged_at, User_Id, Action, Details) FROM STDIN WITH (FORMAT csv)"
+
+
+@functools.lru_cache(maxsize=None)
+def numbered(sql):
+    # psycopg2 использует %s и %% для знака процента, asyncpg - $1, $2, ... и просто %
+    counter = iter(range(1, sql.count("%s") + 1))
+    return re.sub(r"%[s%]", lambda match: "%" if match.group() == "%%" else f"${next(counter)}", sql)
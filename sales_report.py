@@ -0,0 +1,56 @@
+import sys
+
+from psycopg2 import extensions
+
+import db
+import queries
+
+REPORT_DIMENSIONS = tuple(queries.SALES_REPORTS)
+
+REPORT_HEADERS = {"day": "День", "fruit": "Фрукт / производитель", "producer": "Производитель", "country": "Страна"}
+
+
+def sales_report(first_day, last_day, by="fruit"):
+    # Отчёты и выгрузки идут на реплику, если она задана, и не нагружают основной сервер
+    with db.connection(read_only=True) as conn, conn.cursor() as cursor:
+        cursor.execute(queries.SALES_REPORTS[by], (first_day, last_day) * 2)
+        return cursor.fetchall()
+
+
+def copy_csv(query, params, target):
+    # COPY ... TO STDOUT: сервер отдаёт CSV потоком, psycopg2 пишет его в target по мере получения,
+    # поэтому память не зависит от размера выгрузки. COPY не принимает параметров - они подставляются mogrify
+    with db.connection(read_only=True) as conn, conn.cursor() as cursor:
+        sql = cursor.mogrify(query, params).decode(extensions.encodings[conn.encoding])
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", target)
+        return cursor.rowcount
+
+
+def export_csv(query, params, path):
+    if path == "-":
+        return copy_csv(query, params, sys.stdout)
+    with open(path, "w", encoding="utf-8", newline="") as target:
+        return copy_csv(query, params, target)
+
+
+def run_report(first_day, last_day, by="fruit", csv_path=None):
+    if csv_path is not None:
+        exported = export_csv(queries.SALES_REPORTS[by], (first_day, last_day) * 2, csv_path)
+        if csv_path != "-":
+            print(f"Выгружено строк: {exported}")
+        return
+
+    rows = sales_report(first_day, last_day, by)
+    print(f"Продажи с {first_day} по {last_day}")
+    print(f"{REPORT_HEADERS[by]} | Заказов | Количество | Выручка")
+    print("------------------------------------------------------")
+    for key, orders, quantity, revenue in rows:
+        print(f"{key} | {orders} | {quantity} | {revenue}")
+    print(f"Итого: заказов {sum(row[1] for row in rows)}, количество {sum(row[2] for row in rows)}, "
+          f"выручка {sum(row[3] for row in rows)}")
+
+
+def run_export(first_day, last_day, path):
+    exported = export_csv(queries.SALES_EXPORT, (first_day, last_day), path)
+    if path != "-":
+        print(f"Выгружено заказов: {exported}")
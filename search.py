@@ -0,0 +1,66 @@
+import difflib
+
+import db
+import paging
+import queries
+from catalog_cache import catalog
+
+REVIEW_LANGUAGES = {"ru": "russian", "en": "english"}
+FUZZY_LIMIT = 10
+FUZZY_MIN_SCORE = 0.6
+# Кроме порога: не хуже этой доли от лучшего совпадения, чтобы к точному попаданию не добавлялись случайные
+FUZZY_RELATIVE_SCORE = 0.75
+
+_trigram_index = None
+
+
+def trigram_index_available():
+    global _trigram_index
+    if _trigram_index is None:
+        with db.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(queries.TRIGRAM_INDEX_EXISTS)
+            _trigram_index = cursor.fetchone()[0]
+    return _trigram_index
+
+
+def rank_names(text, fruits, limit=FUZZY_LIMIT):
+    # Запасной вариант без pg_trgm: каталог невелик и уже лежит в памяти
+    key = text.casefold()
+    scored = []
+    for fruit in fruits:
+        name = fruit[1].casefold()
+        scored.append((difflib.SequenceMatcher(None, key, name).ratio(), key and key in name, fruit))
+    cutoff = max([FUZZY_MIN_SCORE] + [score * FUZZY_RELATIVE_SCORE for score, _, _ in scored])
+    # Совпадение по подстроке попадает в результат, как ILIKE в FUZZY_FRUITS, но со своим сходством
+    scored = [(score, fruit) for score, substring, fruit in scored if score >= cutoff or substring]
+    scored.sort(key=lambda item: (-item[0], item[1][1], item[1][0]))
+    return [(fruit[0], fruit[1], fruit[3], round(score, 3)) for score, fruit in scored[:limit]]
+
+
+def like_pattern(text):
+    # Подстрока для ILIKE: % и _ из запроса ищутся как обычные символы
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def find_fruits(text, limit=FUZZY_LIMIT):
+    if not trigram_index_available():
+        return rank_names(text, catalog.fruits(), limit)
+    with db.connection(read_only=True) as conn, conn.cursor() as cursor:
+        cursor.execute(queries.FUZZY_FRUITS, (text, text, like_pattern(text), text, limit))
+        return cursor.fetchall()
+
+
+def review_configs(language):
+    if language is None:
+        return REVIEW_LANGUAGES["ru"], REVIEW_LANGUAGES["en"]
+    if language not in REVIEW_LANGUAGES:
+        raise ValueError(f"Неизвестный язык: {language}. Доступны: {', '.join(REVIEW_LANGUAGES)}")
+    return REVIEW_LANGUAGES[language], REVIEW_LANGUAGES[language]
+
+
+def fetch_reviews_page(text, language, after, limit):
+    first, second = review_configs(language)
+    params = (first, text, second, text)
+    if after is None:
+        return paging.stream_rows(queries.REVIEW_SEARCH_FIRST_PAGE, params, limit, read_only=True)
+    return paging.stream_rows(queries.REVIEW_SEARCH_NEXT_PAGE, params + after, limit, read_only=True)
@@ -0,0 +1,106 @@
+import threading
+import weakref
+
+import db
+import notifications
+import prepared
+import queries
+
+ADMIN_ROLE_ID = 1
+CLIENT_ROLE_ID = 2
+EMPLOYEE_ROLE_ID = 3
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_subscribed = False
+
+
+class Session:
+    def __init__(self, user_id, first_name, last_name, role_id, client_id=None, employee_id=None):
+        self.user_id = user_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.role_id = role_id
+        self.client_id = client_id
+        self.employee_id = employee_id
+        self.cart = {}
+        self.stale = False
+
+    def refresh(self):
+        if not self.stale:
+            return
+        with db.connection() as conn, conn.cursor() as cursor:
+            prepared.execute(cursor, queries.SESSION_BY_ID, (self.user_id,))
+            row = cursor.fetchone()
+        self.stale = False
+        if row:
+            (_, self.first_name, self.last_name,
+             self.role_id, self.client_id, self.employee_id) = row
+        else:
+            self.role_id = self.client_id = self.employee_id = None
+
+    @property
+    def is_admin(self):
+        self.refresh()
+        return self.role_id == ADMIN_ROLE_ID
+
+    @property
+    def is_client(self):
+        self.refresh()
+        return self.role_id == CLIENT_ROLE_ID
+
+    @property
+    def is_employee(self):
+        self.refresh()
+        return self.role_id == EMPLOYEE_ROLE_ID
+
+
+def _register(session):
+    global _subscribed
+    with _sessions_lock:
+        _sessions.setdefault(session.user_id, weakref.WeakSet()).add(session)
+        subscribe = not _subscribed
+        _subscribed = True
+    if subscribe:
+        notifications.subscribe("user_role_changed", _on_role_changed)
+    return session
+
+
+def _on_role_changed(payload):
+    if payload is None:
+        invalidate_all()
+    else:
+        invalidate(int(payload))
+
+
+def invalidate(user_id):
+    with _sessions_lock:
+        sessions = list(_sessions.get(user_id, ()))
+    for session in sessions:
+        session.stale = True
+
+
+def invalidate_all():
+    with _sessions_lock:
+        sessions = [session for group in _sessions.values() for session in group]
+    for session in sessions:
+        session.stale = True
+
+
+def create_session(user_id, first_name, last_name, role_id, client_id=None, employee_id=None):
+    return _register(Session(user_id, first_name, last_name, role_id, client_id, employee_id))
+
+
+def load_session(conn, user_id):
+    with conn.cursor() as cursor:
+        prepared.execute(cursor, queries.SESSION_BY_ID, (user_id,))
+        row = cursor.fetchone()
+    return create_session(*row) if row else None
+
+
+def authenticate(conn, first_name, password):
+    with conn.cursor() as cursor:
+        prepared.execute(cursor, queries.SESSION_BY_CREDENTIALS, (first_name, password))
+        row = cursor.fetchone()
+    return create_session(*row) if row else None
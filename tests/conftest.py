@@ -0,0 +1,87 @@
+import datetime
+import itertools
+import os
+
+import psycopg2
+import pytest
+
+import instrumentation
+import queries
+import session
+
+TEST_DSN_ENV = "FRUIT_SHOP_TEST_DSN"
+
+
+@pytest.fixture(scope="session")
+def database():
+    # База с применёнными миграциями (python manage.py migrate); без неё тесты пропускаются.
+    # Тот же класс соединения, что в пуле приложения: prepared хранит в нём подготовленные операторы
+    dsn = os.environ.get(TEST_DSN_ENV)
+    if not dsn:
+        pytest.skip(f"{TEST_DSN_ENV} не задана: тесты с базой пропущены")
+    try:
+        conn = psycopg2.connect(dsn, connection_factory=instrumentation.InstrumentedConnection)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Тестовая база недоступна: {e}")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def conn(database):
+    # Каждый тест работает в своей транзакции, которая откатывается: тестовая база не меняется
+    yield database
+    database.rollback()
+
+
+@pytest.fixture
+def cursor(conn):
+    with conn.cursor() as cursor:
+        yield cursor
+
+
+@pytest.fixture
+def fetchone(cursor):
+    def fetchone(sql, params=()):
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+    return fetchone
+
+
+@pytest.fixture
+def make_fruit(fetchone):
+    producer_id = fetchone("INSERT INTO Producers (Name, Country) VALUES ('Test producer', 'Testland') RETURNING Id")[0]
+    numbers = itertools.count()
+
+    def make_fruit(price=10, stock=0):
+        name = f"test fruit {next(numbers)}"
+        fruit_id = fetchone("""
+            INSERT INTO Fruits (Name, Creation_date, Price, Expiration_date, Producer_Id, Stock)
+            VALUES (%s, CURRENT_DATE, %s, 30, %s, %s)
+            RETURNING Id
+        """, (name, price, producer_id, stock))[0]
+        return fruit_id, name
+    return make_fruit
+
+
+@pytest.fixture
+def make_client(fetchone):
+    numbers = itertools.count()
+
+    def make_client():
+        user_id = fetchone(queries.INSERT_USER, (f"Test{next(numbers)}", "Client", "+375290000000", "test",
+                                                 session.CLIENT_ROLE_ID))[0]
+        return fetchone(queries.INSERT_CLIENT, (user_id, "test"))[0]
+    return make_client
+
+
+
+@pytest.fixture
+def place_orders(cursor):
+    # Одна корзина - один INSERT, как при оформлении заказа: [(fruit_id, количество, сумма), ...]
+    def place_orders(client_id, lines, day=None):
+        cursor.execute(queries.INSERT_ORDERS, (day or datetime.date.today(), client_id,
+                                               [line[0] for line in lines], [line[1] for line in lines],
+                                               [line[2] for line in lines]))
+        return [row[0] for row in cursor.fetchall()]
+    return place_orders
@@ -0,0 +1,59 @@
+import pytest
+
+from main import checkout
+
+
+def stock(fetchone, fruit_id):
+    return fetchone("SELECT Stock FROM Fruits WHERE Id = %s", (fruit_id,))[0]
+
+
+def test_checkout_reserves_stock(conn, fetchone, make_fruit, make_client):
+    apple_id, apple = make_fruit(price=3, stock=10)
+    pear_id, pear = make_fruit(price=5, stock=4)
+
+    orders = checkout(conn, make_client(), [(apple, 2), (pear, 4), (apple.upper(), 1)])
+
+    # Строки одного фрукта объединяются, название - без учёта регистра
+    assert sorted((name, quantity, total) for _, name, quantity, total in orders) == [(apple, 3, 9), (pear, 4, 20)]
+    assert stock(fetchone, apple_id) == 7
+    assert stock(fetchone, pear_id) == 0
+
+
+def test_checkout_rejects_cart_when_any_fruit_is_short(conn, cursor, fetchone, make_fruit, make_client):
+    apple_id, apple = make_fruit(stock=10)
+    pear_id, pear = make_fruit(stock=1)
+    client_id = make_client()
+
+    # Приложение откатывает транзакцию заказа после ошибки, здесь - точку сохранения
+    cursor.execute("SAVEPOINT checkout")
+    with pytest.raises(ValueError, match="Недостаточно на складе"):
+        checkout(conn, client_id, [(apple, 2), (pear, 2)])
+    cursor.execute("ROLLBACK TO SAVEPOINT checkout")
+
+    assert stock(fetchone, apple_id) == 10
+    assert stock(fetchone, pear_id) == 1
+    assert fetchone("SELECT COUNT(*) FROM Orders WHERE Client_Id = %s", (client_id,)) == (0,)
+
+
+def test_checkout_rejects_bad_quantities_and_unknown_fruits(conn, make_fruit, make_client):
+    _, apple = make_fruit(stock=10)
+    client_id = make_client()
+    with pytest.raises(ValueError, match="положительным"):
+        checkout(conn, client_id, [(apple, 0)])
+    with pytest.raises(ValueError, match="Фрукты не найдены"):
+        checkout(conn, client_id, [("no such fruit", 1)])
+
+
+def test_deleting_orders_releases_stock(conn, cursor, fetchone, make_fruit, make_client):
+    apple_id, apple = make_fruit(stock=10)
+    pear_id, pear = make_fruit(stock=10)
+    client_id = make_client()
+    orders = checkout(conn, client_id, [(apple, 3), (pear, 2)])
+    checkout(conn, client_id, [(apple, 4)])
+
+    cursor.execute("DELETE FROM Orders WHERE Id = %s", (orders[0][0],))
+    assert (stock(fetchone, apple_id), stock(fetchone, pear_id)) == (6, 8)
+
+    # Удаление клиента удаляет его заказы каскадом, остаток возвращается одним оператором
+    cursor.execute("DELETE FROM Clients WHERE Id = %s", (client_id,))
+    assert (stock(fetchone, apple_id), stock(fetchone, pear_id)) == (10, 10)
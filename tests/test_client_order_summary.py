@@ -0,0 +1,51 @@
+import datetime
+
+import queries
+
+
+def summary(fetchone, client_id):
+    return fetchone("SELECT Order_Count, Total_Spent, Last_Order_Date FROM Client_Order_Summary WHERE Client_Id = %s",
+                    (client_id,))
+
+
+def test_cart_updates_summary_once(fetchone, make_fruit, make_client, place_orders):
+    apple, _ = make_fruit()
+    pear, _ = make_fruit()
+    client_id = make_client()
+    today = datetime.date.today()
+    place_orders(client_id, [(apple, 2, 20), (pear, 1, 15)])
+
+    assert summary(fetchone, client_id) == (2, 35, today)
+    assert fetchone(queries.CLIENT_ORDER_SUMMARY, (client_id,)) == (2, 35, today)
+
+
+def test_deleting_last_order_moves_last_order_date(cursor, fetchone, make_fruit, make_client, place_orders):
+    fruit_id, _ = make_fruit()
+    client_id = make_client()
+    today = datetime.date.today()
+    earlier = today - datetime.timedelta(days=3)
+    place_orders(client_id, [(fruit_id, 1, 10)], day=earlier)
+    latest = place_orders(client_id, [(fruit_id, 2, 20)])
+
+    cursor.execute("DELETE FROM Orders WHERE Id = ANY(%s)", (latest,))
+    assert summary(fetchone, client_id) == (1, 10, earlier)
+
+    cursor.execute("DELETE FROM Orders WHERE Client_Id = %s", (client_id,))
+    assert summary(fetchone, client_id) == (0, 0, None)
+    # Клиент без заказов сводку не показывает
+    assert fetchone(queries.CLIENT_ORDER_SUMMARY, (client_id,)) is None
+
+
+def test_rebuild_restores_summary(cursor, fetchone, make_fruit, make_client, place_orders):
+    fruit_id, _ = make_fruit()
+    client_id = make_client()
+    place_orders(client_id, [(fruit_id, 1, 10), (fruit_id, 3, 30)])
+    fetchone(queries.REBUILD_CLIENT_ORDER_SUMMARY, (True,))
+    assert fetchone(queries.REBUILD_CLIENT_ORDER_SUMMARY, (False,)) == (0,)
+
+    cursor.execute("UPDATE Client_Order_Summary SET Total_Spent = 1 WHERE Client_Id = %s", (client_id,))
+    assert fetchone(queries.REBUILD_CLIENT_ORDER_SUMMARY, (False,)) == (1,)
+    assert summary(fetchone, client_id)[1] == 1
+
+    assert fetchone(queries.REBUILD_CLIENT_ORDER_SUMMARY, (True,)) == (1,)
+    assert summary(fetchone, client_id) == (2, 40, datetime.date.today())
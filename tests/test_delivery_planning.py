@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+import queries
+
+LEAD_DAYS = 400
+
+
+@pytest.fixture
+def first_day(cursor):
+    # Дни далеко впереди ещё не созданы: их вместимость задаёт Default_Capacity. Очередь - только заказы теста
+    cursor.execute("UPDATE Delivery_Settings SET Default_Capacity = 2, Lead_Days = %s, Horizon_Days = 2", (LEAD_DAYS,))
+    cursor.execute("DELETE FROM Delivery_Queue")
+    return datetime.date.today() + datetime.timedelta(days=LEAD_DAYS)
+
+
+def deliveries(cursor, order_ids):
+    cursor.execute("SELECT Order_Id, Delivery_date::date FROM Delivery WHERE Order_Id = ANY(%s) ORDER BY Order_Id",
+                   (order_ids,))
+    return cursor.fetchall()
+
+
+def load(cursor, first_day):
+    cursor.execute("SELECT Delivery_Day, Booked, Capacity FROM Delivery_Days WHERE Delivery_Day >= %s "
+                   "ORDER BY Delivery_Day", (first_day,))
+    return cursor.fetchall()
+
+
+def test_orders_beyond_capacity_stay_queued(cursor, fetchone, first_day, make_fruit, make_client, place_orders):
+    fruit_id, _ = make_fruit()
+    order_ids = place_orders(make_client(), [(fruit_id, 1, 10)] * 5)
+    second_day = first_day + datetime.timedelta(days=1)
+
+    assert fetchone(queries.PLAN_DELIVERIES, (100,)) == (4,)
+    # Заказы получают ближайшие дни по порядку Id, дни заполнены ровно до вместимости
+    assert deliveries(cursor, order_ids) == [(order_ids[0], first_day), (order_ids[1], first_day),
+                                             (order_ids[2], second_day), (order_ids[3], second_day)]
+    assert load(cursor, first_day) == [(first_day, 2, 2), (second_day, 2, 2)]
+    assert fetchone("SELECT Order_Id FROM Delivery_Queue") == (order_ids[4],)
+
+    assert fetchone(queries.PLAN_DELIVERIES, (100,)) == (0,)
+
+    cursor.execute(queries.SET_DELIVERY_CAPACITY, (3, second_day, second_day))
+    assert fetchone(queries.PLAN_DELIVERIES, (100,)) == (1,)
+    assert load(cursor, first_day) == [(first_day, 2, 2), (second_day, 3, 3)]
+    assert fetchone(queries.PENDING_DELIVERIES) == (0,)
+
+
+def test_batch_size_limits_pass(cursor, fetchone, first_day, make_fruit, make_client, place_orders):
+    fruit_id, _ = make_fruit()
+    order_ids = place_orders(make_client(), [(fruit_id, 1, 10)] * 3)
+
+    assert fetchone(queries.PLAN_DELIVERIES, (1,)) == (1,)
+    assert deliveries(cursor, order_ids) == [(order_ids[0], first_day)]
+    assert fetchone(queries.PENDING_DELIVERIES) == (2,)
+
+
+def test_deleting_order_frees_its_day(cursor, fetchone, first_day, make_fruit, make_client, place_orders):
+    fruit_id, _ = make_fruit()
+    order_ids = place_orders(make_client(), [(fruit_id, 1, 10)] * 2)
+    fetchone(queries.PLAN_DELIVERIES, (100,))
+
+    cursor.execute("DELETE FROM Orders WHERE Id = %s", (order_ids[0],))
+    assert load(cursor, first_day) == [(first_day, 1, 2), (first_day + datetime.timedelta(days=1), 0, 2)]
@@ -0,0 +1,54 @@
+import queries
+
+ADD_REVIEWS = """
+    INSERT INTO Reviews (Review_text, Evaluation, Client_Id, Fruit_Id)
+    SELECT 'test', e, %s, %s FROM unnest(%s::integer[]) AS e
+"""
+
+
+def rating(fetchone, fruit_id):
+    # (Review_Count, Rating_Sum, Rating_1, ..., Rating_5)
+    return fetchone(queries.FRUIT_RATING, (fruit_id,))
+
+
+def test_insert_counts_reviews_per_evaluation(cursor, fetchone, make_fruit, make_client):
+    fruit_id, _ = make_fruit()
+    client_id = make_client()
+    cursor.execute(ADD_REVIEWS, (client_id, fruit_id, [5, 5, 4, 1]))
+    cursor.execute(queries.ADD_REVIEW, ("test", 3, client_id, fruit_id))
+
+    assert rating(fetchone, fruit_id) == (5, 18, 1, 0, 1, 1, 2)
+
+
+def test_update_and_delete_adjust_summary(cursor, fetchone, make_fruit, make_client):
+    fruit_id, _ = make_fruit()
+    other_id, _ = make_fruit()
+    client_id = make_client()
+    cursor.execute(ADD_REVIEWS, (client_id, fruit_id, [5, 2, 2]))
+
+    cursor.execute("UPDATE Reviews SET Evaluation = 4 WHERE Fruit_Id = %s AND Evaluation = 2", (fruit_id,))
+    assert rating(fetchone, fruit_id) == (3, 13, 0, 0, 0, 2, 1)
+
+    # Перенос отзыва на другой фрукт меняет обе сводки
+    cursor.execute("UPDATE Reviews SET Fruit_Id = %s WHERE Fruit_Id = %s AND Evaluation = 5", (other_id, fruit_id))
+    assert rating(fetchone, fruit_id) == (2, 8, 0, 0, 0, 2, 0)
+    assert rating(fetchone, other_id) == (1, 5, 0, 0, 0, 0, 1)
+
+    cursor.execute("DELETE FROM Reviews WHERE Fruit_Id = %s", (fruit_id,))
+    assert rating(fetchone, fruit_id) == (0, 0, 0, 0, 0, 0, 0)
+
+
+def test_rebuild_restores_summary(cursor, fetchone, make_fruit, make_client):
+    fruit_id, _ = make_fruit()
+    cursor.execute(ADD_REVIEWS, (make_client(), fruit_id, [3, 4]))
+    fetchone(queries.REBUILD_FRUIT_RATINGS, (True,))
+    assert fetchone(queries.REBUILD_FRUIT_RATINGS, (False,)) == (0,)
+
+    cursor.execute("UPDATE Fruit_Ratings SET Review_Count = 10, Rating_3 = 0 WHERE Fruit_Id = %s", (fruit_id,))
+    # Проверка без применения только считает расхождения
+    assert fetchone(queries.REBUILD_FRUIT_RATINGS, (False,)) == (1,)
+    assert rating(fetchone, fruit_id) == (10, 7, 0, 0, 0, 1, 0)
+
+    assert fetchone(queries.REBUILD_FRUIT_RATINGS, (True,)) == (1,)
+    assert rating(fetchone, fruit_id) == (2, 7, 0, 0, 1, 1, 0)
+    assert fetchone(queries.REBUILD_FRUIT_RATINGS, (False,)) == (0,)
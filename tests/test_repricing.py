@@ -0,0 +1,35 @@
+import queries
+
+
+def reprice(cursor, percentage=None, fruit_name=None, markdown_days=None, markdown_percents=None):
+    cursor.execute(queries.REPRICE_FRUITS, (percentage, fruit_name, None, None, None, markdown_days,
+                                                     markdown_percents, True))
+    return cursor.fetchall()
+
+
+def price(fetchone, fruit_id):
+    return fetchone("SELECT Price FROM Fruits WHERE Id = %s", (fruit_id,))[0]
+
+
+def test_markdown_applies_deeper_tier_only(cursor, fetchone, make_fruit):
+    # Срок годности make_fruit - 30 дней
+    fruit_id, name = make_fruit(price=100)
+    assert len(reprice(cursor, fruit_name=name, markdown_days=[30], markdown_percents=[20])) == 1
+    assert price(fetchone, fruit_id) == 80
+
+    # Та же ступень: цена не меняется
+    assert reprice(cursor, fruit_name=name, markdown_days=[30], markdown_percents=[20]) == []
+    # Более глубокая ступень считается от цены до уценки
+    reprice(cursor, fruit_name=name, markdown_days=[30], markdown_percents=[40])
+    assert price(fetchone, fruit_id) == 60
+
+
+def test_plain_reprice_keeps_current_markdown(cursor, fetchone, make_fruit):
+    fruit_id, name = make_fruit(price=100)
+    reprice(cursor, fruit_name=name, markdown_days=[30], markdown_percents=[20])
+    reprice(cursor, percentage=10, fruit_name=name)
+    assert price(fetchone, fruit_id) == 88
+
+    # Обычное изменение цены не сбрасывает уценку: повторная уценка той же ступенью не применяется
+    assert reprice(cursor, fruit_name=name, markdown_days=[30], markdown_percents=[20]) == []
+    assert price(fetchone, fruit_id) == 88
@@ -0,0 +1,59 @@
+import datetime
+
+import queries
+
+
+def daily(fetchone, fruit_id, day=None):
+    return fetchone("SELECT Order_Count, Item_Quantity, Revenue FROM Sales_Daily WHERE Sale_Day = %s AND Fruit_Id = %s",
+                    (day or datetime.date.today(), fruit_id))
+
+
+def pending(fetchone, fruit_id):
+    return fetchone("SELECT COUNT(*) FROM Sales_Changes WHERE Fruit_Id = %s", (fruit_id,))[0]
+
+
+def test_orders_are_logged_and_rolled_up(cursor, fetchone, make_fruit, make_client, place_orders):
+    fruit_id, _ = make_fruit()
+    place_orders(make_client(), [(fruit_id, 2, 20), (fruit_id, 1, 10)])
+    place_orders(make_client(), [(fruit_id, 4, 40)])
+    # Журнал пишется по строке на оператор и (день, фрукт), итоги не меняются до свёртки
+    assert pending(fetchone, fruit_id) == 2
+    assert daily(fetchone, fruit_id) is None
+
+    fetchone(queries.APPLY_SALES_CHANGES)
+    assert pending(fetchone, fruit_id) == 0
+    assert daily(fetchone, fruit_id) == (3, 7, 70)
+
+
+def test_deleted_orders_are_subtracted_and_empty_days_removed(cursor, fetchone, make_fruit, make_client,
+                                                              place_orders):
+    fruit_id, _ = make_fruit()
+    client_id = make_client()
+    first = place_orders(client_id, [(fruit_id, 2, 20)])
+    place_orders(client_id, [(fruit_id, 1, 10)])
+    fetchone(queries.APPLY_SALES_CHANGES)
+
+    cursor.execute("DELETE FROM Orders WHERE Id = ANY(%s)", (first,))
+    fetchone(queries.APPLY_SALES_CHANGES)
+    assert daily(fetchone, fruit_id) == (1, 1, 10)
+
+    cursor.execute("DELETE FROM Orders WHERE Fruit_Id = %s", (fruit_id,))
+    fetchone(queries.APPLY_SALES_CHANGES)
+    assert daily(fetchone, fruit_id) is None
+
+
+def test_rebuild_restores_totals(cursor, fetchone, make_fruit, make_client, place_orders):
+    fruit_id, _ = make_fruit()
+    place_orders(make_client(), [(fruit_id, 3, 30)])
+    fetchone(queries.REBUILD_SALES_DAILY, (True,))
+    assert fetchone(queries.REBUILD_SALES_DAILY, (False,)) == (0,)
+
+    # Не свёрнутый журнал учитывается при сравнении
+    place_orders(make_client(), [(fruit_id, 1, 10)])
+    assert fetchone(queries.REBUILD_SALES_DAILY, (False,)) == (0,)
+
+    fetchone(queries.APPLY_SALES_CHANGES)
+    cursor.execute("UPDATE Sales_Daily SET Revenue = 0 WHERE Sale_Day = CURRENT_DATE AND Fruit_Id = %s", (fruit_id,))
+    assert fetchone(queries.REBUILD_SALES_DAILY, (False,)) == (1,)
+    assert fetchone(queries.REBUILD_SALES_DAILY, (True,)) == (1,)
+    assert daily(fetchone, fruit_id) == (2, 4, 40)